@@ -0,0 +1,227 @@
+"""
+Times the stages of the assessment pipeline on synthetic snowmelt records of
+different lengths, and on a batch of stations, and tracks the peak memory of every
+stage with tracemalloc. Everything runs offline on generated RDB and CSV files.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py
+
+The results are compared with benchmarks/baseline.json and the script exits with 1
+when a stage is slower or uses more memory than the baseline allows. Stages over the
+limits are measured again (--confirm rounds) before they are reported. After an
+intended change, record a new baseline on the same machine with --save-baseline.
+New stages are added to the baseline without re-recording the others with
+--add-new-stages.
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from synthetic_gage import generate_stations, synthetic_daily_flow, write_rdb, write_upload_csv
+from utils.common_utils.upload_utils import read_upload_columns, upload_bytes, _read_columns
+from utils.common_utils.results_store import export_station_results, read_results
+from utils.common_utils.utils import load_flow_data, manual_upload_daily_flow_data, water_year_flows, subset_by_season
+from utils.peak_flow.peakFlow_utils import subset_flow_above_threshold, yearly_flow_analysis, annual_peak_summary
+from utils.rate_change.rateChange_utils import rate_change_main
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# a stage regresses when it is slower than tolerance x baseline and also slower by
+# more than the absolute slack, so that timer noise on fast stages is ignored
+TIME_SLACK_SECONDS = 0.005
+MEMORY_SLACK_MB = 1.0
+
+
+def pipeline_stages(rdb_path, csv_path):
+    """
+    Returns the benchmarked stages of one record. Every stage is a pair of a setup
+    function, whose result is not timed, and the timed function that takes it.
+    """
+    df = load_flow_data(rdb_path)
+    upload = read_upload_columns(csv_path, 'Date', 'Flow')
+    # the memoized functions are timed without their cache
+    manual_upload = manual_upload_daily_flow_data.__wrapped__
+    rate_change = rate_change_main.__wrapped__
+    read_columns = _read_columns.__wrapped__
+    # the rate of change output is the full daily series, stored next to the CSV upload
+    results_path = os.path.join(os.path.dirname(csv_path), os.path.splitext(os.path.basename(csv_path))[0] + "_results")
+    daily = rate_change(None, None, upload.copy(), 'Date', 'Flow', 'uploaded')
+    export_station_results('00000000', {'daily': daily}, results_path)
+
+    def fresh_upload():
+        # rate_change_main parses the upload through the memoized function
+        manual_upload_daily_flow_data.cache_clear()
+        return upload.copy()
+
+    return {
+        'load_flow_data': (lambda: rdb_path, load_flow_data),
+        'read_upload': (lambda: upload_bytes(csv_path), lambda raw: read_columns(raw, 'Date', 'Flow')),
+        'manual_upload': (lambda: upload.copy(), lambda data: manual_upload(data, 'Date', 'Flow')),
+        'water_year_flows': (lambda: df.copy(), water_year_flows),
+        'subset_by_season': (lambda: df.copy(), subset_by_season),
+        'yearly_flow_analysis': (lambda: df.copy(), lambda frame: yearly_flow_analysis(subset_flow_above_threshold(frame, 200))),
+        'annual_peak_summary': (lambda: df.copy(), annual_peak_summary),
+        'rate_change_main': (fresh_upload, lambda data: rate_change(None, None, data, 'Date', 'Flow', 'uploaded')),
+        'export_results': (lambda: daily.copy(), lambda frame: export_station_results('00000001', {'daily': frame}, results_path)),
+        # frames loaded from USGS files carry their own agency_cd and site_no columns
+        'export_rdb_results': (lambda: df.copy(), lambda frame: export_station_results('00000002', {'daily': frame}, results_path)),
+        'read_results': (lambda: results_path, lambda path: read_results('daily', path, site_nos=['00000000'])),
+    }
+
+
+def measure(setup, func, repeat):
+    """
+    Returns the best time of repeat runs in seconds and the peak traced memory of one
+    more run in MB. Memory is traced in its own run because tracing slows the code down.
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(args)
+        times.append(time.perf_counter() - start)
+    args = setup()
+    tracemalloc.start()
+    func(args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 1024 ** 2
+
+
+def run_benchmarks(record_years, n_stations, station_years, repeat, data_dir, keys=None):
+    """
+    Runs every stage for every record length and the batch load of many stations.
+
+    Args:
+        keys (set, optional): Only run the stages with these result keys.
+
+    Returns:
+        dict: The 'seconds' and 'peak_mb' of every '<years>y/<stage>' key.
+    """
+    results = {}
+    for years in record_years:
+        if keys is not None and not any(key.startswith(f"{years}y/") for key in keys):
+            continue
+        record = synthetic_daily_flow(years, seed=years)
+        rdb_path = os.path.join(data_dir, f"record_{years}y.rdb")
+        csv_path = os.path.join(data_dir, f"record_{years}y.csv")
+        write_rdb(record, rdb_path, "09000000")
+        write_upload_csv(record, csv_path)
+        for stage, (setup, func) in pipeline_stages(rdb_path, csv_path).items():
+            if keys is not None and f"{years}y/{stage}" not in keys:
+                continue
+            seconds, peak_mb = measure(setup, func, repeat)
+            results[f"{years}y/{stage}"] = {'seconds': seconds, 'peak_mb': peak_mb}
+            print(f"{years:>4}y  {stage:<22} {seconds * 1000:10.1f} ms {peak_mb:10.2f} MB")
+
+    if n_stations and (keys is None or f"{n_stations}x{station_years}y/batch_load" in keys):
+        paths = generate_stations(n_stations, station_years, os.path.join(data_dir, "stations"))
+        seconds, peak_mb = measure(lambda: list(paths.values()), lambda files: [load_flow_data(path) for path in files], repeat)
+        results[f"{n_stations}x{station_years}y/batch_load"] = {'seconds': seconds, 'peak_mb': peak_mb}
+        print(f"{n_stations}x{station_years}y  {'batch_load':<22} {seconds * 1000:10.1f} ms {peak_mb:10.2f} MB")
+    return results
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """
+    Compares the results with a baseline.
+
+    Returns:
+        dict: The messages of every stage that regressed, by result key.
+    """
+    regressions = {}
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['seconds'] > base['seconds'] * time_tolerance and result['seconds'] - base['seconds'] > TIME_SLACK_SECONDS:
+            regressions.setdefault(key, []).append(f"{key}: {result['seconds'] * 1000:.1f} ms, baseline {base['seconds'] * 1000:.1f} ms")
+        if result['peak_mb'] > base['peak_mb'] * memory_tolerance and result['peak_mb'] - base['peak_mb'] > MEMORY_SLACK_MB:
+            regressions.setdefault(key, []).append(f"{key}: {result['peak_mb']:.2f} MB, baseline {base['peak_mb']:.2f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the assessment pipeline on synthetic gage records.")
+    parser.add_argument("--years", type=int, nargs="+", default=[10, 50, 150], help="Record lengths in years (default: 10 50 150).")
+    parser.add_argument("--stations", type=int, default=20, help="Stations in the batch load stage, 0 to skip (default: 20).")
+    parser.add_argument("--station-years", type=int, default=30, help="Record length of the batch stations (default: 30).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage, the best is kept (default: 3).")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results file (default: benchmarks/baseline.json).")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline.")
+    parser.add_argument("--add-new-stages", action="store_true", help="Add the stages missing from the baseline and keep the recorded ones.")
+    parser.add_argument("--time-tolerance", type=float, default=1.5, help="Allowed slowdown factor (default: 1.5).")
+    parser.add_argument("--memory-tolerance", type=float, default=1.25, help="Allowed peak memory factor (default: 1.25).")
+    parser.add_argument("--confirm", type=int, default=3, help="Rounds in which regressed stages are measured again before they are reported (default: 3).")
+    parser.add_argument("--data-dir", default=None, help="Keep the generated files in this directory.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir or temp_dir
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        return run_and_compare(args, data_dir)
+
+
+def run_and_compare(args, data_dir):
+    """
+    Runs the benchmarks and saves them as the baseline or compares them with it.
+
+    Returns:
+        int: The exit status, 1 when a stage regressed.
+    """
+    results = run_benchmarks(args.years, args.stations, args.station_years, args.repeat, data_dir)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                                'pandas': pd.__version__, 'machine': platform.machine()},
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if args.add_new_stages:
+        added = [key for key in results if key not in baseline['results']]
+        baseline['results'].update({key: results[key] for key in added})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"Added {len(added)} new stages to the baseline: {', '.join(added) or 'none'}")
+    regressions = compare(results, baseline['results'], args.time_tolerance, args.memory_tolerance)
+    # a slow moment of the machine (disk writes of the export stages in particular) is
+    # not a regression, so a stage is only reported when it stays over the limits
+    for _ in range(args.confirm):
+        if not regressions:
+            break
+        print(f"Measuring {len(regressions)} regressed stages again")
+        again = run_benchmarks(args.years, args.stations, args.station_years, args.repeat, data_dir, keys=set(regressions))
+        for key, result in again.items():
+            results[key] = {name: min(results[key][name], value) for name, value in result.items()}
+        regressions = compare(results, baseline['results'], args.time_tolerance, args.memory_tolerance)
+    for messages in regressions.values():
+        for regression in messages:
+            print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+"""
+Compares the per-year loop that yearly_flow_analysis and yearly_threshold_analysis
+used before with the single groupby of yearly_threshold_stats, on the days above
+and below thresholds of a synthetic record. The script fails when the two disagree.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_threshold_stats.py
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from synthetic_gage import synthetic_daily_flow
+from utils.common_utils.threshold_stats import yearly_threshold_stats
+
+
+def yearly_threshold_loop(thresh_df, count_column):
+    years = thresh_df['year'].unique()
+    thresh_analysis = {}
+    i = 0
+    for year in years:
+        yearly_data = thresh_df[thresh_df['year'] == year]
+        if not yearly_data.empty:
+            thresh_analysis[str(year)] = {
+                count_column: len(yearly_data),
+                'years_after_previous': year - years[i-1] if i > 0 else 0,
+                'average_flow': yearly_data['avg_flow'].mean(),
+                'max_flow': yearly_data['avg_flow'].max(),
+                'min_flow': yearly_data['avg_flow'].min()
+            }
+            i += 1
+    return pd.DataFrame.from_dict(thresh_analysis, orient='index')
+
+
+def main():
+    df = synthetic_daily_flow(75)
+    df['year'] = df['date'].dt.year
+    subsets = {
+        'total_days_above_threshold': df[df['avg_flow'] > 200],
+        'total_days_below_threshold': df[df['avg_flow'] < 15],
+    }
+
+    repeat = 3
+    for count_column, thresh_df in subsets.items():
+        loop = yearly_threshold_loop(thresh_df, count_column)
+        stats = yearly_threshold_stats(thresh_df, count_column)
+        assert list(stats.index) == list(loop.index), f"{count_column}: the years differ"
+        assert list(stats.columns) == list(loop.columns), f"{count_column}: the columns differ"
+        for column in stats.columns:
+            assert np.allclose(stats[column].to_numpy(dtype=float), loop[column].to_numpy(dtype=float)), \
+                f"{count_column}: '{column}' differs from the loop"
+
+        loop_time = min(timeit.repeat(lambda: yearly_threshold_loop(thresh_df, count_column), number=1, repeat=repeat))
+        stats_time = min(timeit.repeat(lambda: yearly_threshold_stats(thresh_df, count_column), number=1, repeat=repeat))
+        print(f"{count_column}: {len(thresh_df)} days in {len(stats)} years, same counts and flows as the loop")
+        print(f"  per-year loop:   {loop_time * 1000:8.1f} ms")
+        print(f"  groupby:         {stats_time * 1000:8.1f} ms")
+        print(f"  speedup:         {loop_time / stats_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
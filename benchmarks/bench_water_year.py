@@ -0,0 +1,41 @@
+"""
+Compares the row-wise water year calculation that water_year_flows used before with
+the vectorized water_year_calendar.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_water_year.py
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from utils.common_utils.water_year import water_year_calendar
+
+
+def water_year_apply(df):
+    water_year = df['date'].apply(lambda x: x.year + 1 if x.month >= 10 else x.year)
+    day_of_water_year = df['date'].apply(lambda x: (x - pd.Timestamp(year=x.year if x.month >= 10 else x.year - 1, month=10, day=1)).days + 1)
+    return water_year, day_of_water_year
+
+
+def main():
+    # about the length of the 1929-2025 record of gage 06721000
+    df = pd.DataFrame({'date': pd.date_range('1929-04-29', '2025-08-12', freq='D')})
+    water_year, day_of_water_year = water_year_apply(df)
+    calendar = water_year_calendar(df['date'])
+    assert np.array_equal(water_year.to_numpy(), calendar['water_year'].to_numpy())
+    assert np.array_equal(day_of_water_year.to_numpy(), calendar['day_of_waterYear'].to_numpy())
+
+    repeat = 3
+    apply_time = min(timeit.repeat(lambda: water_year_apply(df), number=1, repeat=repeat))
+    vector_time = min(timeit.repeat(lambda: water_year_calendar(df['date']), number=1, repeat=repeat))
+    print(f"rows: {len(df)}")
+    print(f"row-wise apply:  {apply_time * 1000:8.1f} ms")
+    print(f"vectorized:      {vector_time * 1000:8.1f} ms")
+    print(f"speedup:         {apply_time / vector_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Synthetic daily flow records for the benchmarks: snowmelt-dominated hydrographs with
+a spring/summer melt pulse, a seasonal base flow, late-summer storm spikes, winter ice
+days and USGS-style rounding. Records are written as USGS daily-values RDB files or as
+CSV uploads, so the benchmarks run without the network.
+
+Generate files from the repository root, for example 25 stations of 40 years:
+
+    PYTHONPATH=src python benchmarks/synthetic_gage.py --stations 25 --years 40 --out data/synthetic
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_daily_flow(years, end_year=2024, seed=0, base_flow=15.0, peak_flow=600.0):
+    """
+    Generates a snowmelt hydrograph of daily mean flows.
+
+    Args:
+        years (int): The length of the record in calendar years.
+        end_year (int): The last calendar year of the record.
+        seed (int): The random seed, one per station.
+        base_flow (float): The typical winter base flow in cfs.
+        peak_flow (float): The typical snowmelt peak in cfs.
+
+    Returns:
+        pd.DataFrame: 'date', 'avg_flow' (NaN on ice days) and 'qc' columns.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(f"{end_year - years + 1}-01-01", f"{end_year}-12-31", freq='D')
+    n = len(dates)
+    year_index = dates.year.to_numpy() - (end_year - years + 1)
+    day = dates.dayofyear.to_numpy().astype(float)
+
+    # one melt pulse per year with its own timing, size and shape; the recession after
+    # the peak is slower than the rise
+    peak_day = rng.normal(158, 12, years)[year_index]
+    magnitude = (peak_flow * rng.lognormal(0, 0.35, years))[year_index]
+    rise = rng.normal(20, 4, years).clip(8)[year_index]
+    offset = day - peak_day
+    width = np.where(offset < 0, rise, rise * 1.8)
+    melt = magnitude * np.exp(-0.5 * (offset / width) ** 2)
+
+    base = base_flow * (1 + 0.3 * np.cos(2 * np.pi * (day - 60) / 365.25))
+
+    # July-October thunderstorms with an exponential recession of a few days
+    month = dates.month.to_numpy()
+    storms = np.where((month >= 7) & (month <= 10) & (rng.random(n) < 0.03), rng.exponential(0.4 * peak_flow, n), 0.0)
+    storms = np.convolve(storms, np.exp(-np.arange(30) / 2.5))[:n]
+
+    flow = (base + melt + storms) * rng.lognormal(0, 0.04, n)
+    # USGS reports three significant figures
+    scale = 10.0 ** (np.floor(np.log10(flow)) - 2)
+    flow = np.round(flow / scale) * scale
+
+    qc = np.full(n, 'A', dtype=object)
+    qc[-120:] = 'P'
+    ice = np.isin(month, (12, 1, 2)) & (rng.random(n) < 0.03)
+    flow[ice] = np.nan
+    return pd.DataFrame({'date': dates, 'avg_flow': flow, 'qc': qc})
+
+
+def write_rdb(df, path, site_no):
+    """
+    Writes a record in the layout of a USGS daily-values RDB download.
+
+    Args:
+        df (pd.DataFrame): The record from synthetic_daily_flow.
+        path (str): The file to write.
+        site_no (str): The site ID written in the site_no column.
+    """
+    value_column = '00001_00060_00003'
+    header = [
+        '# ---------------------------------- WARNING ----------------------------------------',
+        '# Synthetic daily values generated for benchmarking, not USGS data.',
+        f'#  USGS {site_no} SYNTHETIC SNOWMELT CREEK',
+        '#',
+        f'agency_cd\tsite_no\tdatetime\t{value_column}\t{value_column}_cd',
+        '5s\t15s\t20d\t14n\t10s',
+    ]
+    body = pd.DataFrame({
+        'agency_cd': 'USGS',
+        'site_no': site_no,
+        'datetime': df['date'].dt.strftime('%Y-%m-%d'),
+        'value': df['avg_flow'].map('{:g}'.format).where(df['avg_flow'].notna(), 'Ice'),
+        'qc': df['qc'],
+    })
+    with open(path, 'w') as f:
+        f.write('\n'.join(header) + '\n')
+        body.to_csv(f, sep='\t', header=False, index=False, lineterminator='\n')
+
+
+def write_upload_csv(df, path):
+    """
+    Writes a record as a manual upload CSV with 'Date' (MM/DD/YYYY) and 'Flow' columns.
+
+    Args:
+        df (pd.DataFrame): The record from synthetic_daily_flow.
+        path (str): The file to write.
+    """
+    pd.DataFrame({'Date': df['date'].dt.strftime('%m/%d/%Y'), 'Flow': df['avg_flow']}).to_csv(path, index=False)
+
+
+def generate_stations(n_stations, years, out_dir, fmt='rdb', seed=0):
+    """
+    Writes the records of many synthetic stations, each with its own seed and flow scale.
+
+    Args:
+        n_stations (int): The number of stations.
+        years (int): The record length of every station in years.
+        out_dir (str): The directory the files are written to.
+        fmt (str): 'rdb' or 'csv'.
+        seed (int): The seed of the first station.
+
+    Returns:
+        dict: The file path of every site ID.
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    scales = np.random.default_rng(seed).lognormal(0, 0.8, n_stations)
+    paths = {}
+    for i in range(n_stations):
+        site_no = f"{9000001 + i:08d}"
+        df = synthetic_daily_flow(years, seed=seed + i, base_flow=15.0 * scales[i], peak_flow=600.0 * scales[i])
+        path = os.path.join(out_dir, f"{site_no}.{fmt}")
+        if fmt == 'rdb':
+            write_rdb(df, path, site_no)
+        else:
+            write_upload_csv(df, path)
+        paths[site_no] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic snowmelt gage records.")
+    parser.add_argument("--stations", type=int, default=1, help="Number of stations (default: 1).")
+    parser.add_argument("--years", type=int, default=50, help="Record length in years (default: 50).")
+    parser.add_argument("--format", choices=("rdb", "csv"), default="rdb", help="File format (default: rdb).")
+    parser.add_argument("--out", default=os.path.join("data", "synthetic"), help="Output directory (default: data/synthetic).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first station (default: 0).")
+    args = parser.parse_args()
+    paths = generate_stations(args.stations, args.years, args.out, args.format, args.seed)
+    print(f"Wrote {len(paths)} {args.years}-year records to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
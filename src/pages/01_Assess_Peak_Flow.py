@@ -1,14 +1,20 @@
 import streamlit as st
 from PIL import Image
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import altair as alt
+import re
 from datetime import datetime
 
 
-from utils.peak_flow.peakFlow_utils import peakFlow_main as pfm, generate_summary_df
-from utils.common_utils.utils import subset_by_season, plot_seasonal_data, manual_upload_daily_flow_data,plot_waterYear_data, return_waterYr_dict, clean_manual_date_column
+from utils.peak_flow.peakFlow_utils import peakFlow_main as pfm, generate_summary_df, water_year_envelope
+from utils.peak_flow.floodFrequency_utils import flood_frequency, complete_year_peaks, peak_plotting_positions, FREQUENCY_DISTRIBUTIONS, DISTRIBUTION_NAMES, MIN_RECOMMENDED_PEAKS
+from utils.common_utils.utils import subset_by_season, plot_seasonal_data, manual_upload_daily_flow_data,plot_waterYear_data, clean_manual_date_column
+from utils.common_utils.map_utils import show_gage_location
+from utils.common_utils.upload_utils import read_upload_header, read_upload_columns, UPLOAD_TYPES, PREVIEW_ROWS
+from utils.common_utils.chart_utils import line_chart, show_flow_duration
+from utils.common_utils.instrumentation import mark_stage
+from utils.common_utils.perf_panel import performance_recorder, show_performance_panel
 
 
 df = None
@@ -50,11 +56,15 @@ if st.sidebar.checkbox("**Download data from USGS website**", value=False, key="
     upload_type = "downloaded"
 
 elif st.sidebar.checkbox("**Manually upload peak flow data**", value=False, key="upload_data"):
-    uploaded_file = st.sidebar.file_uploader("Upload Peak Flow Data csv file", type=["csv"])
+    uploaded_file = st.sidebar.file_uploader("Upload Peak Flow Data csv file", type=UPLOAD_TYPES, help="A csv file, or a gzip or zip compressed csv file.")
     pf_threshold = 0
     end_year = datetime.now().year
     upload_type = "uploaded"
 
+highlight_text = st.sidebar.text_input("**Highlight Water Years**", value="", help="Comma separated water years drawn over the water year flow envelope, e.g. 2011, 2021. The latest water year is highlighted when empty.")
+highlight_years = [int(year) for year in re.findall(r"\d{4}", highlight_text)]
+
+recorder = performance_recorder()
 st.sidebar.markdown("### Note:")
 st.sidebar.markdown("The application will use the mean daily flow data (either downloaded from the USGS website or uploaded by the user) and analyze it based on the specified parameters.")
 st.markdown("""
@@ -77,6 +87,8 @@ st.markdown("""
 # Initialize the persistent state variable
 if "sidebar_btn_clicked" not in st.session_state:
     st.session_state.sidebar_btn_clicked = False
+if "submitted_upload" not in st.session_state:
+    st.session_state.submitted_upload = None
 
 # Function to update state when button is clicked
 def click_sidebar_button():
@@ -92,23 +104,33 @@ st.sidebar.button(
 
 
 
+mark_stage("page setup")
 if st.session_state.sidebar_btn_clicked: 
     
     if upload_type == "uploaded" and uploaded_file is not None:
-        data = pd.read_csv(uploaded_file,  on_bad_lines='skip', header = 0)
+        #only the first rows are read to choose the columns from
+        header = read_upload_header(uploaded_file)
+        with st.expander("Preview of the uploaded file", expanded=True):
+            st.dataframe(header.head(PREVIEW_ROWS), hide_index=True)
         
         col1, col2 = st.columns(2)
         with col1:
             date_column = st.info("Please select the column that contains the date information.")
-            date_col = st.selectbox("Select Date Column", options=data.columns, placeholder=None)  
+            date_col = st.selectbox("Select Date Column", options=header.columns, placeholder=None)  
         with col2:
             flow_column = st.info("Please select the column that contains the average flow information.")
-            flow_col = st.selectbox("Select Average Flow Column", options=data.columns, placeholder=None)
+            flow_col = st.selectbox("Select Average Flow Column", options=header.columns, placeholder=None)
+        #the full parse runs once the columns are submitted and stays cached for later reruns
         if st.button("Submit Columns"):
+            st.session_state.submitted_upload = (uploaded_file.name, date_col, flow_col)
+        if st.session_state.submitted_upload == (uploaded_file.name, date_col, flow_col):
+            data = read_upload_columns(uploaded_file, date_col, flow_col)
             df, above_thresh_df, yearly_analysis,usgs_station_id,annual_peaks,months_dict,water_year_df= pfm(date_col, flow_col, usgs_station_id="Manually Uploaded Data", begin_year=begin_year,end_year = end_year, pf_threshold=pf_threshold,upload_type=upload_type,uploaded_file=uploaded_file,data=data)
             begin_year = df['date'].dt.year.min()
     elif upload_type == "downloaded":
         df, above_thresh_df, yearly_analysis,_,annual_peaks,months_dict,water_year_df = pfm(date_col, flow_col,usgs_station_id=usgs_station_id, begin_year=begin_year, pf_threshold=pf_threshold,upload_type=upload_type, data=None)
+        show_gage_location(usgs_station_id)
+    mark_stage("load and analyze")
     if df is not None:
         st.divider()
         st.write("### Average Daily Flow Data")
@@ -121,8 +143,9 @@ if st.session_state.sidebar_btn_clicked:
         st.divider()
         st.write(f"### Gage ID {usgs_station_id} contains data up until {last_year}")
         st.subheader(f"Plotted average daily flow values for gage {usgs_station_id}")
-        st.line_chart(df.set_index('date')['avg_flow'], use_container_width=True, height=800, x_label="Year", y_label="Average Daily Flow (cfs)")
+        line_chart(df.set_index('date')['avg_flow'], use_container_width=True, height=800, x_label="Year", y_label="Average Daily Flow (cfs)")
         st.divider()
+        mark_stage("render daily flow chart", rows=len(df))
         #set the year column to a datetime object
         
 
@@ -166,8 +189,38 @@ if st.session_state.sidebar_btn_clicked:
         histogram = histogram + hist_labels
         st.altair_chart(histogram, use_container_width=True)
         st.divider()
+        mark_stage("render annual peak charts", rows=len(annual_peaks))
+
+        #flood frequency of the annual peaks of the complete years
+        st.subheader("Annual Peak Flood Frequency")
+        frequency_peaks = complete_year_peaks(df, annual_peaks)['avg_flow']
+        if len(frequency_peaks) < 3:
+            st.write(f"At least 3 complete years of record are needed for a flood frequency analysis, the record has {len(frequency_peaks)}.")
+        else:
+            if len(frequency_peaks) < MIN_RECOMMENDED_PEAKS:
+                st.warning(f"Only {len(frequency_peaks)} complete years of record, the return period flows are very uncertain.")
+            frequency = pd.concat([flood_frequency(frequency_peaks, distribution).assign(distribution=DISTRIBUTION_NAMES[distribution])
+                                   for distribution in FREQUENCY_DISTRIBUTIONS])
+            observed = peak_plotting_positions(frequency_peaks)
+            return_axis = alt.X('return_period:Q', title="Return Period (years)", scale=alt.Scale(type='log'))
+            bands = alt.Chart(frequency).mark_area(opacity=0.2).encode(
+                x=return_axis, y='lower:Q', y2='upper:Q', color=alt.Color('distribution:N', title="Distribution"))
+            fits = alt.Chart(frequency).mark_line(point=True).encode(
+                x=return_axis, y=alt.Y('flow:Q', title="Annual Peak Average Daily Flow (cfs)"), color='distribution:N',
+                tooltip=['distribution', 'return_period', alt.Tooltip('flow:Q', format='.0f'), alt.Tooltip('lower:Q', format='.0f'), alt.Tooltip('upper:Q', format='.0f')])
+            peaks_points = alt.Chart(observed).mark_point(color='black').encode(
+                x=return_axis, y='avg_flow:Q', tooltip=[alt.Tooltip('return_period:Q', format='.1f'), 'avg_flow'])
+            st.altair_chart((bands + fits + peaks_points).properties(height=450), use_container_width=True)
+            st.caption(f"Fitted to the annual maximum average daily flows of {len(frequency_peaks)} complete years (station skew only), "
+                       "with 90% bootstrap confidence limits. Black points are the observed annual peaks at their Weibull return periods. "
+                       "Daily means understate instantaneous peak flows.")
+            with st.expander("Flood Frequency Table"):
+                table = frequency.pivot(index='return_period', columns='distribution', values=['flow', 'lower', 'upper'])
+                st.dataframe(table.round(0))
+        st.divider()
+        mark_stage("render flood frequency", rows=len(frequency_peaks))
        
-        #plot the water year flows using individual lines for each water year
+        #plot the range of the water year flows with the highlighted water years on top
         st.subheader(f"Water Year Average Daily Flow Data")
         
 
@@ -175,27 +228,26 @@ if st.session_state.sidebar_btn_clicked:
         water_year_df = water_year_df.sort_values(by=['day_of_waterYear', 'date'])
         with st.expander("View Water Year Average Daily Flow Data"):
             st.write(water_year_df)
-        water_year_dict = return_waterYr_dict()
-        #group the water year data by water year
-        plt.figure(figsize=(12, 6))
-        for year in water_year_df['water_year'].unique():
-            if year < int(begin_year):
-                pass
-            else:
-                year_df = water_year_df[water_year_df['water_year'] == year]
-                plt.plot(year_df['day_month'], year_df['avg_flow'], label=year)
-                #set plot ticks to be the month on the x axis
-        plt.xticks(ticks=[f"{i:02d}-01" for i in range(1, 13)], labels=[f"{water_year_dict[i]}" for i in range(1, 13)])
-        plt.xticks(rotation=90)
-        plt.xlabel("Month-Day")
-        plt.ylabel("Average Daily Flow (cfs)")
-        plt.title(f"Water Year Average Daily Flow Data for Gage {usgs_station_id}")
-        plt.legend(title="Water Year", bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.tight_layout()
-        st.pyplot(plt)
-        #fig = plot_waterYear_data(water_year_df, usgs_station_id)
-            
-        #st.pyplot(fig)
+        #summarize every day of the water year across the water years instead of drawing one line per year
+        if not highlight_years:
+            highlight_years = [int(water_year_df['water_year'].max())]
+        envelope, highlighted = water_year_envelope(water_year_df, first_water_year=begin_year, highlight_years=highlight_years)
+        x_axis = alt.X('plot_date:T', title="Day of Water Year", axis=alt.Axis(format='%b'))
+        range_band = alt.Chart(envelope).mark_area(opacity=0.2, color='steelblue').encode(
+            x=x_axis, y=alt.Y('min:Q', title="Average Daily Flow (cfs)"), y2='max:Q',
+            tooltip=[alt.Tooltip('plot_date:T', title='Day', format='%b %d'), 'years', 'min', 'p10', 'p25', 'p50', 'p75', 'p90', 'max'])
+        outer_band = alt.Chart(envelope).mark_area(opacity=0.3, color='steelblue').encode(x=x_axis, y='p10:Q', y2='p90:Q')
+        inner_band = alt.Chart(envelope).mark_area(opacity=0.5, color='steelblue').encode(x=x_axis, y='p25:Q', y2='p75:Q')
+        median_line = alt.Chart(envelope).mark_line(color='black').encode(x=x_axis, y='p50:Q')
+        year_lines = alt.Chart(highlighted).mark_line(strokeWidth=1.5).encode(
+            x=x_axis, y='avg_flow:Q', color=alt.Color('water_year:N', title="Water Year"),
+            tooltip=['water_year', alt.Tooltip('plot_date:T', title='Day', format='%b %d'), 'avg_flow'])
+        envelope_chart = (range_band + outer_band + inner_band + median_line + year_lines).properties(
+            height=500, title=f"Water Year Average Daily Flow Data for Gage {usgs_station_id}")
+        st.altair_chart(envelope_chart, use_container_width=True)
+        st.caption(f"Shaded bands show the min-max, 10th-90th and 25th-75th percentile range of each day across {envelope['years'].max()} water years, "
+                   "the black line the median. Highlighted water years are drawn on top.")
+        mark_stage("render water year plot", rows=len(water_year_df))
 
         #get the average daily flow in december for each year and plot as a histogram
         
@@ -206,6 +258,9 @@ if st.session_state.sidebar_btn_clicked:
 
         december_flows = np.round(df[df['month'] == 12]['avg_flow'].mean(),0)
         st.write(f"### The average daily flow in December across all years is {december_flows} cfs")
+        st.divider()
+        show_flow_duration(df)
+        mark_stage("render flow duration", rows=len(df))
         #set the x axis to be the year in the december flows
         
 
@@ -247,4 +302,6 @@ if st.session_state.sidebar_btn_clicked:
         
     #else:
     #    st.header("No dates found with flow above the specified threshold.")
-    
\ No newline at end of file
+
+mark_stage("page end")
+show_performance_panel(recorder)
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from PIL import Image
 import altair as alt
 from datetime import datetime
@@ -7,6 +8,12 @@ from datetime import datetime
 st.set_page_config(layout='wide')
 from utils.base_flow.baseFlow_utils import baseFlow_main as bfm,generate_summary_df
 from utils.common_utils.utils import subset_by_season, plot_seasonal_data, water_year_flows, return_waterYr_dict
+from utils.common_utils.map_utils import show_gage_location
+from utils.common_utils.upload_utils import read_upload_header, read_upload_columns, UPLOAD_TYPES, PREVIEW_ROWS
+from utils.common_utils.chart_utils import line_chart, show_flow_duration
+from utils.common_utils.instrumentation import mark_stage
+from utils.common_utils.perf_panel import performance_recorder, show_performance_panel
+from utils.common_utils.threshold_stats import threshold_sweep
 
 df = None
 upload_type = None
@@ -49,7 +56,7 @@ if st.sidebar.checkbox("**Download data from USGS website**", value=False, key="
     #pf_threshold = st.sidebar.number_input("Mean Daily Flow Threshold (cfs)", min_value=0, value=500)
 
 elif st.sidebar.checkbox("**Manually upload peak flow data**", value=False, key="upload_data"):
-    uploaded_file = st.sidebar.file_uploader("Upload Peak Flow Data csv file", type=["csv"])
+    uploaded_file = st.sidebar.file_uploader("Upload Peak Flow Data csv file", type=UPLOAD_TYPES, help="A csv file, or a gzip or zip compressed csv file.")
     
    
     min_threshold = st.sidebar.number_input("Minimum Flow Threshold (cfs)", min_value=0, value=10)
@@ -57,6 +64,7 @@ elif st.sidebar.checkbox("**Manually upload peak flow data**", value=False, key=
     end_year = datetime.now().year
     upload_type = "uploaded"
 
+recorder = performance_recorder()
 st.sidebar.markdown("### Note:")
 st.sidebar.markdown("The application will download mean daily flow data from the USGS website and analyze it based on the specified parameters.")
 st.markdown("""
@@ -76,6 +84,8 @@ st.markdown("""
 
 if "sidebar_btn_clicked" not in st.session_state:
     st.session_state.sidebar_btn_clicked = False
+if "submitted_upload" not in st.session_state:
+    st.session_state.submitted_upload = None
 
 # Function to update state when button is clicked
 def click_sidebar_button():
@@ -86,32 +96,42 @@ st.sidebar.button(
     "Analyze Base Flow Data",
     on_click=click_sidebar_button
 )
+mark_stage("page setup")
 if st.session_state.sidebar_btn_clicked: 
     
     if upload_type == "uploaded" and uploaded_file is not None:
-        data = pd.read_csv(uploaded_file,  on_bad_lines='skip', header = 0)
+        #only the first rows are read to choose the columns from
+        header = read_upload_header(uploaded_file)
+        with st.expander("Preview of the uploaded file", expanded=True):
+            st.dataframe(header.head(PREVIEW_ROWS), hide_index=True)
         
         col1, col2 = st.columns(2)
         with col1:
             date_column = st.info("Please select the column that contains the date information.")
-            date_col = st.selectbox("Select Date Column", options=data.columns, placeholder=None)  
+            date_col = st.selectbox("Select Date Column", options=header.columns, placeholder=None)  
         with col2:
             flow_column = st.info("Please select the column that contains the average flow information.")
-            flow_col = st.selectbox("Select Average Flow Column", options=data.columns, placeholder=None)
+            flow_col = st.selectbox("Select Average Flow Column", options=header.columns, placeholder=None)
+        #the full parse runs once the columns are submitted and stays cached for later reruns
         if st.button("Submit Columns"):
+            st.session_state.submitted_upload = (uploaded_file.name, date_col, flow_col)
+        if st.session_state.submitted_upload == (uploaded_file.name, date_col, flow_col):
+            data = read_upload_columns(uploaded_file, date_col, flow_col)
             df, trout_analysis, min_analysis = bfm(usgs_station_id,begin_year,trout_threshold, min_threshold, data, date_col, flow_col, upload_type)
             begin_year = df['date'].dt.year.min()
     elif upload_type == "downloaded":
         st.write(f"Analyzing base flow data for USGS Station ID: {usgs_station_id}, analysis starting in {begin_year}")
         df, trout_analysis, min_analysis = bfm(usgs_station_id,begin_year,trout_threshold, min_threshold, data, date_col, flow_col, upload_type)
+        show_gage_location(usgs_station_id)
+    mark_stage("load and analyze")
         
     if df is not None:
         st.divider()
         st.write("### Average Daily Flow Data")
         with st.expander("Average Daily Flow Data - Raw Data"):
             st.write(df)
-        trout_analysis_df = pd.DataFrame.from_dict(trout_analysis, orient='index').reset_index()
-        min_analysis_df = pd.DataFrame.from_dict(min_analysis, orient='index').reset_index()
+        trout_analysis_df = trout_analysis.reset_index()
+        min_analysis_df = min_analysis.reset_index()
         if trout_analysis_df.empty:
             st.header(f"No flow events exist below the stable flow threshold of {trout_threshold} cfs, skipping analysis.")
         
@@ -130,8 +150,9 @@ if st.session_state.sidebar_btn_clicked:
             st.write(f"### Gage ID {usgs_station_id} contains data up until {last_year}")
             st.subheader(f"Average daily flow data for gage {usgs_station_id}")
 
-            st.line_chart(df.set_index('date')['avg_flow'], use_container_width=True, height = 1200, x_label='Date', y_label='Average Daily Flow (cfs)')
+            line_chart(df.set_index('date')['avg_flow'], use_container_width=True, height = 1200, x_label='Date', y_label='Average Daily Flow (cfs)')
             st.divider()
+            mark_stage("render daily flow chart", rows=len(df))
             
             #generate a boxplot showing average monthly flow data for all years with labels above the bar showing the month
             st.subheader("Average Monthly Flow Data")
@@ -257,6 +278,10 @@ if st.session_state.sidebar_btn_clicked:
             
             st.subheader(f"The average minimum flow during winter months across all years is {average_min_winter_flow:.0f} cfs - shown as the blue line on the chart above.")
             st.divider()
+            mark_stage("render monthly and winter charts")
+            show_flow_duration(df, threshold=min_threshold)
+            st.divider()
+            mark_stage("render flow duration", rows=len(df))
             if min_analysis_df.empty:
                 st.header(f"No flow events exist below the minimum flow threshold of {min_threshold} cfs, skipping analysis.")
             else:
@@ -265,29 +290,31 @@ if st.session_state.sidebar_btn_clicked:
                 st.title(f"Threshold Analysis of Gage Data - Minimum Flow Threshold ({min_threshold} cfs)")
                 #drop na values from df
                 try:
-                    spring_df = df[df['season'] == 'Spring']
-                    summer_df = df[df['season'] == 'Summer']
-                    fall_df = df[df['season'] == 'Fall']
-                    winter_df = df[df['season'] == 'Winter']
-                    #calculate percent of days in winter_df where flow is below trout_threshold
-                    #number of days in winter below the min_threshold 
-                    winter_below_num_days = winter_df[winter_df['avg_flow'] < min_threshold].shape[0]
-                    winter_below_threshold = (winter_df[winter_df['avg_flow'] < min_threshold].shape[0] / winter_df.shape[0]) * 100
-                    spring_below_threshold = (spring_df[spring_df['avg_flow'] < min_threshold].shape[0] / spring_df.shape[0]) * 100
-                    summer_below_threshold = (summer_df[summer_df['avg_flow'] < min_threshold].shape[0] / summer_df.shape[0]) * 100
-                    fall_below_threshold = (fall_df[fall_df['avg_flow'] < min_threshold].shape[0] / fall_df.shape[0]) * 100
+                    #percent of the days with usable flow in each season that are below the min_threshold
+                    #(days without usable flow are left out of both counts), None for a season without usable flow
+                    season_valid_days = {}
+                    season_below_num_days = {}
+                    season_below_threshold = {}
+                    for season in ['Winter', 'Spring', 'Summer', 'Fall']:
+                        season_df = df[df['season'] == season]
+                        season_valid_days[season] = int(season_df['valid'].sum())
+                        season_below_num_days[season] = int((season_df['valid'] & (season_df['avg_flow'] < min_threshold)).sum())
+                        season_below_threshold[season] = (season_below_num_days[season] / season_valid_days[season]) * 100 if season_valid_days[season] else None
+                    winter_alert = season_below_threshold['Winter'] is not None and season_below_threshold['Winter'] > 10
                 
                     #st.markdown(f'<h2 style="color:black;">Seasonal Analysis of Flow Below Minimum Threshold ({min_threshold} cfs)</h2>', unsafe_allow_html=True)
                     st.write(f"##### Percentage of Days Below {min_threshold} cfs by Season:")
-                    if winter_below_threshold > 10:
-                        st.markdown(f'<h3 style="color:red;">Winter: {winter_below_threshold:.2f}%</h3>', unsafe_allow_html=True)
-                        st.write("The total number of days in winter below the minimum threshold is " + str(winter_below_num_days) + ". There are " + str(len(winter_df)) + " total days in winter over the period of analysis.")
+                    if winter_alert:
+                        st.markdown(f'<h3 style="color:red;">Winter: {season_below_threshold["Winter"]:.2f}%</h3>', unsafe_allow_html=True)
+                        st.write("The total number of days in winter below the minimum threshold is " + str(season_below_num_days['Winter']) + ". There are " + str(season_valid_days['Winter']) + " total days with flow data in winter over the period of analysis.")
                         st.write("The number of days in winter where flow is below the minimum threshold is greater than 10%. This may indicate that the stream is not suitable for aquatic life during winter months.")
-                    else:
-                        st.write(f"Winter: {winter_below_threshold:.2f}%")
-                    st.write(f"Spring: {spring_below_threshold:.2f}%")
-                    st.write(f"Summer: {summer_below_threshold:.2f}%")
-                    st.write(f"Fall: {fall_below_threshold:.2f}%")
+                    for season in ['Winter', 'Spring', 'Summer', 'Fall']:
+                        if season == 'Winter' and winter_alert:
+                            continue
+                        if season_below_threshold[season] is None:
+                            st.write(f"{season}: no days with flow data")
+                        else:
+                            st.write(f"{season}: {season_below_threshold[season]:.2f}%")
                     st.divider()
                     st.header("Yearly Summary Data")
                     st.write(f"##### Summary of Average Daily Flow Data Below {min_threshold} cfs by Year:")
@@ -301,6 +328,12 @@ if st.session_state.sidebar_btn_clicked:
                     st.markdown(f'<h3 style="color:#ffaa00;">Bar Chart of Total Days per Year Below {min_threshold} cfs</h3>', unsafe_allow_html=True)
                     with st.expander(f"Flow Below Minimum Threshold ({min_threshold} cfs) Yearly Summary - Figure"):
                         st.bar_chart(summary_df[f"Total Days Below {min_threshold} cfs"], use_container_width=True, color="#ffaa00")
+                    #average days per year below a range of thresholds, computed in one pass
+                    with st.expander("Sensitivity of Days Below Threshold to the Threshold Value - Figure"):
+                        thresholds = np.unique(np.append(np.linspace(0, max(df['avg_flow'].median(), min_threshold * 2), 50), min_threshold))
+                        sweep_df = threshold_sweep(df, thresholds, direction='below')
+                        sensitivity = sweep_df.groupby('threshold')['total_days_below_threshold'].mean()
+                        st.line_chart(sensitivity, x_label="Threshold (cfs)", y_label="Average Days per Year Below Threshold", use_container_width=True)
                 except Exception as e:
                     st.write("Error subsetting data by season:", e, ". Try using a begin analysis date within the date range of the gage data.")
             
@@ -357,13 +390,5 @@ if st.session_state.sidebar_btn_clicked:
             #with st.expander(f"Flow Below Stable Threshold ({trout_threshold} cfs) Yearly Summary - Figure"):
             #    st.bar_chart(summary_df[f"Total Days Below {trout_threshold} cfs"], use_container_width=True)
 
-            
-    
-        
-
-            
-
-        
-    
-    
-        
\ No newline at end of file
+mark_stage("page end")
+show_performance_panel(recorder)
@@ -4,7 +4,12 @@ from PIL import Image
 from datetime import datetime
 
 st.set_page_config(layout='wide')
-from utils.rate_change.rateChange_utils import rate_change_main
+from utils.rate_change.rateChange_utils import rate_change_main, rate_change_events, OUTLIER_WINDOW_DAYS
+from utils.common_utils.map_utils import show_gage_location
+from utils.common_utils.upload_utils import read_upload_header, read_upload_columns, UPLOAD_TYPES, PREVIEW_ROWS
+from utils.common_utils.chart_utils import line_chart
+from utils.common_utils.instrumentation import mark_stage, stage
+from utils.common_utils.perf_panel import performance_recorder, show_performance_panel
 
 
 flow_derivative_df = None
@@ -17,6 +22,14 @@ uploaded_file = None
 date_col = None
 flow_col = None
 data = None
+outlier_method = "global"
+window_days = OUTLIER_WINDOW_DAYS
+
+OUTLIER_METHOD_DESCRIPTIONS = {
+    "global": "as those that are more than 3 standard deviations from the median day-to-day rate of change across the period of record for the gage.",
+    "rolling": "as those that are more than 3 robust standard deviations (scaled median absolute deviation) from the median rate of change of the surrounding days.",
+    "seasonal": "as those that are more than 3 robust standard deviations (scaled median absolute deviation) from the median rate of change of the same days of the year across all years.",
+}
 
 
 image = Image.open('./src/Images/roc.png')
@@ -46,10 +59,17 @@ if st.sidebar.checkbox("**Download data from USGS website**", value=False, key="
     upload_type = "downloaded"
 
 elif st.sidebar.checkbox("**Manually upload peak flow data**", value=False, key="upload_data"):
-    uploaded_file = st.sidebar.file_uploader("Upload Peak Flow Data csv file", type=["csv"])
+    uploaded_file = st.sidebar.file_uploader("Upload Peak Flow Data csv file", type=UPLOAD_TYPES, help="A csv file, or a gzip or zip compressed csv file.")
     number_outliers = st.sidebar.number_input("Number of Outliers to Display", min_value=1, value=3)
     upload_type = "uploaded"
+
+if upload_type is not None:
+    outlier_method = st.sidebar.selectbox("Outlier Detection Method", options=["Global", "Rolling", "Seasonal"],
+                                          help="Global compares each day with the whole record. Rolling and Seasonal use the median and median absolute deviation of the surrounding days or of the same days in other years.").lower()
+    if outlier_method != "global":
+        window_days = st.sidebar.number_input("Outlier Window (days)", min_value=3, value=OUTLIER_WINDOW_DAYS, step=2)
     
+recorder = performance_recorder()
 st.sidebar.markdown("### Note:")
 st.sidebar.markdown("The application will download mean daily flow data from the USGS website and analyze it based on the specified parameters.")
 st.markdown("""
@@ -70,6 +90,8 @@ st.markdown("""
 # Initialize the persistent state variable
 if "sidebar_btn_clicked" not in st.session_state:
     st.session_state.sidebar_btn_clicked = False
+if "submitted_upload" not in st.session_state:
+    st.session_state.submitted_upload = None
 
 # Function to update state when button is clicked
 def click_sidebar_button():
@@ -85,27 +107,37 @@ st.sidebar.button(
 
 #st.write(f"Analyzing peak flow data for USGS Station ID: {usgs_station_id}, starting in {begin_year}, Mean Daily Flow Threshold: {pf_threshold} cfs")st.sidebar.button("Analyze Peak Flow Data"):
 
+mark_stage("page setup")
 if st.session_state.sidebar_btn_clicked: 
     
     if upload_type == "uploaded" and uploaded_file is not None:
-        data = pd.read_csv(uploaded_file,  on_bad_lines='skip', header = 0)
+        #only the first rows are read to choose the columns from
+        header = read_upload_header(uploaded_file)
+        with st.expander("Preview of the uploaded file", expanded=True):
+            st.dataframe(header.head(PREVIEW_ROWS), hide_index=True)
         
 
         col1, col2 = st.columns(2)
         with col1:
             date_column = st.info("Please select the column that contains the date information.")
-            date_col = st.selectbox("Select Date Column", options=data.columns, placeholder=None) 
+            date_col = st.selectbox("Select Date Column", options=header.columns, placeholder=None) 
 
         with col2:
             flow_column = st.info("Please select the column that contains the average flow information.")
-            flow_col = st.selectbox("Select Average Flow Column", options=data.columns, placeholder=None)
+            flow_col = st.selectbox("Select Average Flow Column", options=header.columns, placeholder=None)
 
+        #the full parse runs once the columns are submitted and stays cached for later reruns
         if st.button("Submit Columns"):
-            flow_derivative_df = rate_change_main(usgs_station_id, begin_year,data,date_col, flow_col, upload_type)            
+            st.session_state.submitted_upload = (uploaded_file.name, date_col, flow_col)
+        if st.session_state.submitted_upload == (uploaded_file.name, date_col, flow_col):
+            data = read_upload_columns(uploaded_file, date_col, flow_col)
+            flow_derivative_df = rate_change_main(usgs_station_id, begin_year,data,date_col, flow_col, upload_type, outlier_method, window_days)
             begin_year = flow_derivative_df['date'].dt.year.min()
 
     elif upload_type == "downloaded":
-        flow_derivative_df = rate_change_main(usgs_station_id, begin_year,data,date_col, flow_col, upload_type)
+        flow_derivative_df = rate_change_main(usgs_station_id, begin_year,data,date_col, flow_col, upload_type, outlier_method, window_days)
+        show_gage_location(usgs_station_id)
+    mark_stage("load and analyze")
 
     if flow_derivative_df is not None:
         st.write(f"Analyzing base flow data for USGS Station ID: {usgs_station_id}, analysis starting in {begin_year}")
@@ -128,15 +160,17 @@ if st.session_state.sidebar_btn_clicked:
         with st.expander("View Average Daily Flow Data with Rate of Change and Outliers Identified"):
             st.write(flow_derivative_df)
         st.header(f"Average daily flow data for gage {usgs_station_id}")
-        st.line_chart(flow_derivative_df.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
+        line_chart(flow_derivative_df.set_index('date')['avg_flow'], keep=flow_derivative_df['is_outlier'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
         st.divider()
         st.header("Flow Rate of Change")
         st.subheader("Flow rate of change represents the day-to-day change in average flow across the period of gage record. Rate of change outliers are identified " \
-        "as those that are more than 3 standard deviations from the median day-to-day rate of change across the period of record for the gage. Outliers are only identified between August 1 and October 31")
-        st.line_chart(flow_derivative_df.set_index('date')['flow_derivative'],x_label="Date", y_label="Flow Derivative", use_container_width=True)
+        f"{OUTLIER_METHOD_DESCRIPTIONS[outlier_method]} Outliers are only identified between August 1 and October 31")
+        line_chart(flow_derivative_df.set_index('date')['flow_derivative'], keep=flow_derivative_df['is_outlier'],x_label="Date", y_label="Flow Derivative", use_container_width=True)
+        mark_stage("render flow and rate of change charts", rows=len(flow_derivative_df))
         #extract the date associated with the outliers
-        flow_derivative_df = flow_derivative_df[(flow_derivative_df['date'].dt.month >= 8) & (flow_derivative_df['date'].dt.month <= 10)]
-        outliers = flow_derivative_df[flow_derivative_df['is_outlier']]
+        with stage("rate_change_events"):
+            events = rate_change_events(flow_derivative_df, number_outliers)
+        outliers = events.frame[events.frame['is_outlier']]
         if not outliers.empty:
             st.divider()
             st.header("Outliers Identified in Flow Rate of Change")
@@ -144,57 +178,46 @@ if st.session_state.sidebar_btn_clicked:
                 st.write(outliers[['date', 'avg_flow']])
             
             #identify the top n number of outliers
-            top_outliers = outliers.nlargest(number_outliers, 'flow_derivative')
+            top_outliers = events.events
             st.write(f"### Top {number_outliers} Outliers Identified in Flow Rate of Change")
             with st.expander(f"View Top {number_outliers} Outliers Identified in Flow Rate of Change"):
                 st.write(top_outliers[['date', 'avg_flow', 'flow_derivative']])
-            #find the index in df of the top outliers and plot 5 days before and after the outlier
+            #plot the 15 days before and after each of the top outliers
             st.divider()
             st.header("Rate of Change Outlier Analysis")
             st.write("The following plots show the average daily flow data for the 15 days before and after each outlier identified in flow rate of change.")
-            for index, row in top_outliers.iterrows():
-                date_current = row['date']
+            for i, event in enumerate(top_outliers.itertuples()):
+                date_current = event.date
                 st.write(f"### Outlier Identified on {date_current}")
-                #get the 5 days before and after the outlier
-                start_date = date_current - pd.Timedelta(days=15)
-                end_date = date_current + pd.Timedelta(days=15)
-                outlier_data = flow_derivative_df[(flow_derivative_df['date'] >= start_date) & (flow_derivative_df['date'] <= end_date)]
+                outlier_data = events.window(i)
                 with st.expander(f"{date_current} +/- 15 Days: Average Daily Flow Data"):
-                    st.line_chart(outlier_data.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
-                    st.line_chart(outlier_data.set_index('date')['flow_derivative'],x_label="Date", y_label="Daily Rate of Change", use_container_width=True)
-                    #day = date.datetime.day
+                    line_chart(outlier_data.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
+                    line_chart(outlier_data.set_index('date')['flow_derivative'],x_label="Date", y_label="Daily Rate of Change", use_container_width=True)
                     st.write(f"### Insights for Outlier on {date_current}")
                     
-                    before_outlier = flow_derivative_df[(flow_derivative_df['datetime'] >= start_date) & (flow_derivative_df['datetime'] < date_current)]
-                    after_outlier = flow_derivative_df[(flow_derivative_df['datetime'] > date_current) & (flow_derivative_df['datetime'] <= end_date)]
-                    avg_before = before_outlier['flow_derivative'].mean()
-                    avg_after = after_outlier['flow_derivative'].mean()
+                    before_outlier = events.before(i)
+                    after_outlier = events.after(i)
+                    avg_before = event.avg_rate_before
+                    avg_after = event.avg_rate_after
                     st.write(f"- Average Rate of Change 15 Days Before Outlier: {avg_before:.2f}")
                     st.write(f"- Average Rate of Change 15 Days After Outlier: {avg_after:.2f}")
-                    try:
-                        if avg_after > avg_before:
-                            st.write("- Observation: The average flow rate of change increased after the outlier event, indicating a potential shift in flow dynamics.")
-                        else:
-                            st.write("- Observation: The average flow rate of change decreased after the outlier event, suggesting a return to previous flow patterns.")
-                    except:
+                    if pd.isna(avg_before) or pd.isna(avg_after):
                         st.write("- Not enough data available to calculate 15 Days before and after the outlier.")
+                    elif avg_after > avg_before:
+                        st.write("- Observation: The average flow rate of change increased after the outlier event, indicating a potential shift in flow dynamics.")
+                    else:
+                        st.write("- Observation: The average flow rate of change decreased after the outlier event, suggesting a return to previous flow patterns.")
                     #plot the before_outlier and after_outlier data
                     st.subheader("Rate of Change Analysis Before and After Outlier")
                     
                     st.write("#### Average Daily Flow Data 15 Days Before Outlier")
-                    st.line_chart(before_outlier.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
-                    #st.write("#### Flow Derivatives 15 Days Before Outlier")
-                    #st.line_chart(before_outlier.set_index('date')['flow_derivative'],x_label="Date", y_label="Daily Rate of Change", use_container_width=True)
+                    line_chart(before_outlier.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
                     st.write("#### Average Daily Flow Data 15 Days After Outlier")
-                    st.line_chart(after_outlier.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
-                    #st.write("#### Flow Derivatives 15 Days After Outlier")
-                    #st.line_chart(after_outlier.set_index('date')['flow_derivative'],x_label="Date", y_label="Daily Rate of Change", use_container_width=True)
-
-            
-                
-            
+                    line_chart(after_outlier.set_index('date')['avg_flow'],x_label="Date", y_label="Average Daily Flow (cfs)", use_container_width=True)
 
         
         else:
             st.write("No outliers detected in flow derivatives.")
-   
\ No newline at end of file
+
+mark_stage("page end")
+show_performance_panel(recorder)
@@ -0,0 +1,114 @@
+import streamlit as st
+from PIL import Image
+import altair as alt
+
+st.set_page_config(layout='wide')
+from utils.basin.basin_utils import load_basin_flows, parse_site_ids, BasinFlows, BASIN_YEARLY_METRICS
+from utils.common_utils.instrumentation import mark_stage, stage
+from utils.common_utils.perf_panel import performance_recorder, show_performance_panel
+
+
+basin = None
+site_ids = []
+begin_year = None
+
+
+image = Image.open('./src/Images/baseflow.png')
+st.image(image, use_container_width=True)
+logo = Image.open('./src/Images/logo.png')
+st.sidebar.image(logo)
+st.sidebar.divider()
+st.divider()
+st.title("Basin Flow Data Analysis")
+st.subheader("This application allows the user to compare the peak flow, base flow and rate of change assessments of several gages in a watershed. Flow data for every gage is downloaded from the USGS website.")
+
+st.markdown("##### The application requires the following inputs:")
+st.markdown("- **USGS Station IDs**: One station ID per line, or separated by commas.")
+st.markdown("- **Begin Analysis On (year)**: The year from which to start the analysis. The application will download data from the USGS website starting from this year.")
+st.markdown("- **Peak, Stable and Minimum Flow Thresholds**: The thresholds used to count the days above or below them for every gage.")
+st.divider()
+
+st.sidebar.title("Input Parameters")
+site_ids = parse_site_ids(st.sidebar.text_area("USGS Station IDs", value="06752260\n06752280"))
+begin_year = st.sidebar.text_input("Begin Analysis On (year)", value="2015")
+pf_threshold = st.sidebar.number_input("Peak Flow Threshold (cfs)", min_value=0, value=200)
+trout_threshold = st.sidebar.number_input("Stable Flow Threshold (cfs)", min_value=0, value=35)
+min_threshold = st.sidebar.number_input("Minimum Flow Threshold (cfs)", min_value=0, value=10)
+
+recorder = performance_recorder()
+st.sidebar.markdown("### Note:")
+st.sidebar.markdown("The application will download mean daily flow data for every gage from the USGS website and analyze all gages together on a shared date axis.")
+st.markdown("""
+    <style>
+    div.stButton > button {
+        background-color: grey;
+        color: white;
+        border-radius: 10px;
+        border: black;
+    }
+    div.stButton > button:hover {
+        background-color: dark grey;
+        color: black;
+    }
+    </style>
+""", unsafe_allow_html=True)
+
+# Initialize the persistent state variable
+if "sidebar_btn_clicked" not in st.session_state:
+    st.session_state.sidebar_btn_clicked = False
+
+# Function to update state when button is clicked
+def click_sidebar_button():
+    st.session_state.sidebar_btn_clicked = True
+
+# Sidebar button with callback
+st.sidebar.button(
+    "Analyze Basin Flow Data",
+    on_click=click_sidebar_button
+)
+
+# Main app logic
+
+mark_stage("page setup")
+if st.session_state.sidebar_btn_clicked:
+    if not site_ids:
+        st.error("Please enter at least one USGS Station ID.")
+    else:
+        st.write(f"Analyzing {len(site_ids)} gages, analysis starting in {begin_year}")
+        dates, sites, matrix, errors = load_basin_flows(tuple(site_ids), begin_year)
+        for site_id, error in errors.items():
+            st.error(f"Gage {site_id} could not be loaded: {error}")
+        if sites:
+            basin = BasinFlows(dates, sites, matrix)
+    mark_stage("load")
+
+    if basin is not None:
+        st.divider()
+        st.write("### Gage Comparison")
+        st.write(f"{len(basin.sites)} gages aligned on {len(basin.dates)} days from {basin.dates[0]} to {basin.dates[-1]}. "
+                 "Days without a usable flow (gaps and ice affected days) are left out of every statistic. "
+                 "Rate of change outliers are daily changes more than 3 standard deviations from the median change of the gage's record, counted between August 1 and October 31.")
+        with stage("basin comparison", rows=basin.matrix.size):
+            comparison = basin.comparison(pf_threshold, trout_threshold, min_threshold)
+        st.dataframe(comparison, hide_index=True)
+        mark_stage("comparison")
+
+        st.divider()
+        st.write("### Gage Comparison by Water Year")
+        metric = st.selectbox("Metric", options=list(BASIN_YEARLY_METRICS), format_func=BASIN_YEARLY_METRICS.get)
+        with stage("basin yearly", rows=basin.matrix.size):
+            yearly = basin.yearly(metric, pf_threshold, min_threshold)
+        heatmap = alt.Chart(yearly).mark_rect().encode(
+            x=alt.X('water_year:O', title='Water Year'),
+            y=alt.Y('site_no:N', title='USGS Station ID', sort=basin.sites),
+            color=alt.Color('value:Q', title=BASIN_YEARLY_METRICS[metric], scale=alt.Scale(scheme='blues')),
+            tooltip=[alt.Tooltip('site_no:N', title='Gage'), alt.Tooltip('water_year:O', title='Water Year'),
+                     alt.Tooltip('value:Q', title=BASIN_YEARLY_METRICS[metric], format='.1f')],
+        ).properties(height=max(200, 40 * len(basin.sites)))
+        st.altair_chart(heatmap, use_container_width=True)
+        with st.expander("Gage Comparison by Water Year - Raw Data"):
+            st.write(yearly.pivot(index='water_year', columns='site_no', values='value').reindex(columns=basin.sites))
+        mark_stage("heatmap")
+
+mark_stage("page end")
+show_performance_panel(recorder)
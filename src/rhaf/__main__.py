@@ -0,0 +1,69 @@
+"""
+Headless command line entry point for running the RHAF assessments in batch.
+
+Run from the repository root with src on the path, for example:
+
+    PYTHONPATH=src python -m rhaf run --sites sites.txt --out results
+
+This path never imports Streamlit.
+"""
+import argparse
+import logging
+import sys
+
+from utils.batch.batch_utils import read_site_list, run_batch
+from utils.common_utils.site_index import SITE_INDEX_PATH, load_site_rdb
+from utils.common_utils.results_store import RESULTS_FORMATS
+from utils.rate_change.rateChange_utils import OUTLIER_METHODS, OUTLIER_WINDOW_DAYS
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="rhaf", description="River Health Assessment Framework flow assessments.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the peak flow, base flow and rate of change assessments for a list of stations.")
+    run_parser.add_argument("--sites", required=True, help="Text file with one USGS site ID per line.")
+    run_parser.add_argument("--out", default="results", help="Directory the summary tables are written to (default: results).")
+    run_parser.add_argument("--begin-year", default="2015", help="Year to start the analysis from (default: 2015).")
+    run_parser.add_argument("--pf-threshold", type=float, default=200, help="Peak flow threshold in cfs (default: 200).")
+    run_parser.add_argument("--trout-threshold", type=float, default=35, help="Stable flow threshold in cfs (default: 35).")
+    run_parser.add_argument("--min-threshold", type=float, default=10, help="Minimum flow threshold in cfs (default: 10).")
+    run_parser.add_argument("--workers", type=int, default=None, help="Number of assessment processes (default: CPU count).")
+    run_parser.add_argument("--download-workers", type=int, default=8, help="Number of concurrent downloads (default: 8).")
+    run_parser.add_argument("--outlier-method", choices=OUTLIER_METHODS, default="global", help="Rate of change outlier method (default: global).")
+    run_parser.add_argument("--outlier-window", type=int, default=OUTLIER_WINDOW_DAYS, help=f"Days in the rolling or seasonal outlier window (default: {OUTLIER_WINDOW_DAYS}).")
+    run_parser.add_argument("--export", default=None, help="Directory of a results dataset, partitioned by site and water year, the daily series and tables are also written to.")
+    run_parser.add_argument("--export-format", choices=RESULTS_FORMATS, default="arrow", help="Results dataset format, memory-mapped Arrow IPC or compressed Parquet (default: arrow).")
+
+    sites_parser = subparsers.add_parser("load-sites", help="Load USGS site service RDB files into the local site index.")
+    sites_parser.add_argument("files", nargs="+", help="Site service RDB files (expanded site output or series catalog).")
+    sites_parser.add_argument("--index", default=SITE_INDEX_PATH, help=f"Site index database (default: {SITE_INDEX_PATH}).")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "run":
+        site_ids = read_site_list(args.sites)
+        if not site_ids:
+            logging.error("No site IDs found in %s, nothing to assess", args.sites)
+            return 1
+        summary = run_batch(site_ids, args.out, begin_year=args.begin_year, pf_threshold=args.pf_threshold,
+                            trout_threshold=args.trout_threshold, min_threshold=args.min_threshold,
+                            workers=args.workers, download_workers=args.download_workers,
+                            outlier_method=args.outlier_method, outlier_window=args.outlier_window,
+                            export_path=args.export, export_format=args.export_format)
+        failed = (summary['status'] != 'ok').sum()
+        logging.info("Assessed %d stations, %d failed. Results written to %s", len(summary) - failed, failed, args.out)
+        return 1 if failed == len(summary) else 0
+    if args.command == "load-sites":
+        for path in args.files:
+            count = load_site_rdb(path, index_path=args.index)
+            logging.info("Loaded %d sites from %s into %s", count, path, args.index)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
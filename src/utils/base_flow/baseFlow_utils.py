@@ -1,7 +1,8 @@
-import pandas as pd
 
-from utils.common_utils.utils import load_flow_data,  clean_temp_files, create_location_plot, manual_upload_daily_flow_data
-from utils.common_utils.data_processing import download_usgs_data
+from utils.common_utils.utils import load_site_flow_data, manual_upload_daily_flow_data
+from utils.common_utils.threshold_stats import yearly_threshold_stats
+from utils.common_utils.memo import memoize
+from utils.common_utils.instrumentation import stage
 
 
 
@@ -17,44 +18,59 @@ def subset_flow_below_threshold(df, trout_threshold=35, min_threshold=10):
         pd.DataFrame: A DataFrame with dates when flow is above the threshold.
     """
     if df is not None:
-        below_trout_threshold_df = df[df['avg_flow'] < trout_threshold]
-        below_min_threshold_df = df[df['avg_flow'] < min_threshold]
+        #days without a usable flow are never below a threshold
+        valid = df['valid'] if 'valid' in df.columns else True
+        below_trout_threshold_df = df[(df['avg_flow'] < trout_threshold) & valid]
+        below_min_threshold_df = df[(df['avg_flow'] < min_threshold) & valid]
         return below_trout_threshold_df[['date','year','month','day', 'avg_flow']], below_min_threshold_df[['date','year','month','day', 'avg_flow']]
     else:
         return None
 def generate_summary_df(yearly_analysis, pf_threshold):
 
-    summary_dict = {}
-    for year, analysis in yearly_analysis.items():
-        summary_dict[year] = {}
-        summary_dict[year][f"Total Days Below {pf_threshold} cfs"] = analysis['total_days_below_threshold']
-        summary_dict[year]["Years After Previous"] = analysis['years_after_previous']
-        summary_dict[year][f"Average Flow Below {pf_threshold} cfs"] = analysis['average_flow']
-        summary_dict[year]["Max Flow Below Threshold"] = analysis['max_flow']
-        summary_dict[year][f"Min Flow {pf_threshold} cfs"] = analysis['min_flow']
-
-    summary_df = pd.DataFrame.from_dict(summary_dict, orient='index')
+    summary_df = yearly_analysis.rename(columns={
+        'total_days_below_threshold': f"Total Days Below {pf_threshold} cfs",
+        'years_after_previous': "Years After Previous",
+        'average_flow': f"Average Flow Below {pf_threshold} cfs",
+        'max_flow': "Max Flow Below Threshold",
+        'min_flow': f"Min Flow {pf_threshold} cfs",
+    })
     return summary_df
 
 def yearly_threshold_analysis(thresh_df):
+    """
+    Summarizes the days below a threshold by year.
+    
+    Args:
+        thresh_df (pd.DataFrame): The days with flow below the threshold.
+        
+    Returns:
+        pd.DataFrame: One row per year with the total days below the threshold, the years
+        after the previous year below the threshold and the average, max and min flow.
+    """
+    return yearly_threshold_stats(thresh_df, 'total_days_below_threshold')
 
-    years  = thresh_df['year'].unique()
-    thresh_analysis = {}
-    i = 0
-    for year in years:
-        yearly_data = thresh_df[thresh_df['year'] == year]
-        if not yearly_data.empty:
-            thresh_analysis[str(year)] = {
-                'total_days_below_threshold': len(yearly_data),
-                'years_after_previous': year - years[i-1] if i > 0 else 0,
-                'average_flow': yearly_data['avg_flow'].mean(),
-                'max_flow': yearly_data['avg_flow'].max(),
-                'min_flow': yearly_data['avg_flow'].min()
-            }
-            i += 1
-    return thresh_analysis
+
+def base_flow_analysis(df, trout_threshold=35, min_threshold=10):
+    """
+    Runs the base flow threshold analysis on loaded daily flow data.
+    
+    Args:
+        df (pd.DataFrame): The daily flow data.
+        trout_threshold (float): The stable flow threshold.
+        min_threshold (float): The minimum flow threshold.
+        
+    Returns:
+        tuple: The yearly analysis below the stable and below the minimum threshold.
+    """
+    below_trout_threshold_df,below_min_threshold_df = subset_flow_below_threshold(df, trout_threshold, min_threshold)
+    
+    trout_analysis = yearly_threshold_analysis(below_trout_threshold_df)
+    
+    min_analysis = yearly_threshold_analysis(below_min_threshold_df)
+    return trout_analysis, min_analysis
 
 
+@memoize()
 def baseFlow_main(usgs_station_id,begin_year,trout_threshold, min_threshold, data, date_col, flow_col, upload_type):
     """
     Main function to download and load base flow data.
@@ -62,28 +78,13 @@ def baseFlow_main(usgs_station_id,begin_year,trout_threshold, min_threshold, dat
     Args:
         url (str): The URL to download the peak flow data from.
     """
-    file_path, info_path = download_usgs_data(usgs_station_id, begin_year)
-    if file_path and upload_type == "downloaded":
-        create_location_plot(info_path, usgs_station_id)
-        df = load_flow_data(file_path)
-        
-        below_trout_threshold_df,below_min_threshold_df = subset_flow_below_threshold(df, trout_threshold, min_threshold)
-        
-        trout_analysis = yearly_threshold_analysis(below_trout_threshold_df)
-        
-        min_analysis = yearly_threshold_analysis(below_min_threshold_df)
-        clean_temp_files(file_path, info_path)
-
-        return df, trout_analysis, min_analysis
+    if upload_type == "downloaded":
+        df = load_site_flow_data(usgs_station_id, begin_year)
     elif upload_type == "uploaded":
         df = manual_upload_daily_flow_data(data, date_col, flow_col)
-        
-        below_trout_threshold_df,below_min_threshold_df = subset_flow_below_threshold(df, trout_threshold, min_threshold)
-        
-        trout_analysis = yearly_threshold_analysis(below_trout_threshold_df)
-        
-        min_analysis = yearly_threshold_analysis(below_min_threshold_df)
-        return df, trout_analysis, min_analysis
-        
     else:
-        return None
\ No newline at end of file
+        return None
+    
+    with stage("base_flow_analysis", rows=len(df)):
+        trout_analysis, min_analysis = base_flow_analysis(df, trout_threshold, min_threshold)
+    return df, trout_analysis, min_analysis
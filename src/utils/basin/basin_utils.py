@@ -0,0 +1,263 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.common_utils.batch_download import batch_download
+from utils.common_utils.gage_cache import get_daily_values
+from utils.common_utils.flow_series import season_codes, validity_mask, SEASONS
+from utils.common_utils.flow_matrix import flow_matrix
+from utils.common_utils.memo import memoize
+from utils.common_utils.instrumentation import stage
+from utils.common_utils.site_index import lookup_site
+from utils.common_utils.water_year import water_year_calendar
+from utils.rate_change.rateChange_utils import OUTLIER_MONTHS
+
+
+# metrics of the station x water year heatmap, with their labels
+BASIN_YEARLY_METRICS = {
+    'days_above_peak_threshold': "Days Above Peak Flow Threshold",
+    'days_below_min_threshold': "Days Below Minimum Flow Threshold",
+    'winter_min_flow': "Winter Minimum Flow (cfs)",
+    'mean_flow': "Mean Daily Flow (cfs)",
+    'rate_change_outliers': "Rate of Change Outliers (Aug-Oct)",
+}
+
+
+def parse_site_ids(text):
+    """
+    Reads USGS site IDs separated by commas, spaces or new lines. Leading zeros are
+    kept and duplicates dropped.
+
+    Args:
+        text (str): The site IDs.
+
+    Returns:
+        list: The site IDs in the order given.
+    """
+    return list(dict.fromkeys(site_id for site_id in text.replace(',', ' ').split() if site_id))
+
+
+def station_day_matrix(records):
+    """
+    Aligns the daily flows of many stations onto one shared date axis.
+
+    Args:
+        records (dict): The daily values of every station, DataFrames with 'date',
+            'avg_flow' and optionally 'qc' columns keyed by site ID.
+
+    Returns:
+        tuple: The dates of the day columns (datetime64[D] array), the site IDs of the
+        rows and the float64 station x day matrix, with NaN where a station has no
+        usable flow for a day.
+    """
+    sites = [site_id for site_id, df in records.items() if df is not None and len(df)]
+    if not sites:
+        return np.array([], dtype='datetime64[D]'), [], np.empty((0, 0))
+    days = {site_id: records[site_id]['date'].to_numpy(dtype='datetime64[D]') for site_id in sites}
+    start = min(site_days.min() for site_days in days.values())
+    end = max(site_days.max() for site_days in days.values())
+
+    site_keys, day_index, flows = [], [], []
+    for row, site_id in enumerate(sites):
+        df = records[site_id]
+        flow = df['avg_flow'].to_numpy(dtype='float64')
+        flow = np.where(validity_mask(flow, df['qc'] if 'qc' in df.columns else None), flow, np.nan)
+        site_keys.append(np.full(len(df), row))
+        day_index.append((days[site_id] - start).astype('int64'))
+        flows.append(flow)
+    _, matrix = flow_matrix(np.concatenate(site_keys), np.concatenate(day_index), np.concatenate(flows),
+                            n_days=int((end - start).astype('int64')) + 1)
+    dates = start + np.arange(matrix.shape[1]).astype('timedelta64[D]')
+    return dates, sites, matrix
+
+
+# a load with failed stations is not cached, so the failed downloads are retried on the
+# next run instead of being served from the cache until the entry expires
+@memoize(cacheable=lambda result: not result[3])
+def load_basin_flows(site_ids, begin_year, download_workers=8):
+    """
+    Loads the daily flows of many stations into a station x day matrix. The gage
+    cache of all stations is refreshed concurrently first, as in the batch runner.
+
+    Args:
+        site_ids (tuple): The USGS site IDs.
+        begin_year (str): The year to start the analysis from.
+        download_workers (int, optional): Number of concurrent downloads.
+
+    Returns:
+        tuple: The dates, the site IDs and the matrix (see station_day_matrix), and
+        a dict of error messages by site ID for the stations that could not be loaded.
+    """
+    begin_date = f"{begin_year}-01-01"
+    with stage("batch_download", rows=len(site_ids)):
+        _, errors = batch_download(site_ids, begin_date, max_workers=download_workers)
+    records = {}
+    with stage("gage cache") as cache_stage:
+        for site_id in site_ids:
+            if site_id in errors:
+                continue
+            try:
+                records[site_id] = get_daily_values(site_id, begin_date)
+            except Exception as e:
+                errors[site_id] = str(e)
+                continue
+            if records[site_id].empty:
+                errors[site_id] = f"No daily flow data found for gage {site_id} since {begin_year}."
+        cache_stage.rows = sum(len(df) for df in records.values())
+    for site_id, df in records.items():
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    with stage("station_day_matrix", rows=len(records)):
+        dates, sites, matrix = station_day_matrix(records)
+    return dates, sites, matrix, errors
+
+
+def _block_starts(keys):
+    # start of every run of equal keys along the sorted day axis
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+class BasinFlows:
+    """
+    The daily flows of the stations of a basin as one station x day matrix on a
+    shared date axis. Every assessment is computed for all stations at once along
+    the day axis, and yearly values are reduced over the contiguous day blocks of
+    each year, so a basin costs about as much as one long record.
+    """
+
+    def __init__(self, dates, sites, matrix):
+        """
+        Args:
+            dates (np.ndarray): The consecutive dates of the day columns.
+            sites (list): The site IDs of the rows.
+            matrix (np.ndarray): The station x day flows, NaN where a station has no usable flow.
+        """
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.sites = list(sites)
+        self.matrix = np.asarray(matrix, dtype='float64')
+
+        calendar = water_year_calendar(pd.Series(self.dates.astype('datetime64[ns]')))
+        self.water_years = calendar['water_year'].to_numpy(dtype='int64')
+        self.years = self.dates.astype('datetime64[Y]').astype('int64') + 1970
+        self.months = (self.dates.astype('datetime64[M]').astype('int64') % 12) + 1
+        self.winter = season_codes(self.months) == SEASONS.index('Winter')
+
+        # the dates are consecutive, so a difference along the day axis is a daily
+        # change, and NaN where either day has no usable flow
+        self.derivatives = np.diff(self.matrix, axis=1, prepend=np.nan)
+
+    def _yearly(self, reduce, values, keys):
+        starts = _block_starts(keys)
+        if values.shape[1] == 0:
+            return keys[:0], values[:, :0]
+        return keys[starts], reduce.reduceat(values, starts, axis=1)
+
+    def derivative_outliers(self, n_sigma=3):
+        """
+        Flags the rate of change outliers of every station with the 'global' method of
+        the rate of change page: a daily change more than n_sigma standard deviations
+        from the median change of the station's whole record.
+
+        Returns:
+            np.ndarray: The boolean station x day outlier matrix.
+        """
+        with warnings.catch_warnings():
+            # stations without any daily change have no statistics and no outliers
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            center = np.nanmedian(self.derivatives, axis=1, keepdims=True)
+            scale = np.nanstd(self.derivatives, axis=1, ddof=1, keepdims=True)
+        with np.errstate(invalid='ignore'):
+            return np.abs(self.derivatives - center) > n_sigma * scale
+
+    def comparison(self, pf_threshold=200, trout_threshold=35, min_threshold=10, n_sigma=3):
+        """
+        Compares the peak flow, base flow and rate of change assessments of all
+        stations, with the summary columns of the batch runner.
+
+        Args:
+            pf_threshold (float, optional): The peak flow threshold.
+            trout_threshold (float, optional): The stable flow threshold.
+            min_threshold (float, optional): The minimum flow threshold.
+            n_sigma (float, optional): The standard deviations that make a rate of change outlier.
+
+        Returns:
+            pd.DataFrame: One row per station.
+        """
+        flows = self.matrix
+        known = ~np.isnan(flows)
+        has_flow = known.any(axis=1)
+        first = np.where(has_flow, known.argmax(axis=1), 0)
+        last = np.where(has_flow, flows.shape[1] - 1 - known[:, ::-1].argmax(axis=1), 0)
+        with np.errstate(invalid='ignore'):
+            above = flows > pf_threshold
+            below_trout = flows < trout_threshold
+            below_min = flows < min_threshold
+
+        _, days_above_by_year = self._yearly(np.add, above.astype('int64'), self.years)
+        _, annual_peaks = self._yearly(np.fmax, flows, self.years)
+        winter_flows = np.where(self.winter, flows, np.nan)
+        _, winter_mins = self._yearly(np.fmin, winter_flows, self.water_years)
+        outliers = self.derivative_outliers(n_sigma) & np.isin(self.months, OUTLIER_MONTHS)
+        with np.errstate(invalid='ignore'):
+            outlier_derivatives = np.where(outliers, self.derivatives, -np.inf).max(axis=1, initial=-np.inf)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            comparison = pd.DataFrame({
+                'site_no': self.sites,
+                'station_nm': [(lookup_site(site_id) or {}).get('station_nm') for site_id in self.sites],
+                'first_date': np.where(has_flow, pd.to_datetime(self.dates[first]).strftime('%Y-%m-%d'), None),
+                'last_date': np.where(has_flow, pd.to_datetime(self.dates[last]).strftime('%Y-%m-%d'), None),
+                'days_of_record': known.sum(axis=1),
+                f'years_above_{pf_threshold}_cfs': (days_above_by_year > 0).sum(axis=1),
+                f'days_above_{pf_threshold}_cfs': above.sum(axis=1),
+                'mean_annual_peak_cfs': np.nanmean(annual_peaks, axis=1),
+                f'days_below_{trout_threshold}_cfs': below_trout.sum(axis=1),
+                f'days_below_{min_threshold}_cfs': below_min.sum(axis=1),
+                'mean_winter_flow_cfs': np.nanmean(winter_flows, axis=1),
+                'mean_winter_min_flow_cfs': np.nanmean(winter_mins, axis=1),
+                'rate_change_outliers': outliers.sum(axis=1),
+                'max_flow_derivative': np.where(np.isfinite(outlier_derivatives), outlier_derivatives, np.nan),
+            })
+        return comparison
+
+    def yearly(self, metric, pf_threshold=200, min_threshold=10, n_sigma=3):
+        """
+        Computes one metric for every station and water year, for the heatmap.
+
+        Args:
+            metric (str): One of BASIN_YEARLY_METRICS.
+            pf_threshold (float, optional): The peak flow threshold.
+            min_threshold (float, optional): The minimum flow threshold.
+            n_sigma (float, optional): The standard deviations that make a rate of change outlier.
+
+        Returns:
+            pd.DataFrame: 'site_no', 'water_year' and 'value' columns, without the water
+            years in which a station has no usable flow.
+        """
+        flows = self.matrix
+        known = ~np.isnan(flows)
+        with np.errstate(invalid='ignore'):
+            if metric == 'days_above_peak_threshold':
+                water_years, values = self._yearly(np.add, (flows > pf_threshold).astype('int64'), self.water_years)
+            elif metric == 'days_below_min_threshold':
+                water_years, values = self._yearly(np.add, (flows < min_threshold).astype('int64'), self.water_years)
+            elif metric == 'winter_min_flow':
+                water_years, values = self._yearly(np.fmin, np.where(self.winter, flows, np.nan), self.water_years)
+            elif metric == 'mean_flow':
+                water_years, totals = self._yearly(np.add, np.where(known, flows, 0.0), self.water_years)
+                _, counts = self._yearly(np.add, known.astype('int64'), self.water_years)
+                values = totals / counts
+            elif metric == 'rate_change_outliers':
+                outliers = self.derivative_outliers(n_sigma) & np.isin(self.months, OUTLIER_MONTHS)
+                water_years, values = self._yearly(np.add, outliers.astype('int64'), self.water_years)
+            else:
+                raise ValueError(f"Unknown metric '{metric}', expected one of {list(BASIN_YEARLY_METRICS)}")
+        _, days = self._yearly(np.add, known.astype('int64'), self.water_years)
+
+        yearly = pd.DataFrame({
+            'site_no': np.repeat(self.sites, len(water_years)),
+            'water_year': np.tile(water_years, len(self.sites)),
+            'value': values.astype('float64').ravel(),
+        })
+        return yearly[days.ravel() > 0].reset_index(drop=True)
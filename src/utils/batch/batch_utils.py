@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.common_utils.batch_download import batch_download
+from utils.common_utils.utils import load_site_flow_data
+from utils.peak_flow.peakFlow_utils import peak_flow_analysis, generate_summary_df as peak_summary_df
+from utils.peak_flow.floodFrequency_utils import complete_year_peaks, flood_frequency, FREQUENCY_DISTRIBUTIONS, MIN_RECOMMENDED_PEAKS
+from utils.base_flow.baseFlow_utils import base_flow_analysis, generate_summary_df as base_summary_df
+from utils.rate_change.rateChange_utils import rate_change_analysis, rate_change_events, OUTLIER_WINDOW_DAYS
+from utils.common_utils.results_store import export_station_results
+from utils.common_utils.station_state import StationState
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_site_list(sites_path):
+    """
+    Reads USGS site IDs from a text file with one ID per line. Blank lines and lines
+    starting with '#' are ignored, and leading zeros are kept.
+
+    Args:
+        sites_path (str): The path to the site list file.
+
+    Returns:
+        list: The site IDs in file order, without duplicates.
+    """
+    with open(sites_path, 'r') as f:
+        site_ids = [line.split('#')[0].strip() for line in f]
+    return list(dict.fromkeys(site_id for site_id in site_ids if site_id))
+
+
+def _record_digest(df, through):
+    # fingerprint of the usable flows of the days up to 'through', which changes when
+    # USGS revises a day that was already folded into a station state
+    days = df[df['date'] <= pd.Timestamp(through)]
+    flows = np.where(days['valid'].to_numpy(dtype=bool), days['avg_flow'].to_numpy(dtype='float64'), np.nan)
+    digest = hashlib.sha1(days['date'].to_numpy(dtype='datetime64[ns]').tobytes())
+    digest.update(flows.tobytes())
+    return digest.hexdigest()
+
+
+def refresh_station_state(df, state_path, site_id, settings):
+    """
+    Brings the saved state of a station up to date with its daily values and saves it.
+    Only the days newer than the state are appended. The state is rebuilt from the
+    whole record when it was kept for other settings, or when a day it already holds
+    was revised since (such as a provisional value re-downloaded by the gage cache).
+
+    Args:
+        df (pd.DataFrame): The daily flow data of the station.
+        state_path (str): The path of the station state file.
+        site_id (str): The USGS site ID.
+        settings (dict): The begin year, thresholds and outlier method and window of the run.
+
+    Returns:
+        pd.Timestamp: The last day of the previous run with the same settings, or None
+        when there was no such run.
+    """
+    state = StationState.load(state_path) if os.path.exists(state_path) else None
+    previous_last_date = None
+    if state is not None and state.metadata.get('settings') == settings and state.last_date is not None:
+        previous_last_date = pd.Timestamp(state.last_date)
+        if state.metadata.get('record_digest') != _record_digest(df, previous_last_date):
+            state = None
+    else:
+        state = None
+    if state is None:
+        state = StationState(site_id, above_thresholds=(settings['pf_threshold'],),
+                             below_thresholds=(settings['trout_threshold'], settings['min_threshold']))
+    state.append(df)
+    state.metadata = {'settings': settings, 'record_digest': _record_digest(df, state.last_date)}
+    state.save(state_path)
+    return previous_last_date
+
+
+def assess_station(site_id, begin_year, pf_threshold, trout_threshold, min_threshold, out_dir,
+                   outlier_method='global', outlier_window=OUTLIER_WINDOW_DAYS, export_path=None, export_format='arrow'):
+    """
+    Runs the peak flow, base flow and rate of change assessments for one station and
+    writes its summary tables to out_dir/<site_id>/. The station state kept there is
+    brought up to date as well, so the summary can report the days and rate of change
+    outliers that are new since the previous run with the same settings (none on a
+    first run).
+
+    Args:
+        site_id (str): The USGS site ID.
+        begin_year (str): The year to start the analysis from.
+        pf_threshold (float): The peak flow threshold.
+        trout_threshold (float): The stable flow threshold.
+        min_threshold (float): The minimum flow threshold.
+        out_dir (str): The directory the station tables are written to.
+        outlier_method (str, optional): The rate of change outlier method, one of OUTLIER_METHODS.
+        outlier_window (int, optional): Days in the rolling or seasonal outlier window.
+        export_path (str, optional): The results dataset the daily series and tables are also written to.
+        export_format (str, optional): The format of the results dataset, one of RESULTS_FORMATS.
+
+    Returns:
+        dict: One row of the batch summary table.
+    """
+    df = load_site_flow_data(site_id, begin_year)
+    if df is None:
+        raise ValueError(f"No daily flow data available for gage {site_id}")
+
+    above_thresh_df, yearly_analysis, annual_peaks, months_dict, water_year_df = peak_flow_analysis(df, pf_threshold)
+    trout_analysis, min_analysis = base_flow_analysis(df, trout_threshold, min_threshold)
+    rate_df = rate_change_analysis(df, outlier_method, outlier_window)
+    # outliers are only assessed between August 1 and October 31, as on the rate of change page
+    outliers = rate_change_events(rate_df).events.sort_values('date')
+
+    station_dir = os.path.join(out_dir, site_id)
+    if not os.path.exists(station_dir):
+        os.makedirs(station_dir)
+    peak_summary_df(yearly_analysis, pf_threshold).to_csv(os.path.join(station_dir, "peak_flow_summary.csv"), index_label='year')
+    annual_peaks.to_csv(os.path.join(station_dir, "annual_peaks.csv"), index=False)
+    base_summary_df(trout_analysis, trout_threshold).to_csv(os.path.join(station_dir, "stable_flow_summary.csv"), index_label='year')
+    base_summary_df(min_analysis, min_threshold).to_csv(os.path.join(station_dir, "minimum_flow_summary.csv"), index_label='year')
+    outliers.to_csv(os.path.join(station_dir, "rate_change_outliers.csv"), index=False)
+
+    frequency_peaks = complete_year_peaks(df, annual_peaks)['avg_flow']
+    frequency = None
+    if len(frequency_peaks) >= MIN_RECOMMENDED_PEAKS:
+        frequency = pd.concat([flood_frequency(frequency_peaks, distribution).assign(distribution=distribution)
+                               for distribution in FREQUENCY_DISTRIBUTIONS])
+        frequency.to_csv(os.path.join(station_dir, "flood_frequency.csv"), index=False)
+    if export_path is not None:
+        export_station_results(site_id, {
+            'daily': rate_df,
+            'peak_flow_summary': yearly_analysis,
+            'annual_peaks': annual_peaks,
+            'stable_flow_summary': trout_analysis,
+            'minimum_flow_summary': min_analysis,
+            'rate_change_outliers': outliers,
+            'flood_frequency': frequency,
+        }, export_path, export_format)
+    settings = {'begin_year': str(begin_year), 'pf_threshold': float(pf_threshold), 'trout_threshold': float(trout_threshold),
+                'min_threshold': float(min_threshold), 'outlier_method': outlier_method, 'outlier_window': int(outlier_window)}
+    previous_last_date = refresh_station_state(df, os.path.join(station_dir, "station_state.json"), site_id, settings)
+    # the new outliers are the outliers of rate_change_outliers.csv after the previous run
+    if previous_last_date is None:
+        new_days = new_outliers = 0
+    else:
+        new_days = int((df['date'] > previous_last_date).sum())
+        new_outliers = int((outliers['date'] > previous_last_date).sum())
+    q100 = {} if frequency is None else frequency[frequency['return_period'] == 100].set_index('distribution')['flow']
+
+    winter_df = df[df['season'] == 'Winter']
+    return {
+        'site_no': site_id,
+        'first_date': df['date'].min().strftime('%Y-%m-%d'),
+        'last_date': df['date'].max().strftime('%Y-%m-%d'),
+        'days_of_record': int(df['valid'].sum()),
+        f'years_above_{pf_threshold}_cfs': len(yearly_analysis),
+        'mean_annual_peak_cfs': annual_peaks['avg_flow'].mean(),
+        'most_common_peak_month': months_dict[annual_peaks['month'].mode()[0]] if not annual_peaks.empty else None,
+        'lp3_100yr_cfs': q100.get('lp3'),
+        'gev_100yr_cfs': q100.get('gev'),
+        f'days_below_{trout_threshold}_cfs': int(trout_analysis['total_days_below_threshold'].sum()),
+        f'days_below_{min_threshold}_cfs': int(min_analysis['total_days_below_threshold'].sum()),
+        f'pct_winter_days_below_{min_threshold}_cfs': (winter_df['avg_flow'][winter_df['valid']] < min_threshold).mean() * 100 if winter_df['valid'].any() else None,
+        'rate_change_outliers': len(outliers),
+        'max_flow_derivative': outliers['flow_derivative'].max() if not outliers.empty else None,
+        'new_days': new_days,
+        'new_rate_change_outliers': new_outliers,
+        'status': 'ok',
+        'error': None,
+    }
+
+
+def run_batch(site_ids, out_dir, begin_year="2015", pf_threshold=200, trout_threshold=35, min_threshold=10,
+              workers=None, download_workers=8, outlier_method='global', outlier_window=OUTLIER_WINDOW_DAYS,
+              export_path=None, export_format='arrow'):
+    """
+    Runs the three assessments for many stations. The gage cache is first refreshed
+    for all stations concurrently, then the stations are assessed on a process pool.
+
+    Args:
+        site_ids (list): The USGS site IDs.
+        out_dir (str): The directory the station tables and summary.csv are written to.
+        begin_year (str): The year to start the analysis from.
+        pf_threshold (float): The peak flow threshold.
+        trout_threshold (float): The stable flow threshold.
+        min_threshold (float): The minimum flow threshold.
+        workers (int, optional): Number of assessment processes, defaults to the CPU count.
+        download_workers (int): Number of concurrent downloads.
+        outlier_method (str, optional): The rate of change outlier method, one of OUTLIER_METHODS.
+        outlier_window (int, optional): Days in the rolling or seasonal outlier window.
+        export_path (str, optional): The results dataset the station results are also written to.
+        export_format (str, optional): The format of the results dataset, one of RESULTS_FORMATS.
+
+    Returns:
+        pd.DataFrame: The batch summary table with one row per station.
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    logger.info("Refreshing the gage cache for %d stations", len(site_ids))
+    _, download_errors = batch_download(site_ids, f"{begin_year}-01-01", max_workers=download_workers)
+    rows = {site_id: {'site_no': site_id, 'status': 'error', 'error': error} for site_id, error in download_errors.items()}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            site_id: executor.submit(assess_station, site_id, begin_year, pf_threshold, trout_threshold,
+                                     min_threshold, out_dir, outlier_method, outlier_window, export_path, export_format)
+            for site_id in site_ids if site_id not in download_errors
+        }
+        for site_id, future in futures.items():
+            try:
+                rows[site_id] = future.result()
+                logger.info("Assessed gage %s", site_id)
+            except Exception as e:
+                logger.error("Assessment of gage %s failed: %s", site_id, e)
+                rows[site_id] = {'site_no': site_id, 'status': 'error', 'error': str(e)}
+
+    summary = pd.DataFrame([rows[site_id] for site_id in site_ids if site_id in rows])
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+    return summary
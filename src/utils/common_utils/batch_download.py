@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.common_utils.data_processing import USGS_BASE_URL
+from utils.common_utils.gage_cache import CACHE_PATH, fetch_daily_values, get_daily_values
+
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to the same host so that at most requests_per_second are
+    started per host, no matter how many threads are sending them.
+    """
+
+    def __init__(self, requests_per_second=5.0):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        """
+        Blocks until the next request slot for the host is available.
+
+        Args:
+            host (str): The host the request is sent to.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitedSession:
+    """
+    A requests.Session with a bounded connection pool, per-host rate limiting and
+    retry with exponential backoff. It can be passed anywhere a session is accepted.
+    """
+
+    def __init__(self, max_connections=8, requests_per_second=5.0, retries=3, backoff=1.0):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.retries = retries
+        self.backoff = backoff
+
+    def get(self, url, **kwargs):
+        """
+        Sends a GET request, retrying connection errors and retryable status codes.
+
+        Args:
+            url (str): The url to request.
+            **kwargs: Extra arguments passed on to requests.Session.get.
+
+        Returns:
+            requests.Response: The response of the last attempt.
+        """
+        kwargs.setdefault('timeout', 60)
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(host)
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                return response
+            retry_after = response.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+            response.close()
+            time.sleep(delay)
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def download_site(site_id, begin_date, end_date, session, use_cache=True, cache_path=CACHE_PATH, base_url=USGS_BASE_URL):
+    """
+    Downloads the daily values for one site.
+
+    Args:
+        site_id (str): The USGS site ID.
+        begin_date (str): The first day to download (YYYY-MM-DD).
+        end_date (str): The last day to download (YYYY-MM-DD), ignored when use_cache is True.
+        session (RateLimitedSession): Session shared by all downloads of the batch.
+        use_cache (bool): Whether to go through the local gage cache.
+        cache_path (str): The path to the SQLite gage cache.
+        base_url (str): The USGS server to download from.
+
+    Returns:
+        dict: The 'daily_values' DataFrame.
+    """
+    if use_cache:
+        daily_values = get_daily_values(site_id, begin_date, cache_path=cache_path, session=session, base_url=base_url)
+    else:
+        daily_values = fetch_daily_values(site_id, begin_date, end_date, session=session, base_url=base_url)
+    return {'daily_values': daily_values}
+
+
+def batch_download(site_ids, begin_date, end_date=None, max_workers=8, requests_per_second=5.0, retries=3,
+                   backoff=1.0, use_cache=True, cache_path=CACHE_PATH, base_url=USGS_BASE_URL):
+    """
+    Downloads the daily values of many sites concurrently over a shared, bounded
+    connection pool. Site metadata comes from the site index (see site_index).
+
+    Args:
+        site_ids (list): The USGS site IDs.
+        begin_date (str): The first day to download (YYYY-MM-DD).
+        end_date (str, optional): The last day to download, defaults to yesterday.
+        max_workers (int): Number of sites downloaded at the same time.
+        requests_per_second (float): Maximum number of requests started per host per second.
+        retries (int): Number of retries for failed requests.
+        backoff (float): Initial retry delay in seconds, doubled on every retry.
+        use_cache (bool): Whether to go through the local gage cache.
+        cache_path (str): The path to the SQLite gage cache.
+        base_url (str): The USGS server to download from.
+
+    Returns:
+        tuple: A dict of per-site results (see download_site) and a dict of per-site error messages.
+    """
+    if end_date is None:
+        end_date = (pd.Timestamp.now() - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    site_ids = list(dict.fromkeys(str(site_id) for site_id in site_ids))
+    results = {}
+    errors = {}
+    with RateLimitedSession(max_workers, requests_per_second, retries, backoff) as session:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                site_id: executor.submit(download_site, site_id, begin_date, end_date, session,
+                                         use_cache, cache_path, base_url)
+                for site_id in site_ids
+            }
+            for site_id, future in futures.items():
+                try:
+                    results[site_id] = future.result()
+                except Exception as e:
+                    errors[site_id] = str(e)
+    return results, errors
@@ -0,0 +1,61 @@
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from utils.common_utils.downsample import CHART_POINT_BUDGET, downsample
+from utils.common_utils.flow_duration import FlowDuration
+
+
+def line_chart(data, max_points=CHART_POINT_BUDGET, method='minmax', keep=None, **kwargs):
+    """
+    Draws st.line_chart with the data downsampled to the point budget, so long daily
+    records render quickly without hiding peaks and spikes. A caption notes how many
+    points are drawn.
+
+    Args:
+        data (pd.Series or pd.DataFrame): The chart data indexed by the x values.
+        max_points (int, optional): The point budget, None to draw every point.
+        method (str, optional): 'minmax' or 'lttb', see downsample.
+        keep (array-like, optional): A boolean mask of rows that are always drawn.
+        **kwargs: Passed on to st.line_chart.
+    """
+    shown = data if max_points is None else downsample(data, max_points, method, keep)
+    st.line_chart(shown, **kwargs)
+    if len(shown) < len(data):
+        st.caption(f"Showing {len(shown):,} of {len(data):,} daily values, downsampled for display with peaks and spikes kept.")
+
+
+def show_flow_duration(df, threshold=None, max_points=CHART_POINT_BUDGET):
+    """
+    Shows the flow-duration curve of the record with the flows at the standard
+    exceedance percentages by season and month, and how often a threshold is equaled
+    or exceeded.
+
+    Args:
+        df (pd.DataFrame): The daily flow data with 'avg_flow' and 'month' columns.
+        threshold (float, optional): A flow threshold in cfs to look up.
+        max_points (int, optional): The point budget of the curve.
+    """
+    whole = FlowDuration(df)
+    by_season = FlowDuration(df, 'season')
+    by_month = FlowDuration(df, 'month')
+
+    st.header("Flow Duration")
+    st.write("The flow duration curve shows the percentage of days on which each average daily flow was equaled or exceeded (Weibull plotting positions). "
+             "Q90, for example, is the flow equaled or exceeded on 90% of days.")
+    if threshold is not None:
+        st.write(f"##### A flow of {threshold} cfs was equaled or exceeded on {whole.exceedance_at(threshold):.1f}% of days.")
+        st.write(", ".join(f"{season}: {by_season.exceedance_at(threshold, season):.1f}%" for season in by_season.labels))
+    with st.expander("Flow Duration Curve - Figure"):
+        curve = whole.curve()
+        curve = downsample(curve.set_index('exceedance_percent')['avg_flow'], max_points).reset_index()
+        # zero flows cannot be drawn on the log scale
+        curve = curve[curve['avg_flow'] > 0]
+        chart = alt.Chart(curve).mark_line().encode(
+            x=alt.X('exceedance_percent:Q', title="Percent of Days Flow Equaled or Exceeded", scale=alt.Scale(domain=[0, 100])),
+            y=alt.Y('avg_flow:Q', title="Average Daily Flow (cfs)", scale=alt.Scale(type='log')),
+            tooltip=[alt.Tooltip('exceedance_percent:Q', format='.1f'), 'avg_flow'])
+        st.altair_chart(chart, use_container_width=True)
+    with st.expander("Flow Duration Table - Flow (cfs) at Percent Exceedance"):
+        table = pd.concat([whole.table(), by_season.table(), by_month.table()])
+        st.dataframe(table.round(1))
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+
+# most points a chart line is drawn with, about two per horizontal pixel of a wide chart
+CHART_POINT_BUDGET = 4000
+
+DOWNSAMPLE_METHODS = ('minmax', 'lttb')
+
+
+def minmax_indices(values, n_buckets):
+    """
+    Picks the positions of the smallest and the largest value in each of n_buckets
+    equal runs of values, so every peak and spike is kept. A run with no values keeps
+    its first position, so gaps in the data stay gaps in the chart.
+
+    Args:
+        values (np.ndarray): The values in x order.
+        n_buckets (int): The number of buckets.
+
+    Returns:
+        np.ndarray: The sorted positions, including the first and the last one.
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, size)
+    missing = np.isnan(buckets)
+    starts = np.arange(n_buckets) * size
+    lowest = np.where(missing, np.inf, buckets).argmin(axis=1) + starts
+    highest = np.where(missing, -np.inf, buckets).argmax(axis=1) + starts
+    positions = np.concatenate(([0, n - 1], lowest, highest))
+    return np.unique(positions[positions < n])
+
+
+def lttb_indices(values, n_out):
+    """
+    Picks n_out positions with Largest-Triangle-Three-Buckets: the first and last
+    points are kept and from every bucket in between the point forming the largest
+    triangle with the point kept before it and the mean of the next bucket. Days are
+    equally spaced, so the positions are used as x values. Missing values are skipped.
+
+    Args:
+        values (np.ndarray): The values in x order.
+        n_out (int): The number of points to keep.
+
+    Returns:
+        np.ndarray: The sorted positions.
+    """
+    values = np.asarray(values, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) <= n_out or n_out < 3:
+        return valid
+    x = valid.astype('float64')
+    y = values[valid]
+    edges = np.linspace(1, len(valid) - 1, n_out - 1).astype('int64')
+    kept = np.empty(n_out, dtype='int64')
+    kept[0], kept[-1] = 0, len(valid) - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else len(valid)
+        next_x, next_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(area.argmax())
+        kept[i + 1] = previous
+    return valid[kept]
+
+
+def downsample(data, max_points=CHART_POINT_BUDGET, method='minmax', keep=None):
+    """
+    Reduces a Series or DataFrame to at most about max_points rows for display, and
+    returns it unchanged when it is already small enough. With several columns the
+    rows picked for any column are kept.
+
+    Args:
+        data (pd.Series or pd.DataFrame): The data in x order, e.g. indexed by date.
+        max_points (int, optional): The point budget.
+        method (str, optional): One of DOWNSAMPLE_METHODS, 'minmax' keeps the extremes of
+            every bucket and 'lttb' keeps the visually largest triangles.
+        keep (array-like, optional): A boolean mask of rows that are always kept, e.g. outliers.
+
+    Returns:
+        pd.Series or pd.DataFrame: The rows kept.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsample method '{method}', expected one of {DOWNSAMPLE_METHODS}")
+    if len(data) <= max_points:
+        return data
+    columns = [data] if isinstance(data, pd.Series) else [data[col] for col in data.columns]
+    # the budget is shared by the columns, minmax keeps two points per bucket
+    per_column = max(max_points // len(columns), 3)
+    positions = []
+    for column in columns:
+        values = pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64')
+        if method == 'minmax':
+            positions.append(minmax_indices(values, max(per_column // 2, 1)))
+        else:
+            positions.append(lttb_indices(values, per_column))
+    if keep is not None:
+        positions.append(np.flatnonzero(np.asarray(keep, dtype=bool)))
+    return data.iloc[np.unique(np.concatenate(positions))]
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from utils.common_utils.flow_series import SEASONS, season_codes
+
+
+# exceedance percentages of the flow-duration summary table
+EXCEEDANCE_PERCENTS = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+
+DURATION_GROUPS = (None, 'season', 'month')
+
+MONTH_LABELS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+
+class FlowDuration:
+    """
+    Flow-duration curves of a daily flow record, for the whole record or for every
+    season or month. The flows are sorted once, grouped, and the exceedance
+    probability of the i-th largest of n flows in a group is the Weibull plotting
+    position i / (n + 1). Both "flow at p%" and "p% at flow" are then answered by
+    index arithmetic or a binary search on the sorted flows, without another pass over
+    the record.
+    """
+
+    def __init__(self, df, by=None):
+        """
+        Args:
+            df (pd.DataFrame): The daily flow data with 'avg_flow' and, when grouping, 'month' columns.
+                Days that are not flagged in an optional 'valid' column are left out.
+            by (str, optional): One of DURATION_GROUPS, None for the whole record.
+        """
+        if by not in DURATION_GROUPS:
+            raise ValueError(f"by must be one of {DURATION_GROUPS}")
+        flows = df['avg_flow'].to_numpy(dtype=float)
+        if by is None:
+            self.labels = ['All']
+            keys = np.zeros(len(flows), dtype='int64')
+        elif by == 'season':
+            self.labels = list(SEASONS)
+            keys = season_codes(df['month'].to_numpy()).astype('int64')
+        else:
+            self.labels = list(MONTH_LABELS)
+            keys = df['month'].to_numpy(dtype='int64') - 1
+        valid = ~np.isnan(flows)
+        if 'valid' in df.columns:
+            valid &= df['valid'].to_numpy(dtype=bool)
+        flows, keys = flows[valid], keys[valid]
+
+        order = np.lexsort((flows, keys))
+        self.by = by
+        self.flows = flows[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(keys, minlength=len(self.labels)))))
+
+    def _sorted_flows(self, group):
+        if group is None:
+            if len(self.labels) > 1:
+                raise ValueError(f"A group is required for durations by {self.by}, one of {self.labels}")
+            index = 0
+        else:
+            index = self.labels.index(group)
+        return self.flows[self.offsets[index]:self.offsets[index + 1]]
+
+    def count(self, group=None):
+        """
+        Returns the number of days with a flow in the group.
+        """
+        return len(self._sorted_flows(group))
+
+    def flow_at(self, percent, group=None):
+        """
+        Returns the flow equaled or exceeded the given percentage of the time, e.g.
+        percent=90 gives Q90, interpolated between the plotting positions.
+
+        Args:
+            percent (float or array-like): The exceedance percentages (0-100).
+            group (str, optional): The season or month name when the curves are grouped.
+
+        Returns:
+            float or np.ndarray: The flows, NaN for a group without flows.
+        """
+        flows = self._sorted_flows(group)
+        n = len(flows)
+        if n == 0:
+            return np.full(np.shape(percent), np.nan)[()]
+        # rank i of the ascending flow at position j is n - j, so p = (n - j) / (n + 1)
+        positions = n - np.asarray(percent, dtype=float) / 100 * (n + 1)
+        return np.interp(positions, np.arange(n), flows)[()]
+
+    def exceedance_at(self, flow, group=None):
+        """
+        Returns the percentage of the time the given flow is equaled or exceeded, from
+        a binary search on the sorted flows.
+
+        Args:
+            flow (float or array-like): The flows, e.g. a threshold in cfs.
+            group (str, optional): The season or month name when the curves are grouped.
+
+        Returns:
+            float or np.ndarray: The exceedance percentages, NaN for a group without flows.
+        """
+        flows = self._sorted_flows(group)
+        n = len(flows)
+        if n == 0:
+            return np.full(np.shape(flow), np.nan)[()]
+        at_or_above = n - np.searchsorted(flows, np.asarray(flow, dtype=float), side='left')
+        return (at_or_above / (n + 1) * 100)[()]
+
+    def curve(self, group=None):
+        """
+        Returns the flow-duration curve of a group.
+
+        Returns:
+            pd.DataFrame: 'exceedance_percent' and 'avg_flow' columns from the largest flow down.
+        """
+        flows = self._sorted_flows(group)[::-1]
+        n = len(flows)
+        return pd.DataFrame({'exceedance_percent': np.arange(1, n + 1) / (n + 1) * 100, 'avg_flow': flows})
+
+    def table(self, percents=EXCEEDANCE_PERCENTS):
+        """
+        Returns the flows at the given exceedance percentages for every group.
+
+        Returns:
+            pd.DataFrame: One row per group and a 'Q<percent>' column per percentage.
+        """
+        rows = [self.flow_at(percents, group if len(self.labels) > 1 else None) for group in self.labels]
+        return pd.DataFrame(np.array(rows).reshape(len(self.labels), len(percents)),
+                            index=self.labels, columns=[f'Q{p}' for p in percents])
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from utils.common_utils.flow_series import SEASONS, season_codes
+from utils.common_utils.water_year import water_year_calendar
+
+
+# leap-aligned days in a year, February 29 has its own column in every year
+DAYS_IN_YEAR = 366
+
+
+def flow_matrix(row_keys, day_index, values, n_days=None, sort=True):
+    """
+    Scatters daily values into a dense row x day matrix in one step, with NaN where a
+    row has no value for a day. When a (row, day) pair occurs more than once the last
+    value is kept.
+
+    Args:
+        row_keys (array-like): The row of every value, e.g. its year.
+        day_index (array-like): The 0-based day column of every value.
+        values (array-like): The values.
+        n_days (int, optional): The number of day columns, by default the largest day index + 1.
+        sort (bool, optional): Sort the rows by key instead of keeping the order the keys first appear in.
+
+    Returns:
+        tuple: The row keys (np.ndarray) and the float64 matrix with one row per key.
+    """
+    row_index, rows = pd.factorize(np.asarray(row_keys), sort=sort)
+    day_index = np.asarray(day_index, dtype='int64')
+    if n_days is None:
+        n_days = int(day_index.max()) + 1 if len(day_index) else 0
+    matrix = np.full((len(rows), n_days), np.nan)
+    matrix[row_index, day_index] = np.asarray(values, dtype='float64')
+    return np.asarray(rows), matrix
+
+
+def group_positions(group_keys):
+    """
+    Numbers the values of every group 0, 1, 2, ... in the order they occur.
+
+    Args:
+        group_keys (array-like): The group of every value.
+
+    Returns:
+        np.ndarray: The position of every value within its group.
+    """
+    codes, _ = pd.factorize(np.asarray(group_keys))
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes)
+    starts = np.cumsum(counts) - counts
+    positions = np.empty(len(codes), dtype='int64')
+    positions[order] = np.arange(len(codes)) - np.repeat(starts, counts)
+    return positions
+
+
+def _calendar_years(dates):
+    return dates.astype('datetime64[Y]').astype('int64') + 1970
+
+
+def water_year_matrix(dates, values):
+    """
+    Builds the water year x day-of-water-year matrix, with leap-aligned days so that
+    a column is the same calendar day in every year (October 1 is column 0 and
+    February 29 column 151).
+
+    Args:
+        dates (array-like): The datetime dates.
+        values (array-like): The daily values.
+
+    Returns:
+        tuple: The sorted water years and the (years x 366) matrix.
+    """
+    calendar = water_year_calendar(pd.Series(dates))
+    return flow_matrix(calendar['water_year'].to_numpy(dtype='int64'),
+                       calendar['water_year_day'].to_numpy(dtype='int64') - 1, values, DAYS_IN_YEAR)
+
+
+def day_of_year_matrix(dates, values):
+    """
+    Builds the calendar year x day-of-year matrix, with leap-aligned days so that
+    February 29 is always column 59 and March 1 column 60.
+
+    Args:
+        dates (array-like): The datetime dates.
+        values (array-like): The daily values.
+
+    Returns:
+        tuple: The sorted calendar years and the (years x 366) matrix.
+    """
+    days = pd.Series(dates).to_numpy().astype('datetime64[D]')
+    years = _calendar_years(days)
+    day_of_year = (days - days.astype('datetime64[Y]')).astype('int64')
+    is_leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    day_of_year += (day_of_year >= 59) & ~is_leap
+    return flow_matrix(years, day_of_year, values, DAYS_IN_YEAR)
+
+
+def season_matrices(dates, values):
+    """
+    Builds a calendar year x day-of-season matrix for every season. The days of a
+    season within a year are numbered in the order they occur, so the Winter row of a
+    year holds its January-March days followed by its December days. Every matrix has
+    a row for every year in the data, in the order the years first occur, and is as
+    wide as the longest season of any year.
+
+    Args:
+        dates (array-like): The datetime dates.
+        values (array-like): The daily values.
+
+    Returns:
+        dict: The years (np.ndarray) and the matrix of every season name, as a tuple.
+    """
+    days = pd.Series(dates).to_numpy().astype('datetime64[D]')
+    values = np.asarray(values, dtype='float64')
+    # the months and years are computed in place, and the days are numbered one season
+    # at a time, so few temporaries as long as the record are alive at once
+    months = days.astype('datetime64[M]').view('int64')
+    months %= 12
+    months += 1
+    seasons = season_codes(months)
+    del months
+    year_offsets = days.astype('datetime64[Y]').view('int64')
+    del days
+    first_year = int(year_offsets.min()) if len(year_offsets) else 0
+    year_offsets -= first_year
+    year_offsets = year_offsets.astype('int32')
+
+    # rows in the order the years first occur, which is among the starts of the runs
+    # of equal years
+    run_starts = np.flatnonzero(np.diff(year_offsets, prepend=year_offsets[:1] - 1))
+    present = pd.unique(year_offsets[run_starts]).astype('int64')
+    years = present + first_year + 1970
+    row_of_year = np.empty(int(present.max()) + 1 if len(present) else 0, dtype='int64')
+    row_of_year[present] = np.arange(len(present))
+
+    matrices = {}
+    for code, season in enumerate(SEASONS):
+        in_season = np.flatnonzero(seasons == code)
+        season_rows = row_of_year[year_offsets[in_season]]
+        positions = group_positions(season_rows)
+        n_days = int(positions.max()) + 1 if len(positions) else 0
+        matrix = np.full((len(years), n_days), np.nan)
+        matrix[season_rows, positions] = values[in_season]
+        matrices[season] = (years, matrix)
+    return matrices
@@ -0,0 +1,222 @@
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+SEASONS = ['Winter', 'Spring', 'Summer', 'Fall']
+
+# season code of every month (index 1-12): Winter is December-March, Spring April-May,
+# Summer June-August and Fall September-November
+SEASON_CODE_BY_MONTH = np.array([0, 0, 0, 0, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype='uint8')
+
+
+def season_codes(months):
+    """
+    Looks up the uint8 season code (an index into SEASONS) of every month.
+
+    Args:
+        months (array-like): The month numbers (1-12).
+
+    Returns:
+        np.ndarray: The season codes.
+    """
+    return SEASON_CODE_BY_MONTH[np.asarray(months, dtype='int64')]
+
+
+def season_categorical(months):
+    """
+    Builds the categorical season labels of every month.
+
+    Args:
+        months (array-like): The month numbers (1-12).
+
+    Returns:
+        pd.Categorical: The season labels with SEASONS as categories.
+    """
+    return pd.Categorical.from_codes(season_codes(months), categories=SEASONS)
+
+
+# USGS codes that are published in place of a daily value, so the day has no usable
+# flow: ice, equipment malfunction, backwater, discontinued, flood damage,
+# maintenance, seasonal, partial record, rating being developed and temporarily
+# unavailable. Codes that qualify a published value, such as 'ZFl' (zero flow, a
+# real 0 cfs reading) or 'e' (estimated), are not listed.
+UNAVAILABLE_QC_CODES = frozenset(['Ice', 'Eqp', 'Bkw', 'Dis', 'Fld', 'Mnt', 'Ssn', 'Pr', 'Rat', '***'])
+
+
+def unavailable_qc(qc):
+    """
+    Flags the qc codes that mark a day without a usable value, e.g. 'P Ice' or 'A:Eqp'.
+
+    Args:
+        qc (array-like): The qc codes, missing codes are treated as usable.
+
+    Returns:
+        np.ndarray: True where the qc codes include an UNAVAILABLE_QC_CODES code.
+    """
+    codes = pd.Categorical(qc)
+    flagged = np.array([bool(UNAVAILABLE_QC_CODES.intersection(str(code).replace(':', ' ').split()))
+                        for code in codes.categories], dtype=bool)
+    # each distinct code is checked once, missing codes (-1) are never flagged
+    return np.append(flagged, False)[codes.codes]
+
+
+def validity_mask(flow, qc=None):
+    """
+    Flags the days with a usable flow: a value is present and the qc code does not
+    mark it as unavailable.
+
+    Args:
+        flow (array-like): The daily flows.
+        qc (array-like, optional): The qc codes of the days.
+
+    Returns:
+        np.ndarray: The boolean validity of every day.
+    """
+    valid = ~np.isnan(np.asarray(flow, dtype='float64'))
+    if qc is not None:
+        valid &= ~unavailable_qc(qc)
+    return valid
+
+
+def complete_daily_calendar(df):
+    """
+    Reindexes daily flow data onto a complete daily calendar from its first to its
+    last day, so consecutive rows are always consecutive days. Days missing from the
+    data are added with a NaN flow, duplicate days keep their last row, and a boolean
+    'valid' column flags the days with a usable flow (see validity_mask). Data that is
+    already complete only gets the 'valid' column.
+
+    Args:
+        df (pd.DataFrame): The daily flow data with 'date' and 'avg_flow' columns.
+
+    Returns:
+        pd.DataFrame: The daily flow data on the complete calendar.
+    """
+    dates = df['date'].to_numpy(dtype='datetime64[D]')
+    if len(dates) > 1 and not (np.diff(dates) == np.timedelta64(1, 'D')).all():
+        first = dates.min()
+        positions = (dates - first).astype('int64')
+        # the row of every calendar day, -1 for a missing day; a later duplicate overwrites an earlier one
+        rows = np.full(positions.max() + 1, -1, dtype='int64')
+        rows[positions] = np.arange(len(dates))
+        # the station columns are the same on every day
+        station_rows = np.where(rows < 0, rows.max(), rows)
+        columns = {}
+        for col in df.columns:
+            if col == 'date':
+                columns[col] = (first + np.arange(len(rows))).astype('datetime64[ns]')
+            elif col in ('agency_cd', 'site_no'):
+                columns[col] = df[col].array.take(station_rows)
+            else:
+                columns[col] = df[col].array.take(rows, allow_fill=True)
+        df = pd.DataFrame(columns)
+    df['valid'] = validity_mask(df['avg_flow'], df['qc'] if 'qc' in df.columns else None)
+    return df
+
+
+def _constant_categorical(value, n):
+    if value is None:
+        return pd.Categorical.from_codes(np.full(n, -1, dtype='int8'), categories=[])
+    return pd.Categorical.from_codes(np.zeros(n, dtype='int8'), categories=[value])
+
+
+class FlowSeries:
+    """
+    Compact daily flow record of one station: a datetime64[D] date array, a float32
+    flow array, categorical qc codes and a bit-packed validity mask (one bit per day).
+    Calendar fields (year, month, day and season code) are derived from the dates the
+    first time they are used.
+    """
+
+    def __init__(self, dates, flow, qc=None, site_no=None, agency_cd='USGS', valid=None):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.flow = np.asarray(flow, dtype='float32')
+        self.qc = pd.Categorical(qc) if qc is not None else None
+        self.site_no = site_no
+        self.agency_cd = agency_cd
+        if valid is None:
+            valid = validity_mask(self.flow, self.qc)
+        self.valid_bits = np.packbits(np.asarray(valid, dtype=bool))
+
+    @classmethod
+    def from_frame(cls, df, site_no=None):
+        """
+        Builds a FlowSeries from a daily flow DataFrame with 'date' and 'avg_flow' columns.
+
+        Args:
+            df (pd.DataFrame): The daily flow data.
+            site_no (str, optional): The site ID, taken from the 'site_no' column when present.
+
+        Returns:
+            FlowSeries: The compact flow record.
+        """
+        if site_no is None and 'site_no' in df.columns and len(df):
+            site_no = str(df['site_no'].iloc[0])
+        qc = df['qc'] if 'qc' in df.columns else None
+        agency_cd = str(df['agency_cd'].iloc[0]) if 'agency_cd' in df.columns and len(df) else 'USGS'
+        valid = df['valid'].to_numpy(dtype=bool) if 'valid' in df.columns else None
+        return cls(df['date'].to_numpy(), df['avg_flow'].to_numpy(dtype='float32'), qc, site_no, agency_cd, valid)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def valid(self):
+        """
+        The boolean validity of every day, unpacked from the bit mask.
+        """
+        return np.unpackbits(self.valid_bits, count=len(self)).astype(bool)
+
+    @cached_property
+    def year(self):
+        return (self.dates.astype('datetime64[Y]').astype('int64') + 1970).astype('int16')
+
+    @cached_property
+    def month(self):
+        return (self.dates.astype('datetime64[M]').astype('int64') % 12 + 1).astype('int8')
+
+    @cached_property
+    def day(self):
+        return ((self.dates - self.dates.astype('datetime64[M]')).astype('int64') + 1).astype('int8')
+
+    @cached_property
+    def season(self):
+        return season_codes(self.month)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes held by the record arrays, including any derived fields.
+        """
+        total = self.dates.nbytes + self.flow.nbytes + self.valid_bits.nbytes
+        if self.qc is not None:
+            total += self.qc.nbytes
+        for name in ('year', 'month', 'day', 'season'):
+            if name in self.__dict__:
+                total += self.__dict__[name].nbytes
+        return total
+
+    def to_frame(self):
+        """
+        Expands the record into the daily flow DataFrame layout used by the analyses.
+
+        Returns:
+            pd.DataFrame: The daily flow data with agency_cd, site_no, date, avg_flow,
+            qc, valid, year, month, day and season columns.
+        """
+        n = len(self)
+        df = pd.DataFrame({
+            'agency_cd': _constant_categorical(self.agency_cd, n),
+            'site_no': _constant_categorical(self.site_no, n),
+            'date': self.dates.astype('datetime64[ns]'),
+            'avg_flow': self.flow.astype('float64'),
+            'qc': self.qc if self.qc is not None else _constant_categorical(None, n),
+            'valid': self.valid,
+            'year': self.year,
+            'month': self.month,
+            'day': self.day,
+            'season': pd.Categorical.from_codes(self.season, categories=SEASONS),
+        })
+        return df
@@ -0,0 +1,175 @@
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import requests
+
+from utils.common_utils.data_processing import USGS_BASE_URL, build_daily_values_url
+from utils.common_utils.rdb_parser import read_daily_values
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.join("data", "cache", "gage_cache.sqlite")
+
+# USGS publishes one new daily value per day, so a site that was refreshed recently
+# is served from the cache without touching the network.
+REFRESH_INTERVAL = pd.Timedelta(hours=12)
+
+# Provisional ("P") values can be revised by USGS until they are approved. On every
+# refresh the cache re-downloads from the oldest provisional day it holds, but never
+# reaches further back than this window.
+PROVISIONAL_WINDOW_DAYS = 365
+
+
+def _connect(cache_path):
+    """
+    Opens the cache database, creating the tables on first use.
+
+    Args:
+        cache_path (str): The path to the SQLite cache file.
+
+    Returns:
+        sqlite3.Connection: An open connection to the cache.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    # several threads of a batch download may write to the cache at the same time
+    conn = sqlite3.connect(cache_path, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS daily_values ("
+        "site_no TEXT NOT NULL, date TEXT NOT NULL, agency_cd TEXT, avg_flow REAL, qc TEXT, "
+        "PRIMARY KEY (site_no, date))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS site_coverage ("
+        "site_no TEXT PRIMARY KEY, first_date TEXT NOT NULL, last_date TEXT NOT NULL, refreshed_at TEXT NOT NULL)"
+    )
+    return conn
+
+
+def fetch_daily_values(site_id, begin_date, end_date, session=None, base_url=USGS_BASE_URL):
+    """
+    Downloads the daily values for a site and date range from USGS.
+
+    Args:
+        site_id (str): The USGS site ID.
+        begin_date (str): The first day to download (YYYY-MM-DD).
+        end_date (str): The last day to download (YYYY-MM-DD).
+        session (requests.Session, optional): Session used for the request.
+        base_url (str, optional): The USGS server to download from.
+
+    Returns:
+        pd.DataFrame: The downloaded daily values.
+    """
+    url = build_daily_values_url(site_id, begin_date, end_date, base_url)
+    # parse the response as it streams in instead of holding the whole file
+    with (session or requests).get(url, timeout=60, stream=True) as response:
+        response.raise_for_status()
+        return read_daily_values(response.iter_lines(chunk_size=65536))
+
+
+def _store_daily_values(conn, site_id, df):
+    dates = np.datetime_as_string(df['date'].to_numpy().astype('datetime64[D]'), unit='D')
+    rows = [
+        (str(site_id), date, agency, None if pd.isna(flow) else float(flow), None if pd.isna(qc) else qc)
+        for agency, date, flow, qc in zip(df['agency_cd'], dates, df['avg_flow'], df['qc'])
+    ]
+    conn.executemany(
+        "INSERT OR REPLACE INTO daily_values (site_no, date, agency_cd, avg_flow, qc) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def _refresh_start(conn, site_id, last_date, today):
+    """
+    Returns the first day that has to be downloaded again when refreshing a site.
+    This is the day after the last cached day, or the oldest provisional day within
+    the provisional window if that is earlier.
+    """
+    window_start = (today - pd.Timedelta(days=PROVISIONAL_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    row = conn.execute(
+        "SELECT MIN(date) FROM daily_values WHERE site_no = ? AND date >= ? AND qc LIKE '%P%'",
+        (str(site_id), window_start),
+    ).fetchone()
+    next_day = (pd.Timestamp(last_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    if row[0] is not None and row[0] < next_day:
+        return row[0]
+    return next_day
+
+
+def get_daily_values(site_id, begin_date, cache_path=CACHE_PATH, session=None, now=None, base_url=USGS_BASE_URL):
+    """
+    Returns the daily values for a site from the local cache, downloading only the
+    date ranges that are missing (before the first cached day, after the last cached
+    day and the provisional window) and merging them into the cache.
+
+    Args:
+        site_id (str): The USGS site ID.
+        begin_date (str): The first day of the analysis (YYYY-MM-DD).
+        cache_path (str, optional): The path to the SQLite cache file.
+        session (requests.Session, optional): Session used for any downloads.
+        now (pd.Timestamp, optional): The current time, used to decide on refreshes.
+        base_url (str, optional): The USGS server to download from.
+
+    Returns:
+        pd.DataFrame: The daily values from begin_date up to yesterday.
+    """
+    site_id = str(site_id)
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    today = now.normalize()
+    begin_date = pd.Timestamp(begin_date).strftime('%Y-%m-%d')
+    yesterday = (today - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+    with closing(_connect(cache_path)) as conn:
+        coverage = conn.execute(
+            "SELECT first_date, last_date, refreshed_at FROM site_coverage WHERE site_no = ?", (site_id,)
+        ).fetchone()
+
+        ranges = []
+        if coverage is None:
+            ranges.append((begin_date, yesterday))
+            first_date, last_date, refreshed_at = begin_date, yesterday, now.isoformat()
+        else:
+            first_date, last_date, refreshed_at = coverage
+            if begin_date < first_date:
+                day_before = (pd.Timestamp(first_date) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+                ranges.append((begin_date, day_before))
+                first_date = begin_date
+            if now - pd.Timestamp(refreshed_at) >= REFRESH_INTERVAL or last_date < yesterday:
+                ranges.append((_refresh_start(conn, site_id, last_date, today), yesterday))
+                last_date, refreshed_at = max(last_date, yesterday), now.isoformat()
+
+        # download every range before writing anything, so the write transaction
+        # is only held for the inserts and never across a network request
+        try:
+            downloads = [
+                fetch_daily_values(site_id, start, end, session=session, base_url=base_url)
+                for start, end in ranges if start <= end
+            ]
+        except requests.RequestException as e:
+            if coverage is None:
+                raise
+            # keep serving what is already cached when USGS cannot be reached
+            logger.warning("Could not refresh gage %s, using cached data: %s", site_id, e)
+        else:
+            if ranges:
+                with conn:
+                    for download in downloads:
+                        _store_daily_values(conn, site_id, download)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO site_coverage (site_no, first_date, last_date, refreshed_at) VALUES (?, ?, ?, ?)",
+                        (site_id, first_date, last_date, refreshed_at),
+                    )
+
+        df = pd.read_sql_query(
+            "SELECT agency_cd, site_no, date, avg_flow, qc FROM daily_values "
+            "WHERE site_no = ? AND date >= ? ORDER BY date",
+            conn,
+            params=(site_id, begin_date),
+        )
+    return df
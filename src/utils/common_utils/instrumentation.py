@@ -0,0 +1,216 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+logger = logging.getLogger("rhaf.perf")
+
+# the recorder of the current context, None unless recording was switched on
+_recorder = contextvars.ContextVar("rhaf_stage_recorder", default=None)
+
+# tracemalloc has a single trace and peak for the whole process, so only the recorder
+# that started tracing reads and resets the peak. Recorders started while memory is
+# already traced (nested recorders, other Streamlit sessions, a benchmark) record times only.
+_tracing_lock = threading.Lock()
+
+
+class StageRecorder:
+    """
+    Collects the wall time, rows processed and memory of the pipeline stages run while
+    it is active. Memory is traced with tracemalloc when track_memory is set, which
+    slows the stages down, so it is off by default. memory_tracked tells whether the
+    recorder got to trace memory, see _tracing_lock.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.memory_tracked = False
+        self.records = []
+        self._stack = []
+        # the segment since the last mark_stage, which contains the stages run in it
+        self._segment = {'child_peak': None}
+        self._owns_tracing = False
+        self._last_mark = None
+
+    def start(self):
+        if self.track_memory:
+            with _tracing_lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._owns_tracing = self.memory_tracked = True
+        self._last_mark = self._snapshot()
+
+    def stop(self):
+        if self._owns_tracing:
+            with _tracing_lock:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+    def _snapshot(self):
+        if self._owns_tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # tracemalloc has a single peak, so the peak so far is handed to the open
+            # stage before it is reset for the next one
+            self._report_peak(peak)
+            tracemalloc.reset_peak()
+            return time.perf_counter(), current
+        return time.perf_counter(), None
+
+    def _report_peak(self, absolute_peak):
+        if absolute_peak is not None:
+            parent = self._stack[-1] if self._stack else self._segment
+            parent['child_peak'] = max(parent['child_peak'] or 0, absolute_peak)
+
+    def _record(self, name, start, rows, child_peak=None):
+        seconds = time.perf_counter() - start[0]
+        record = {'stage': name, 'depth': len(self._stack), 'seconds': seconds, 'rows': rows,
+                  'allocated_bytes': None, 'peak_bytes': None}
+        absolute_peak = None
+        if start[1] is not None and self._owns_tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            absolute_peak = max(peak, child_peak or 0)
+            record['allocated_bytes'] = current - start[1]
+            record['peak_bytes'] = absolute_peak - start[1]
+        self.records.append(record)
+        return absolute_peak
+
+    def begin(self, name):
+        frame = {'name': name, 'start': self._snapshot(), 'rows': None, 'child_peak': None}
+        self._stack.append(frame)
+        return frame
+
+    def end(self, frame):
+        self._stack.pop()
+        self._report_peak(self._record(frame['name'], frame['start'], frame['rows'], frame['child_peak']))
+
+    def mark(self, name, rows=None):
+        start = self._last_mark or self._snapshot()
+        self._record(name, start, rows, self._segment['child_peak'])
+        self._segment = {'child_peak': None}
+        self._last_mark = self._snapshot()
+
+    def to_frame(self):
+        """
+        Returns the recorded stages as a DataFrame, in the order they finished.
+        """
+        return pd.DataFrame(self.records, columns=['stage', 'depth', 'seconds', 'rows', 'allocated_bytes', 'peak_bytes'])
+
+    def to_json(self):
+        """
+        Returns the recorded stages as a JSON string.
+        """
+        return json.dumps(self.records)
+
+    def log(self):
+        """
+        Writes every recorded stage as one JSON line to the 'rhaf.perf' logger.
+        """
+        for record in self.records:
+            logger.info(json.dumps(record))
+
+
+@contextmanager
+def record_stages(track_memory=False):
+    """
+    Records the stages run inside the block.
+
+    Args:
+        track_memory (bool, optional): Also trace the memory allocated by each stage.
+
+    Yields:
+        StageRecorder: The recorder holding the stage records.
+    """
+    recorder = StageRecorder(track_memory)
+    token = _recorder.set(recorder)
+    recorder.start()
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        _recorder.reset(token)
+
+
+def start_recording(track_memory=False):
+    """
+    Starts recording the stages of the current context until stop_recording is
+    called, for code such as a Streamlit page script that cannot sit inside a with block.
+
+    Args:
+        track_memory (bool, optional): Also trace the memory allocated by each stage.
+
+    Returns:
+        StageRecorder: The recorder holding the stage records.
+    """
+    recorder = StageRecorder(track_memory)
+    _recorder.set(recorder)
+    recorder.start()
+    return recorder
+
+
+def stop_recording():
+    """
+    Stops the recording started by start_recording.
+
+    Returns:
+        StageRecorder: The recorder that was active, or None.
+    """
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.stop()
+        _recorder.set(None)
+    return recorder
+
+
+class _Stage:
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = None
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Times a pipeline stage when recording is on and does nothing otherwise. The rows
+    processed can be passed in or set on the yielded object inside the block.
+
+    Args:
+        name (str): The stage name.
+        rows (int, optional): The number of rows the stage processes.
+
+    Yields:
+        object: The stage, whose 'rows' attribute can be set.
+    """
+    recorder = _recorder.get()
+    info = _Stage()
+    info.rows = rows
+    if recorder is None:
+        yield info
+        return
+    frame = recorder.begin(name)
+    try:
+        yield info
+    finally:
+        frame['rows'] = info.rows
+        recorder.end(frame)
+
+
+def mark_stage(name, rows=None):
+    """
+    Records the time since the previous mark (or the start of the recording) as a
+    stage, for timing consecutive blocks of a page script without re-indenting them.
+    Stages run within the block are recorded as well.
+
+    Args:
+        name (str): The stage name.
+        rows (int, optional): The number of rows the stage processed.
+    """
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.mark(name, rows)
@@ -0,0 +1,71 @@
+import pandas as pd
+import requests
+import streamlit as st
+import folium
+from streamlit_folium import folium_static
+
+from utils.common_utils.messages import report_error
+from utils.common_utils.site_index import get_site
+
+
+def render_location_map(location_df, site_id):
+    """
+    Renders the aerial imagery map of a gage location on the page.
+
+    Args:
+        location_df (pd.DataFrame): The gage 'latitude' and 'longitude', and optionally its site record.
+        site_id (str): The USGS site ID.
+    """
+    tiles = 'https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryTopo/MapServer/tile/{z}/{y}/{x}'
+
+    latitude, longitude = float(location_df["latitude"].iloc[0]), float(location_df["longitude"].iloc[0])
+    m = folium.Map(location=[latitude, longitude], tiles=tiles,attr = "Aerial Imagery", zoom_start=16)
+
+    folium.Marker(
+        [latitude, longitude], popup=f"Gage {site_id} location", tooltip=f"Gage {site_id} location"
+    ).add_to(m)
+
+    #folium.LayerControl().add_to(m)
+    st.header(f"Gage {site_id} Location")
+    if 'station_nm' in location_df.columns:
+        site = location_df.iloc[0]
+        details = [str(site['station_nm'])] if pd.notna(site['station_nm']) else []
+        if pd.notna(site['drain_area_va']):
+            details.append(f"Drainage area {site['drain_area_va']:g} sq mi")
+        if pd.notna(site['begin_date']) and pd.notna(site['end_date']):
+            details.append(f"Daily flow record {site['begin_date']} to {site['end_date']}")
+        st.caption(" | ".join(details))
+    folium_static(m, width=3000, height=500)
+
+
+def gage_location(site_id):
+    """
+    Looks up the coordinates of a USGS gage in the local site index. Only gages that
+    are not indexed yet are requested from the USGS site service.
+
+    Args:
+        site_id (str): The USGS site ID.
+
+    Returns:
+        pd.DataFrame: The gage 'latitude', 'longitude' and site record, or None when the gage could not be found.
+    """
+    try:
+        site = get_site(site_id)
+    except requests.RequestException as e:
+        report_error(f"Error downloading the gage location: {e}")
+        return None
+    if site is None or site['dec_lat_va'] is None or site['dec_long_va'] is None:
+        return None
+    return pd.DataFrame([{**site, 'latitude': site['dec_lat_va'], 'longitude': site['dec_long_va']}])
+
+
+def show_gage_location(site_id):
+    """
+    Renders the location map of a USGS gage on the page.
+
+    Args:
+        site_id (str): The USGS site ID.
+    """
+    location_df = gage_location(site_id)
+    if location_df is not None:
+        render_location_map(location_df, site_id)
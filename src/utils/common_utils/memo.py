@@ -0,0 +1,192 @@
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def _hash_frame(value):
+    """
+    Returns a content digest of a DataFrame or Series, used as the cache key of
+    uploaded data instead of the object itself.
+    """
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(repr(list(value.dtypes.astype(str))).encode())
+    else:
+        digest.update(repr((value.name, str(value.dtype))).encode())
+    return digest.hexdigest()
+
+
+def _key_part(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return ('frame', _hash_frame(value))
+    if isinstance(value, np.ndarray):
+        return ('array', value.dtype.str, value.shape, hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, (bytes, bytearray)):
+        return ('bytes', hashlib.sha1(value).hexdigest())
+    if isinstance(value, (list, tuple)):
+        return tuple(_key_part(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _key_part(item)) for key, item in value.items()))
+    try:
+        hash(value)
+    except TypeError:
+        return ('repr', repr(value))
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    return 0
+
+
+def _copy(value):
+    # callers (the pages) add columns to the frames they get back, so every hit hands
+    # out its own copy and the cached value is never modified
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    return value
+
+
+class MemoCache:
+    """
+    A thread-safe least-recently-used cache with a time to live and limits on the
+    number of entries and the bytes held.
+    """
+
+    def __init__(self, ttl_seconds=3600, max_entries=64, max_bytes=256 * 1024 ** 2):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns (True, value) for a live entry and (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, nbytes, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value):
+        nbytes = _nbytes(value)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, nbytes, value)
+            self._bytes += nbytes
+            self._evict()
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _, _) in self._entries.items() if expires_at is not None and now >= expires_at]:
+            self._remove(key)
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def memoize(ttl_seconds=3600, max_entries=64, max_bytes=256 * 1024 ** 2, ignore=(), cacheable=None):
+    """
+    Memoizes a loading or analysis function in a cache that lives for the whole
+    process, so it is shared by every Streamlit rerun and session.
+
+    The cache key is built from the bound arguments. DataFrame, Series and array
+    arguments (such as uploaded data) are keyed by a hash of their content. As with
+    st.cache_data, parameters whose names start with an underscore are left out of the
+    key, and so are the parameters named in ignore. Results of None are not cached so
+    that failed loads are retried, and neither are the results that cacheable rejects.
+    Every call returns its own copy of the result.
+
+    Args:
+        ttl_seconds (float, optional): Seconds an entry stays valid, None for no expiry.
+        max_entries (int, optional): Maximum number of cached results.
+        max_bytes (int, optional): Maximum total size of the cached frames and arrays.
+        ignore (tuple): Names of parameters left out of the cache key.
+        cacheable (callable, optional): Returns whether a result is cached, for results
+            that are only partly loaded and should be loaded again on the next call.
+
+    Returns:
+        function: The decorator.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        cache = MemoCache(ttl_seconds, max_entries, max_bytes)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(
+                (name, _key_part(value)) for name, value in bound.arguments.items()
+                if not name.startswith('_') and name not in ignore
+            )
+            found, value = cache.get(key)
+            if not found:
+                value = func(*args, **kwargs)
+                if value is None:
+                    return None
+                if cacheable is not None and not cacheable(value):
+                    return value
+                cache.put(key, value)
+            return _copy(value)
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_info = cache.info
+        return wrapper
+    return decorator
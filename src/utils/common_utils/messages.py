@@ -0,0 +1,39 @@
+import logging
+import sys
+
+
+logger = logging.getLogger("rhaf")
+
+
+def _streamlit():
+    # only use Streamlit when the app has already loaded it, so the headless batch
+    # path never imports it
+    return sys.modules.get("streamlit")
+
+
+def report_error(message):
+    """
+    Shows an error message on the Streamlit page, or logs it when running headless.
+
+    Args:
+        message (str): The message to report.
+    """
+    st = _streamlit()
+    if st is not None:
+        st.error(message)
+    else:
+        logger.error(message)
+
+
+def report_status(message):
+    """
+    Writes a status message on the Streamlit page, or logs it when running headless.
+
+    Args:
+        message (str): The message to report.
+    """
+    st = _streamlit()
+    if st is not None:
+        st.write(message)
+    else:
+        logger.info(message)
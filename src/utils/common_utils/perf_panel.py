@@ -0,0 +1,51 @@
+import streamlit as st
+
+from utils.common_utils.instrumentation import start_recording, stop_recording
+
+
+def performance_recorder():
+    """
+    Adds the opt-in performance options to the sidebar and starts recording the page
+    stages when they are switched on.
+
+    Returns:
+        StageRecorder: The active recorder, or None when recording is off.
+    """
+    stop_recording()
+    if st.sidebar.checkbox("Record performance", value=False, key="record_performance",
+                           help="Times the loading, analysis and chart stages of this page."):
+        track_memory = st.sidebar.checkbox("Trace memory (slower)", value=False, key="trace_memory")
+        return start_recording(track_memory=track_memory)
+    return None
+
+
+def show_performance_panel(recorder):
+    """
+    Stops the recording and shows the recorded stages in a collapsible sidebar panel,
+    with the records as downloadable JSON. The stages are also written to the
+    'rhaf.perf' log.
+
+    Args:
+        recorder (StageRecorder): The recorder from performance_recorder, or None.
+    """
+    if recorder is None:
+        return
+    stop_recording()
+    recorder.log()
+    frame = recorder.to_frame()
+    frame['stage'] = [' ' * depth + name for depth, name in zip(frame['depth'], frame['stage'])]
+    frame['ms'] = frame['seconds'] * 1000
+    columns = ['stage', 'ms', 'rows']
+    if recorder.memory_tracked:
+        frame['allocated_mb'] = frame['allocated_bytes'] / 1024 ** 2
+        frame['peak_mb'] = frame['peak_bytes'] / 1024 ** 2
+        columns += ['allocated_mb', 'peak_mb']
+    with st.sidebar.expander("Performance", expanded=True):
+        if recorder.track_memory and not recorder.memory_tracked:
+            st.caption("Memory was not traced, another session is tracing it.")
+        st.dataframe(frame[columns], hide_index=True, column_config={
+            'ms': st.column_config.NumberColumn(format="%.1f"),
+            'allocated_mb': st.column_config.NumberColumn(format="%.2f"),
+            'peak_mb': st.column_config.NumberColumn(format="%.2f"),
+        })
+        st.download_button("Download JSON", recorder.to_json(), file_name="performance.json", mime="application/json")
@@ -0,0 +1,181 @@
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# an RDB column-type field such as '5s', '20d' or '14n'
+RDB_TYPE_PATTERN = re.compile(r'^\d*[sdn]$')
+
+DAILY_VALUE_COLUMNS = ['agency_cd', 'site_no', 'date', 'avg_flow', 'qc']
+
+
+def _iter_text_lines(source):
+    """
+    Yields the lines of an RDB source: a file path, an open file (io.StringIO for RDB
+    text already in memory) or any iterable of str or bytes lines (such as
+    response.iter_lines()). A path that does not exist raises FileNotFoundError.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r') as f:
+            for line in f:
+                yield line.rstrip('\r\n')
+        return
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        yield line.rstrip('\r\n')
+
+
+def read_rdb_header(lines):
+    """
+    Reads the header of an RDB file: the '#' comment block, the column names line and,
+    when present, the column-type line.
+
+    Args:
+        lines (iterator): The lines of the RDB file. The header lines are consumed.
+
+    Returns:
+        tuple: The comment lines, the column names, the column types (one of 's', 'd'
+        or 'n' per column) and the first data line (or None), which has already been
+        read from the iterator.
+    """
+    comments = []
+    for line in lines:
+        if line.startswith('#'):
+            comments.append(line)
+        elif line.strip():
+            columns = line.split('\t')
+            break
+    else:
+        return comments, [], [], None
+
+    types = ['s'] * len(columns)
+    first_data_line = next(lines, None)
+    if first_data_line is not None:
+        fields = first_data_line.split('\t')
+        if len(fields) == len(columns) and all(RDB_TYPE_PATTERN.match(field.strip()) for field in fields):
+            types = [field.strip()[-1] for field in fields]
+            first_data_line = None
+    return comments, columns, types, first_data_line
+
+
+def _convert_chunk(chunk, columns, types):
+    frame = pd.read_csv(io.StringIO('\n'.join(chunk)), sep='\t', header=None, names=columns, dtype=str,
+                        keep_default_na=False, index_col=False, on_bad_lines='skip', engine='c')
+    arrays = {}
+    for column, column_type in zip(columns, types):
+        values = frame[column]
+        if column_type == 'n':
+            # qualifier values such as 'Ice', 'Eqp' or '' become NaN
+            arrays[column] = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64')
+        elif column_type == 'd':
+            arrays[column] = pd.to_datetime(values, format='ISO8601', errors='coerce').to_numpy()
+        else:
+            arrays[column] = values.to_numpy(dtype=object)
+    return arrays
+
+
+def iter_rdb_chunks(source, chunk_size=20000):
+    """
+    Parses an RDB source in chunks without reading it into memory first. Each chunk is
+    parsed by the pandas C parser and converted to typed arrays: float64 for numeric
+    ('n') columns, datetime64 for date ('d') columns and object arrays of str for the
+    rest. Rows with more fields than the header are skipped.
+
+    Args:
+        source: A file path, open file or iterable of str/bytes lines.
+        chunk_size (int): The number of data lines parsed at a time.
+
+    Yields:
+        dict: The typed arrays of one chunk, keyed by column name.
+    """
+    lines = _iter_text_lines(source)
+    _, columns, types, first_data_line = read_rdb_header(lines)
+    if not columns:
+        return
+    chunk = [] if first_data_line is None else [first_data_line]
+    for line in lines:
+        if not line or line.startswith('#'):
+            continue
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield _convert_chunk(chunk, columns, types)
+            chunk = []
+    if chunk:
+        yield _convert_chunk(chunk, columns, types)
+
+
+def read_rdb(source, chunk_size=20000):
+    """
+    Parses a whole RDB source into a DataFrame with typed columns.
+
+    Args:
+        source: A file path, open file or iterable of str/bytes lines.
+        chunk_size (int): The number of data lines parsed at a time.
+
+    Returns:
+        pd.DataFrame: The RDB table.
+    """
+    chunks = list(iter_rdb_chunks(source, chunk_size))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.DataFrame({column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]})
+
+
+def find_daily_value_columns(columns, parameter='00060', statistic='00003'):
+    """
+    Finds the value and qualifier columns of a parameter and statistic in a USGS
+    daily-values table, whose value columns are named <ts_id>_<parameter>_<statistic>.
+
+    Args:
+        columns (list): The column names of the table.
+        parameter (str): The USGS parameter code, 00060 is discharge.
+        statistic (str): The USGS statistic code, 00003 is the daily mean.
+
+    Returns:
+        tuple: The value column and its qualifier column, or (None, None) when the table has none.
+    """
+    suffix = f"_{parameter}_{statistic}"
+    for column in columns:
+        if column.endswith(suffix):
+            qualifier = f"{column}_cd"
+            return column, qualifier if qualifier in columns else None
+    return None, None
+
+
+def read_daily_values(source, parameter='00060', statistic='00003', chunk_size=20000):
+    """
+    Parses a USGS daily-values RDB source and keeps the columns of one parameter and
+    statistic, the mean daily discharge by default.
+
+    Args:
+        source: A file path, open file or iterable of str/bytes lines.
+        parameter (str): The USGS parameter code.
+        statistic (str): The USGS statistic code.
+        chunk_size (int): The number of data lines parsed at a time.
+
+    Returns:
+        pd.DataFrame: The daily values with agency_cd, site_no, date, avg_flow and qc columns.
+    """
+    columns = {name: [] for name in DAILY_VALUE_COLUMNS}
+    for chunk in iter_rdb_chunks(source, chunk_size):
+        value_column, qualifier_column = find_daily_value_columns(list(chunk), parameter, statistic)
+        if value_column is None:
+            break
+        n = len(chunk[value_column])
+        columns['agency_cd'].append(chunk.get('agency_cd', np.full(n, 'USGS', dtype=object)))
+        columns['site_no'].append(chunk['site_no'])
+        columns['date'].append(chunk['datetime'])
+        columns['avg_flow'].append(chunk[value_column])
+        columns['qc'].append(chunk[qualifier_column] if qualifier_column else np.full(n, None, dtype=object))
+    if not columns['date']:
+        return pd.DataFrame({
+            'agency_cd': pd.Series(dtype=object), 'site_no': pd.Series(dtype=object),
+            'date': pd.Series(dtype='datetime64[ns]'), 'avg_flow': pd.Series(dtype='float64'),
+            'qc': pd.Series(dtype=object),
+        })
+    df = pd.DataFrame({name: np.concatenate(arrays) for name, arrays in columns.items()})
+    return df.dropna(subset=['date']).reset_index(drop=True)
@@ -0,0 +1,195 @@
+import os
+import shutil
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.common_utils.water_year import water_year_calendar
+
+
+RESULTS_PATH = os.path.join("data", "results")
+
+# Arrow IPC files are written uncompressed, so they can be memory-mapped and read
+# without copying. Parquet files are smaller but are decoded on every read.
+RESULTS_FORMATS = ('arrow', 'parquet')
+
+FORMAT_EXTENSIONS = {'arrow': 'arrow', 'parquet': 'parquet'}
+
+DATASET_FORMATS = {'arrow': 'ipc', 'parquet': 'parquet'}
+
+# the daily series is partitioned by water year as well as site, so one water year of
+# one site is read without touching the rest of the record. The other tables hold a
+# few rows per year and are partitioned by site only.
+RESULT_TABLES = {
+    'daily': ('site_no', 'water_year'),
+    'peak_flow_summary': ('site_no',),
+    'annual_peaks': ('site_no',),
+    'stable_flow_summary': ('site_no',),
+    'minimum_flow_summary': ('site_no',),
+    'rate_change_outliers': ('site_no',),
+    'flood_frequency': ('site_no',),
+}
+
+PARTITION_TYPES = {'site_no': pa.string(), 'water_year': pa.int64()}
+
+# columns of frames loaded from USGS that repeat the station on every row, the station
+# is stored once as the site_no partition instead
+STATION_COLUMNS = ('agency_cd', 'site_no')
+
+# the yearly summaries are indexed by year, which is stored as a 'year' column
+YEARLY_TABLES = ('peak_flow_summary', 'stable_flow_summary', 'minimum_flow_summary')
+
+
+def _partitioning(table_name):
+    return ds.partitioning(pa.schema([(key, PARTITION_TYPES[key]) for key in RESULT_TABLES[table_name]]), flavor='hive')
+
+
+def _table_format(table_dir):
+    """
+    Returns the format of a stored table from the extension of its first file, None
+    when the table has no files.
+    """
+    for _, _, files in os.walk(table_dir):
+        for name in files:
+            for results_format, extension in FORMAT_EXTENSIONS.items():
+                if name.endswith(f'.{extension}'):
+                    return results_format
+    return None
+
+
+def _read_file(path, results_format):
+    if results_format == 'arrow':
+        return pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return pq.read_table(path, memory_map=True)
+
+
+def export_station_results(site_no, tables, results_path=RESULTS_PATH, results_format='arrow'):
+    """
+    Writes the results of one station to the partitioned results dataset, one
+    directory per table and a 'site_no=<id>' directory per station within it
+    (and 'water_year=<year>' directories for the daily series). A station that was
+    exported before has its old files replaced.
+
+    Args:
+        site_no (str): The USGS site ID, or another name for an uploaded record.
+        tables (dict): DataFrames by table name, from RESULT_TABLES. Tables that are
+            None are skipped, and STATION_COLUMNS are replaced by the site_no partition.
+        results_path (str, optional): The root directory of the dataset.
+        results_format (str, optional): One of RESULTS_FORMATS.
+
+    Returns:
+        list: The names of the tables written.
+    """
+    if results_format not in RESULTS_FORMATS:
+        raise ValueError(f"Unknown results format '{results_format}', expected one of {RESULTS_FORMATS}")
+    written = []
+    for table_name, df in tables.items():
+        if table_name not in RESULT_TABLES:
+            raise ValueError(f"Unknown results table '{table_name}', expected one of {list(RESULT_TABLES)}")
+        if df is None:
+            continue
+        if table_name in YEARLY_TABLES:
+            df = df.rename_axis('year').reset_index()
+        df = df.drop(columns=[column for column in STATION_COLUMNS if column in df.columns])
+        if 'water_year' in RESULT_TABLES[table_name] and 'water_year' not in df.columns:
+            df = df.assign(water_year=water_year_calendar(df['date'])['water_year'].to_numpy())
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.append_column('site_no', pa.array([str(site_no)] * table.num_rows, pa.string()))
+
+        table_dir = os.path.join(results_path, table_name)
+        station_dir = os.path.join(table_dir, f'site_no={site_no}')
+        if os.path.exists(station_dir):
+            shutil.rmtree(station_dir)
+        ds.write_dataset(table, table_dir, format=DATASET_FORMATS[results_format], partitioning=_partitioning(table_name),
+                         basename_template=f'part-{{i}}.{FORMAT_EXTENSIONS[results_format]}',
+                         existing_data_behavior='overwrite_or_ignore', preserve_order=True)
+        written.append(table_name)
+    return written
+
+
+def read_results(table_name, results_path=RESULTS_PATH, site_nos=None, water_years=None, columns=None):
+    """
+    Reads a table of the results dataset. Arrow files are memory-mapped, and only the
+    partitions of the requested sites and water years are opened.
+
+    Args:
+        table_name (str): The table, from RESULT_TABLES.
+        results_path (str, optional): The root directory of the dataset.
+        site_nos (list, optional): The sites to read, all sites when None.
+        water_years (list, optional): The water years to read, for the daily series.
+        columns (list, optional): The columns to read besides the partition columns, all columns when None.
+
+    Returns:
+        pd.DataFrame: The rows of the requested partitions, with the partition columns.
+    """
+    if table_name not in RESULT_TABLES:
+        raise ValueError(f"Unknown results table '{table_name}', expected one of {list(RESULT_TABLES)}")
+    partitions = RESULT_TABLES[table_name]
+    table_dir = os.path.join(results_path, table_name)
+    results_format = _table_format(table_dir)
+    if results_format is None:
+        raise FileNotFoundError(f"No results stored for table '{table_name}' in {results_path}")
+
+    dataset = ds.dataset(table_dir, format=DATASET_FORMATS[results_format], partitioning=_partitioning(table_name))
+    filters = []
+    if site_nos is not None:
+        filters.append(ds.field('site_no').isin([str(site_no) for site_no in site_nos]))
+    if water_years is not None:
+        if 'water_year' not in partitions:
+            raise ValueError(f"Table '{table_name}' is not partitioned by water year")
+        filters.append(ds.field('water_year').isin([int(year) for year in water_years]))
+    expression = None
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+
+    # the dataset only finds the files of the requested partitions, which are then
+    # memory-mapped one by one, several times faster than a dataset scan of the many
+    # small water year files
+    fragments = list(dataset.get_fragments(filter=expression))
+    if not fragments:
+        table = dataset.schema.empty_table()
+    else:
+        tables = [_read_file(fragment.path, results_format) for fragment in fragments]
+        lengths = [part.num_rows for part in tables]
+        table = pa.concat_tables(tables)
+        keys = [ds.get_partition_keys(fragment.partition_expression) for fragment in fragments]
+        for key in partitions:
+            values = np.repeat(np.array([partition[key] for partition in keys], dtype=object), lengths)
+            table = table.append_column(key, pa.array(values, PARTITION_TYPES[key]))
+    # partition columns come last in the files, the stored column order is in the pandas metadata
+    stored = [column['name'] for column in (table.schema.pandas_metadata or {}).get('columns', [])]
+    order = [column for column in stored if column in table.column_names]
+    order += [column for column in table.column_names if column not in order]
+    table = table.select([column for column in order if columns is None or column in columns or column in partitions])
+    # split_blocks keeps every column in its own block, so the columns of a single
+    # mapped file without nulls are handed to pandas without a copy
+    return table.to_pandas(split_blocks=True)
+
+
+def load_station_results(site_no, results_path=RESULTS_PATH):
+    """
+    Reads every stored table of one station, for reporting or re-rendering its
+    results without running the analysis again.
+
+    Args:
+        site_no (str): The USGS site ID.
+        results_path (str, optional): The root directory of the dataset.
+
+    Returns:
+        dict: DataFrames by table name for the tables stored for the station, the
+        yearly summaries indexed by year as they were exported.
+    """
+    results = {}
+    for table_name in RESULT_TABLES:
+        if not os.path.exists(os.path.join(results_path, table_name, f'site_no={site_no}')):
+            continue
+        df = read_results(table_name, results_path, site_nos=[site_no]).drop(columns='site_no')
+        if 'water_year' in RESULT_TABLES[table_name]:
+            # the water year partitions are not read in date order
+            df = df.sort_values('date').reset_index(drop=True)
+        if table_name in YEARLY_TABLES:
+            df = df.set_index('year')
+        results[table_name] = df
+    return results
@@ -0,0 +1,198 @@
+import io
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import requests
+
+from utils.common_utils.data_processing import USGS_SITE_SERVICE_URL, build_site_url
+from utils.common_utils.rdb_parser import read_rdb
+
+
+logger = logging.getLogger(__name__)
+
+SITE_INDEX_PATH = os.path.join("data", "cache", "site_index.sqlite")
+
+SITE_COLUMNS = ['site_no', 'station_nm', 'dec_lat_va', 'dec_long_va', 'drain_area_va', 'begin_date', 'end_date']
+
+
+def _connect(index_path):
+    """
+    Opens the site index database, creating the sites table on first use.
+
+    Args:
+        index_path (str): The path to the SQLite site index.
+
+    Returns:
+        sqlite3.Connection: An open connection to the index.
+    """
+    index_dir = os.path.dirname(index_path)
+    if index_dir and not os.path.exists(index_dir):
+        os.makedirs(index_dir)
+    conn = sqlite3.connect(index_path, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sites ("
+        "site_no TEXT PRIMARY KEY, station_nm TEXT, dec_lat_va REAL, dec_long_va REAL, "
+        "drain_area_va REAL, begin_date TEXT, end_date TEXT)"
+    )
+    return conn
+
+
+def site_records(table):
+    """
+    Reduces a USGS site service table to one row per site. Both the expanded site
+    output (name, coordinates, drainage area) and the series catalog (period of
+    record) are accepted; columns a table does not have are left empty. The period of
+    record is taken from the daily mean discharge series (parameter 00060, statistic
+    00003) when the table lists series.
+
+    Args:
+        table (pd.DataFrame): The parsed site service RDB table.
+
+    Returns:
+        pd.DataFrame: The site records with the SITE_COLUMNS columns, dates as YYYY-MM-DD strings.
+    """
+    if table.empty or 'site_no' not in table.columns:
+        return pd.DataFrame(columns=SITE_COLUMNS)
+    records = pd.DataFrame({'site_no': table['site_no'].astype(str).to_numpy()})
+    records['station_nm'] = table['station_nm'].to_numpy() if 'station_nm' in table.columns else None
+    for column in ('dec_lat_va', 'dec_long_va', 'drain_area_va'):
+        records[column] = pd.to_numeric(table[column], errors='coerce').to_numpy() if column in table.columns else np.nan
+    for column in ('begin_date', 'end_date'):
+        if column in table.columns:
+            records[column] = pd.to_datetime(table[column], format='ISO8601', errors='coerce').to_numpy()
+        else:
+            records[column] = pd.NaT
+    if 'parm_cd' in table.columns:
+        discharge = table['parm_cd'].eq('00060').to_numpy()
+        if 'data_type_cd' in table.columns:
+            discharge &= table['data_type_cd'].eq('dv').to_numpy()
+        # the daily series of a gage also lists its max, min and other statistics,
+        # whose periods of record differ from the daily mean
+        if 'stat_cd' in table.columns:
+            discharge &= table['stat_cd'].eq('00003').to_numpy()
+        records.loc[~discharge, ['begin_date', 'end_date']] = pd.NaT
+
+    records = records.groupby('site_no', sort=False).agg(
+        station_nm=('station_nm', 'first'),
+        dec_lat_va=('dec_lat_va', 'first'),
+        dec_long_va=('dec_long_va', 'first'),
+        drain_area_va=('drain_area_va', 'first'),
+        begin_date=('begin_date', 'min'),
+        end_date=('end_date', 'max'),
+    ).reset_index()
+    for column in ('begin_date', 'end_date'):
+        records[column] = records[column].dt.strftime('%Y-%m-%d')
+    return records[SITE_COLUMNS]
+
+
+def _store_sites(conn, records):
+    rows = [
+        tuple(None if pd.isna(value) else value for value in row)
+        for row in records[SITE_COLUMNS].itertuples(index=False, name=None)
+    ]
+    # a site loaded from both the expanded output and the series catalog keeps the
+    # fields of each, so only values that are present replace stored ones
+    conn.executemany(
+        "INSERT INTO sites (site_no, station_nm, dec_lat_va, dec_long_va, drain_area_va, begin_date, end_date) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(site_no) DO UPDATE SET "
+        "station_nm = COALESCE(excluded.station_nm, sites.station_nm), "
+        "dec_lat_va = COALESCE(excluded.dec_lat_va, sites.dec_lat_va), "
+        "dec_long_va = COALESCE(excluded.dec_long_va, sites.dec_long_va), "
+        "drain_area_va = COALESCE(excluded.drain_area_va, sites.drain_area_va), "
+        "begin_date = COALESCE(excluded.begin_date, sites.begin_date), "
+        "end_date = COALESCE(excluded.end_date, sites.end_date)",
+        rows,
+    )
+    return len(rows)
+
+
+def load_site_rdb(source, index_path=SITE_INDEX_PATH):
+    """
+    Bulk loads a USGS site service RDB file (for example every stream gage of a state)
+    into the site index.
+
+    Args:
+        source: A file path, open file or iterable of str/bytes lines.
+        index_path (str, optional): The path to the SQLite site index.
+
+    Returns:
+        int: The number of sites loaded.
+    """
+    records = site_records(read_rdb(source))
+    with closing(_connect(index_path)) as conn:
+        count = _store_sites(conn, records)
+        conn.commit()
+    return count
+
+
+def lookup_site(site_id, index_path=SITE_INDEX_PATH):
+    """
+    Looks up a site in the local index without using the network.
+
+    Args:
+        site_id (str): The USGS site ID.
+        index_path (str, optional): The path to the SQLite site index.
+
+    Returns:
+        dict: The site record keyed by SITE_COLUMNS, or None when the site is not indexed.
+    """
+    with closing(_connect(index_path)) as conn:
+        row = conn.execute(f"SELECT {', '.join(SITE_COLUMNS)} FROM sites WHERE site_no = ?", (str(site_id),)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(SITE_COLUMNS, row))
+
+
+def fetch_site(site_id, session=None, base_url=USGS_SITE_SERVICE_URL):
+    """
+    Downloads the site record of a gage from the USGS site service.
+
+    Args:
+        site_id (str): The USGS site ID.
+        session (requests.Session, optional): Session used for the requests.
+        base_url (str, optional): The USGS site service to request from.
+
+    Returns:
+        pd.DataFrame: The site records of the expanded output and the series catalog.
+    """
+    requester = session or requests
+    response = requester.get(build_site_url(site_id, base_url=base_url), timeout=60)
+    response.raise_for_status()
+    tables = [site_records(read_rdb(io.StringIO(response.text)))]
+    try:
+        response = requester.get(build_site_url(site_id, series_catalog=True, base_url=base_url), timeout=60)
+        response.raise_for_status()
+        tables.append(site_records(read_rdb(io.StringIO(response.text))))
+    except requests.RequestException as e:
+        # the site service answers 404 for gages without daily discharge
+        logger.warning("Could not download the period of record of gage %s: %s", site_id, e)
+    return pd.concat(tables, ignore_index=True)
+
+
+def get_site(site_id, index_path=SITE_INDEX_PATH, session=None, base_url=USGS_SITE_SERVICE_URL):
+    """
+    Returns the site record of a gage from the local index. Sites that are not indexed
+    yet are downloaded from the USGS site service once and added to the index.
+
+    Args:
+        site_id (str): The USGS site ID.
+        index_path (str, optional): The path to the SQLite site index.
+        session (requests.Session, optional): Session used for any download.
+        base_url (str, optional): The USGS site service to request from.
+
+    Returns:
+        dict: The site record keyed by SITE_COLUMNS, or None when USGS has no such site.
+    """
+    site = lookup_site(site_id, index_path)
+    if site is not None:
+        return site
+    records = fetch_site(site_id, session=session, base_url=base_url)
+    with closing(_connect(index_path)) as conn:
+        _store_sites(conn, records)
+        conn.commit()
+    return lookup_site(site_id, index_path)
@@ -0,0 +1,272 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from utils.common_utils.flow_series import validity_mask
+
+
+class P2Quantile:
+    """
+    Streaming estimate of one quantile with the P-squared algorithm of Jain and
+    Chlamtac: five markers are kept and adjusted with every value, so the memory and
+    the cost of an update are constant.
+    """
+
+    def __init__(self, p=0.5):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(x)
+            heights.sort()
+            return
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self):
+        if not self.heights:
+            return np.nan
+        if len(self.heights) < 5:
+            # exact quantile of the first few values
+            return float(np.quantile(self.heights, self.p))
+        return self.heights[2]
+
+
+class StationState:
+    """
+    Running state of the assessments of one station, updated in O(new rows) as daily
+    values arrive instead of recomputing the whole period of record.
+
+    The state holds the per-year count, sum, max and min of the days above and below
+    each threshold, the last flow (the tail of the derivative, None when the last day
+    has no usable flow), and running
+    statistics of the flow derivatives: a Welford mean and variance and a P-squared
+    median sketch, which give the global outlier bounds (median +/- 3 std) of
+    identify_derivative_outliers. The metadata dict is saved with the state, for the
+    caller to record what the state was built from.
+    """
+
+    def __init__(self, site_no=None, above_thresholds=(200,), below_thresholds=(35, 10), n_sigma=3):
+        self.site_no = site_no
+        self.n_sigma = n_sigma
+        self.last_date = None
+        self.last_flow = None
+        self.yearly = {('above', float(t)): {} for t in above_thresholds}
+        self.yearly.update({('below', float(t)): {} for t in below_thresholds})
+        self.derivative_count = 0
+        self.derivative_mean = 0.0
+        self.derivative_m2 = 0.0
+        self.derivative_median = P2Quantile(0.5)
+        self.metadata = {}
+
+    def append(self, df):
+        """
+        Adds new daily values to the state. Days on or before the last day already
+        added are skipped, so appending an overlapping download is safe.
+
+        Args:
+            df (pd.DataFrame): The new daily values with 'date' and 'avg_flow' columns, in date order,
+                and optionally 'valid' or 'qc' columns.
+
+        Returns:
+            pd.DataFrame: The appended days with their 'flow_derivative' and their
+            'is_outlier' flag against the updated outlier bounds.
+        """
+        dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+        new = np.ones(len(dates), dtype=bool) if self.last_date is None else dates > np.datetime64(self.last_date, 'ns')
+        dates = dates[new]
+        flows = df['avg_flow'].to_numpy(dtype=float)
+        # days without a usable flow (see validity_mask) count as missing
+        valid = df['valid'].to_numpy(dtype=bool) if 'valid' in df.columns else validity_mask(flows, df['qc'] if 'qc' in df.columns else None)
+        flows = np.where(valid, flows, np.nan)[new]
+        if len(dates) == 0:
+            return pd.DataFrame({'date': dates, 'avg_flow': flows, 'flow_derivative': flows, 'is_outlier': np.zeros(0, dtype=bool)})
+
+        # same as calculate_flow_dirivatives over the whole record: there is no
+        # derivative across a missing day or next to a day without flow
+        previous = np.concatenate(([np.nan if self.last_flow is None else self.last_flow], flows[:-1]))
+        previous_dates = np.concatenate(([np.datetime64('NaT', 'ns') if self.last_date is None else np.datetime64(self.last_date, 'ns')], dates[:-1]))
+        derivative = np.where(dates - previous_dates == np.timedelta64(1, 'D'), flows - previous, np.nan)
+        self._update_derivative_stats(derivative[~np.isnan(derivative)])
+        self._update_yearly(dates, flows)
+        self.last_date = pd.Timestamp(dates[-1]).isoformat()
+        # a last day without a usable flow has no derivative to the next day
+        self.last_flow = None if np.isnan(flows[-1]) else float(flows[-1])
+
+        low, high = self.outlier_bounds()
+        return pd.DataFrame({
+            'date': dates,
+            'avg_flow': flows,
+            'flow_derivative': derivative,
+            'is_outlier': (derivative > high) | (derivative < low),
+        })
+
+    def _update_derivative_stats(self, derivative):
+        # Chan's parallel update merges the batch mean and variance into the running ones
+        n = len(derivative)
+        if n == 0:
+            return
+        batch_mean = derivative.mean()
+        batch_m2 = ((derivative - batch_mean) ** 2).sum()
+        total = self.derivative_count + n
+        delta = batch_mean - self.derivative_mean
+        self.derivative_mean += delta * n / total
+        self.derivative_m2 += batch_m2 + delta ** 2 * self.derivative_count * n / total
+        self.derivative_count = total
+        for value in derivative:
+            self.derivative_median.update(float(value))
+
+    def _update_yearly(self, dates, flows):
+        years = dates.astype('datetime64[Y]').astype('int64') + 1970
+        for (direction, threshold), by_year in self.yearly.items():
+            mask = flows > threshold if direction == 'above' else flows < threshold
+            if not mask.any():
+                continue
+            for year in np.unique(years[mask]):
+                values = flows[mask & (years == year)]
+                count, total, high, low = by_year.get(int(year), (0, 0.0, -np.inf, np.inf))
+                by_year[int(year)] = (count + len(values), total + float(values.sum()),
+                                      max(high, float(values.max())), min(low, float(values.min())))
+
+    @property
+    def derivative_std(self):
+        """
+        The sample standard deviation of all flow derivatives.
+        """
+        if self.derivative_count < 2:
+            return np.nan
+        return float(np.sqrt(self.derivative_m2 / (self.derivative_count - 1)))
+
+    def outlier_bounds(self):
+        """
+        Returns the lower and upper derivative bounds of the global outlier rule.
+
+        Returns:
+            tuple: The (low, high) bounds, median -/+ n_sigma standard deviations.
+        """
+        median = self.derivative_median.value
+        std = self.derivative_std
+        return median - self.n_sigma * std, median + self.n_sigma * std
+
+    def yearly_stats(self, direction, threshold):
+        """
+        Returns the yearly threshold statistics in the layout of yearly_threshold_stats.
+
+        Args:
+            direction (str): 'above' or 'below'.
+            threshold (float): One of the thresholds the state was created with.
+
+        Returns:
+            pd.DataFrame: One row per year with 'total_days_<direction>_threshold',
+            'years_after_previous', 'average_flow', 'max_flow' and 'min_flow'.
+        """
+        by_year = self.yearly[(direction, float(threshold))]
+        years = np.array(sorted(by_year), dtype='int64')
+        stats = np.array([by_year[year] for year in years], dtype=float).reshape(-1, 4)
+        return pd.DataFrame({
+            f'total_days_{direction}_threshold': stats[:, 0].astype('int64'),
+            'years_after_previous': np.diff(years, prepend=years[:1]).astype('int64'),
+            'average_flow': stats[:, 1] / stats[:, 0] if len(years) else stats[:, 1],
+            'max_flow': stats[:, 2],
+            'min_flow': stats[:, 3],
+        }, index=years.astype(str))
+
+    def to_dict(self):
+        """
+        Returns the state as JSON-serializable data.
+        """
+        return {
+            'site_no': self.site_no,
+            'n_sigma': self.n_sigma,
+            'last_date': self.last_date,
+            'last_flow': self.last_flow,
+            'yearly': [
+                {'direction': direction, 'threshold': threshold, 'years': {str(year): list(stats) for year, stats in by_year.items()}}
+                for (direction, threshold), by_year in self.yearly.items()
+            ],
+            'derivative': {
+                'count': self.derivative_count, 'mean': self.derivative_mean, 'm2': self.derivative_m2,
+                'median': vars(self.derivative_median),
+            },
+            'metadata': self.metadata,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a state from the output of to_dict.
+        """
+        state = cls(data['site_no'], above_thresholds=(), below_thresholds=(), n_sigma=data['n_sigma'])
+        state.last_date = data['last_date']
+        state.last_flow = data['last_flow']
+        for entry in data['yearly']:
+            state.yearly[(entry['direction'], float(entry['threshold']))] = {
+                int(year): tuple(stats) for year, stats in entry['years'].items()
+            }
+        derivative = data['derivative']
+        state.derivative_count = derivative['count']
+        state.derivative_mean = derivative['mean']
+        state.derivative_m2 = derivative['m2']
+        vars(state.derivative_median).update(derivative['median'])
+        state.metadata = data.get('metadata', {})
+        return state
+
+    def save(self, path):
+        """
+        Writes the state to a JSON file.
+
+        Args:
+            path (str): The path of the state file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a state written by save.
+
+        Args:
+            path (str): The path of the state file.
+
+        Returns:
+            StationState: The station state.
+        """
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
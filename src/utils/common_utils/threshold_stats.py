@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+
+def yearly_threshold_stats(thresh_df, count_column):
+    """
+    Summarizes the days of a threshold subset by year in a single groupby: the number
+    of days, the mean, max and min flow, and the years since the previous year that
+    had days in the subset.
+
+    Args:
+        thresh_df (pd.DataFrame): The days above or below a threshold, with 'year' and 'avg_flow' columns.
+        count_column (str): The name of the column holding the number of days.
+
+    Returns:
+        pd.DataFrame: One row per year (indexed by the year as a string, in order of
+        appearance) with count_column, 'years_after_previous', 'average_flow',
+        'max_flow' and 'min_flow' columns.
+    """
+    stats = thresh_df.groupby('year', sort=False)['avg_flow'].agg(['size', 'mean', 'max', 'min'])
+    years = stats.index.to_series()
+    summary = pd.DataFrame({
+        count_column: stats['size'].to_numpy(),
+        'years_after_previous': years.diff().fillna(0).astype('int64').to_numpy(),
+        'average_flow': stats['mean'].to_numpy(),
+        'max_flow': stats['max'].to_numpy(),
+        'min_flow': stats['min'].to_numpy(),
+    }, index=years.astype(str).to_numpy())
+    return summary
+
+
+def threshold_sweep(df, thresholds, direction='below'):
+    """
+    Computes the yearly threshold statistics for many thresholds in one pass. The
+    flows of every year are sorted once, and each threshold is then answered with a
+    binary search plus a cumulative sum instead of re-filtering the frame.
+
+    Args:
+        df (pd.DataFrame): The daily flow data with 'year' and 'avg_flow' columns. Days
+            outside the 'valid' mask, when the frame has one, are left out.
+        thresholds (array-like): The flow thresholds to evaluate.
+        direction (str): 'above' counts days with flow above each threshold, 'below'
+            days with flow below it (both strict, as in the threshold subsets).
+
+    Returns:
+        pd.DataFrame: One row per threshold and year with 'threshold', 'year',
+        'total_days_<direction>_threshold', 'average_flow', 'max_flow' and 'min_flow'.
+        Years without any such days have a count of 0 and NaN flows.
+    """
+    if direction not in ('above', 'below'):
+        raise ValueError("direction must be 'above' or 'below'")
+    thresholds = np.asarray(thresholds, dtype=float)
+    valid = df['avg_flow'].notna().to_numpy()
+    if 'valid' in df.columns:
+        valid &= df['valid'].to_numpy(dtype=bool)
+    years = df['year'].to_numpy()[valid]
+    flows = df['avg_flow'].to_numpy(dtype=float)[valid]
+
+    order = np.lexsort((flows, years))
+    years, flows = years[order], flows[order]
+    unique_years, starts = np.unique(years, return_index=True)
+    ends = np.append(starts[1:], len(flows))
+
+    n_years, n_thresholds = len(unique_years), len(thresholds)
+    days = np.zeros((n_thresholds, n_years), dtype='int64')
+    totals = np.zeros((n_thresholds, n_years))
+    max_flow = np.full((n_thresholds, n_years), np.nan)
+    min_flow = np.full((n_thresholds, n_years), np.nan)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        block = flows[start:end]
+        cumulative = np.concatenate(([0.0], np.cumsum(block)))
+        if direction == 'above':
+            split = np.searchsorted(block, thresholds, side='right')
+            days[:, i] = len(block) - split
+            totals[:, i] = cumulative[-1] - cumulative[split]
+            has_days = days[:, i] > 0
+            max_flow[has_days, i] = block[-1]
+            min_flow[has_days, i] = block[split[has_days]]
+        else:
+            split = np.searchsorted(block, thresholds, side='left')
+            days[:, i] = split
+            totals[:, i] = cumulative[split]
+            has_days = split > 0
+            max_flow[has_days, i] = block[split[has_days] - 1]
+            min_flow[has_days, i] = block[0]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_flow = np.where(days > 0, totals / days, np.nan)
+    return pd.DataFrame({
+        'threshold': np.repeat(thresholds, n_years),
+        'year': np.tile(unique_years, n_thresholds),
+        f'total_days_{direction}_threshold': days.ravel(),
+        'average_flow': average_flow.ravel(),
+        'max_flow': max_flow.ravel(),
+        'min_flow': min_flow.ravel(),
+    })
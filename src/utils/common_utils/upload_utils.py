@@ -0,0 +1,199 @@
+import gzip
+import io
+import os
+import zipfile
+
+import pandas as pd
+
+from utils.common_utils.memo import memoize
+
+
+# upload file types accepted by the pages, gzip and zip files hold one CSV
+UPLOAD_TYPES = ["csv", "txt", "gz", "zip"]
+
+# date formats tried on a sample of the date column, month-first before day-first as
+# in pandas' own inference
+DATE_FORMATS = (
+    '%m/%d/%Y', '%Y-%m-%d', '%m/%d/%y', '%Y/%m/%d', '%m-%d-%Y', '%d/%m/%Y', '%d-%b-%Y', '%d-%b-%y', '%Y%m%d',
+    '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M %p', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+)
+
+# day-first and month-first date formats, with their separator and the order of the
+# year, month and day fields, rebuilt as ISO dates before parsing since pandas parses
+# ISO dates many times faster than other fixed formats
+ISO_REORDERED_FORMATS = {
+    '%m/%d/%Y': ('/', (2, 0, 1)),
+    '%m-%d-%Y': ('-', (2, 0, 1)),
+    '%d/%m/%Y': ('/', (2, 1, 0)),
+}
+
+SNIFF_ROWS = 200
+
+# rows of the sample shown before the columns are chosen
+PREVIEW_ROWS = 10
+
+# characters spreadsheet exports wrap dates in, e.g. ="10/01/1990"
+DATE_WRAPPER_PATTERN = r'[="]'
+
+
+def upload_bytes(source):
+    """
+    Returns the content of an uploaded or local file.
+
+    Args:
+        source: A file path or a binary file object such as a Streamlit UploadedFile.
+
+    Returns:
+        bytes: The file content.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+
+def open_upload(raw):
+    """
+    Opens the content of an upload for reading, decompressing gzip and zip files.
+    Compression is detected from the content, not the file name. A zip file is read
+    from its first CSV or text member.
+
+    Args:
+        raw (bytes): The file content.
+
+    Returns:
+        file: A binary file object positioned at the start of the data.
+    """
+    if raw[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=io.BytesIO(raw))
+    if raw[:4] == b'PK\x03\x04':
+        archive = zipfile.ZipFile(io.BytesIO(raw))
+        members = [name for name in archive.namelist() if not name.endswith('/')]
+        tables = [name for name in members if name.lower().endswith(('.csv', '.txt'))]
+        if not members:
+            raise ValueError("The zip file is empty")
+        return archive.open((tables or members)[0])
+    return io.BytesIO(raw)
+
+
+# the parses are memoized on the file content, which the cache key holds as a sha1
+# digest, so Streamlit reruns with the same upload do not read the file again
+
+@memoize(max_entries=16)
+def _read_header(raw, nrows):
+    return pd.read_csv(open_upload(raw), nrows=nrows, dtype=str, on_bad_lines='skip', header=0)
+
+
+@memoize(max_entries=8)
+def _read_columns(raw, date_col, flow_col):
+    usecols = list(dict.fromkeys([date_col, flow_col]))
+    try:
+        return pd.read_csv(open_upload(raw), usecols=usecols, dtype={date_col: str, flow_col: 'float64'},
+                           on_bad_lines='skip', header=0)[usecols]
+    except ValueError:
+        data = pd.read_csv(open_upload(raw), usecols=usecols, dtype=str, on_bad_lines='skip', header=0)[usecols]
+        data[flow_col] = pd.to_numeric(data[flow_col], errors='coerce')
+        return data
+
+
+def read_upload_header(source, nrows=SNIFF_ROWS):
+    """
+    Reads the first rows of an upload, for choosing the date and flow columns and
+    previewing the file. The rest of the file is not parsed.
+
+    Args:
+        source: A file path or binary file object.
+        nrows (int, optional): The number of data rows read.
+
+    Returns:
+        pd.DataFrame: The first rows with every column as text.
+    """
+    return _read_header(upload_bytes(source), nrows)
+
+
+def read_upload_columns(source, date_col, flow_col):
+    """
+    Reads only the date and flow columns of an upload, the dates as text and the flows
+    as float64. Flow columns with text values such as 'Ice' are read again as text and
+    converted, with the text values becoming NaN. The result is cached by the file
+    content, so the file is parsed once per choice of columns.
+
+    Args:
+        source: A file path or binary file object.
+        date_col (str): The date column name.
+        flow_col (str): The flow column name.
+
+    Returns:
+        pd.DataFrame: The date and flow columns.
+    """
+    return _read_columns(upload_bytes(source), date_col, flow_col)
+
+
+def sniff_date_format(sample):
+    """
+    Finds the first of DATE_FORMATS that parses every date of a sample.
+
+    Args:
+        sample (pd.Series): Date strings.
+
+    Returns:
+        str: The date format, or None when no format fits every date.
+    """
+    sample = sample.dropna()
+    sample = sample[sample.str.strip() != '']
+    if sample.empty:
+        return None
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(sample, format=date_format, errors='coerce').notna().all():
+            return date_format
+    return None
+
+
+def _iso_dates(values, separator, order):
+    """
+    Rearranges separated date strings into ISO date strings, None where a value does
+    not have three fields.
+    """
+    iso = []
+    for value in values:
+        try:
+            fields = value.strip().split(separator)
+            iso.append(f"{fields[order[0]]}-{fields[order[1]]}-{fields[order[2]]}" if len(fields) == 3 else None)
+        except AttributeError:
+            iso.append(None)
+    return iso
+
+
+def parse_upload_dates(values):
+    """
+    Converts the date column of an upload to datetimes at midnight. The format is
+    sniffed once from the first rows, so the whole column is parsed with a fixed
+    format, and '=' and '"' wrappers are only stripped when the sample has them.
+    Slash and dash separated dates are rearranged into ISO dates first.
+    Dates that do not parse become NaT.
+
+    Args:
+        values (pd.Series): The date column, as text or already as datetimes.
+
+    Returns:
+        pd.Series: The dates.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    if values.dtype != object:
+        values = values.astype(str)
+    sample = values.head(SNIFF_ROWS)
+    if sample.str.contains(DATE_WRAPPER_PATTERN).any():
+        values = values.str.replace(DATE_WRAPPER_PATTERN, '', regex=True)
+        sample = values.head(SNIFF_ROWS)
+    date_format = sniff_date_format(sample)
+    if date_format is None:
+        dates = pd.to_datetime(values, errors='coerce')
+    elif date_format in ISO_REORDERED_FORMATS:
+        iso = pd.Series(_iso_dates(values, *ISO_REORDERED_FORMATS[date_format]), index=values.index, dtype=object)
+        dates = pd.to_datetime(iso, format='%Y-%m-%d', errors='coerce')
+    else:
+        dates = pd.to_datetime(values, format=date_format, errors='coerce')
+    return dates.dt.normalize()
@@ -1,12 +1,16 @@
 
-import os
 import pandas as pd
 import matplotlib.pyplot as plt
-import streamlit as st
-import folium
-from streamlit_folium import folium_static
 import re
-from utils.common_utils.data_processing import download_usgs_data, extract_site_info, download_site_coords
+from utils.common_utils.messages import report_error
+from utils.common_utils.water_year import water_year_calendar
+from utils.common_utils.flow_series import season_categorical, complete_daily_calendar
+from utils.common_utils.flow_matrix import season_matrices
+from utils.common_utils.rdb_parser import read_daily_values
+from utils.common_utils.gage_cache import get_daily_values
+from utils.common_utils.memo import memoize
+from utils.common_utils.upload_utils import parse_upload_dates
+from utils.common_utils.instrumentation import stage
 
 
 
@@ -15,8 +19,9 @@ from utils.common_utils.data_processing import download_usgs_data, extract_site_
 def water_year_flows(df):
     if df is not None:
         
-        df['water_year'] = df['date'].apply(lambda x: x.year + 1 if x.month >= 10 else x.year)
-        df['day_of_waterYear'] = df['date'].apply(lambda x: (x - pd.Timestamp(year=x.year if x.month >= 10 else x.year - 1, month=10, day=1)).days + 1)
+        calendar = water_year_calendar(df['date'])
+        df['water_year'] = calendar['water_year']
+        df['day_of_waterYear'] = calendar['day_of_waterYear']
         return df
     else:
         return pd.DataFrame(columns=['date', 'avg_flow'])
@@ -26,23 +31,17 @@ def return_waterYr_dict():
 
 def clean_manual_date_column(df, date_col):
     """
-    Cleans and converts a date column to datetime format.
+    Cleans and converts a date column to datetime format. The date format is sniffed
+    from the first rows and '=' and '"' characters are removed when present (see
+    parse_upload_dates).
     
     Args:
         date_series (pd.Series): The date column to clean.
         
     Returns:
-        pd.Series: The cleaned date column in datetime format.
+        pd.Series: The cleaned date column in datetime format, without the time part.
     """
-    
-    #remove any '=' characters from the date column
-    
-    df[f"{date_col}"] = df[f"{date_col}"].astype(str).str.replace('"', '', regex=True)
-    df[f"{date_col}"] = df[f"{date_col}"].astype(str).str.replace('=', '', regex=True)
-    df[f"{date_col}"] = pd.to_datetime(df[f"{date_col}"], errors='coerce')
-
-    # Remove time part, keeping only the date
-    df[f"{date_col}"] = df[f"{date_col}"].dt.date
+    df[f"{date_col}"] = parse_upload_dates(df[f"{date_col}"])
     
     return df
 
@@ -61,6 +60,7 @@ def remove_nan_rows(df, col_name):
     return df_cleaned
     
     
+@memoize()
 def manual_upload_daily_flow_data(data, date_col, flow_col):
     """
     Loads the peak flow data from an uploaded file into a pandas DataFrame.
@@ -75,8 +75,10 @@ def manual_upload_daily_flow_data(data, date_col, flow_col):
         
         
         
-        df = data[[date_col, flow_col]]
-        df = clean_manual_date_column(df, date_col)
+        with stage("parse upload", rows=len(data)):
+            df = data[[date_col, flow_col]]
+            df = clean_manual_date_column(df, date_col)
+        df = remove_nan_rows(df, date_col)
         df = remove_nan_rows(df, flow_col)
         
 
@@ -85,18 +87,12 @@ def manual_upload_daily_flow_data(data, date_col, flow_col):
         df.columns = ['date', 'avg_flow']
         df['date'] = pd.to_datetime(df['date'])
         df['avg_flow'] = pd.to_numeric(df['avg_flow'], errors='coerce')
-        #add column contining just the year
-        df['year'] = df['date'].dt.year
-        df['month'] = df['date'].dt.month
-        df['day'] = df['date'].dt.day
-        df.loc[(df["month"] > 3) & (df["month"] < 6), "season"] = "Spring"
-        df.loc[(df["month"] > 5) & (df["month"] < 9), "season"] = "Summer"
-        df.loc[(df["month"] > 8) & (df["month"] < 12), "season"] = "Fall"
-        df.loc[(df["month"] < 4) | (df["month"] == 12), "season"] = "Winter"
+        with stage("add_calendar_columns", rows=len(df)):
+            df = add_calendar_columns(complete_daily_calendar(df))
         
         return df
     except Exception as e:
-        st.error(f"Error loading peak flow data: {e}")
+        report_error(f"Error loading peak flow data: {e}")
        
         return None
 
@@ -112,105 +108,97 @@ def load_flow_data(file_path):
         pd.DataFrame: The loaded peak flow data.
     """
     try:
-        df = pd.read_csv(file_path, delimiter='\t', on_bad_lines='skip', skiprows=29, header = None)
-        
-        df.columns = ['agency_cd', 'site_no', 'date', 'avg_flow', 'qc']
-        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
-        df['avg_flow'] = pd.to_numeric(df['avg_flow'], errors='coerce')
-        #add column contining just the year
-        df['year'] = df['date'].dt.year
-        df['month'] = df['date'].dt.month
-        df['day'] = df['date'].dt.day
-        df.loc[(df["month"] > 3) & (df["month"] < 6), "season"] = "Spring"
-        df.loc[(df["month"] > 5) & (df["month"] < 9), "season"] = "Summer"
-        df.loc[(df["month"] > 8) & (df["month"] < 12), "season"] = "Fall"
-        df.loc[(df["month"] < 4) | (df["month"] == 12), "season"] = "Winter"
-        #add seasons to the dataframe
-        
+        df = read_daily_values(file_path)
+        df = add_calendar_columns(complete_daily_calendar(df))
         
         return df
     except Exception as e:
-        st.error(f"Error loading peak flow data: {e}")
+        report_error(f"Error loading peak flow data: {e}")
        
         return None
-    
-
 
 
-
-
-def clean_temp_files(file_path, info_path):
+@memoize()
+def load_site_flow_data(site_id, begin_year):
     """
-    Cleans up temporary files created during the download process.
+    Loads the daily flow data for a USGS site from the local gage cache. Only the days
+    missing from the cache are downloaded, so repeat analyses do not need the network.
     
     Args:
-        file_path (str): The path to the downloaded file.
-        info_path (str): The path to the info file.
+        site_id (str): The USGS site ID.
+        begin_year (str): The year to start the analysis from.
+        
+    Returns:
+        pd.DataFrame: The loaded daily flow data.
     """
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if os.path.exists(info_path):
-            os.remove(info_path)
+        with stage("gage cache") as cache_stage:
+            df = get_daily_values(site_id, f"{begin_year}-01-01")
+            cache_stage.rows = len(df)
+        if df.empty:
+            report_error(f"No daily flow data found for gage {site_id} since {begin_year}.")
+            return None
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+        with stage("add_calendar_columns", rows=len(df)):
+            df = add_calendar_columns(complete_daily_calendar(df))
+        
+        return df
     except Exception as e:
-        st.error(f"Error cleaning up temporary files: {e}")
+        report_error(f"Error loading peak flow data: {e}")
+       
+        return None
 
 
-            
-                
-def create_location_plot(info_path, site_id):
-    location_df = extract_site_info(info_path)
-    attr = ('Tiles courtesy of the <a href="https://usgs.gov/">U.S. Geological Survey</a>')
-    tiles = 'https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryTopo/MapServer/tile/{z}/{y}/{x}'
-    
-    m = folium.Map(location=[location_df["latitude"],location_df["longitude"]], tiles=tiles,attr = "Aerial Imagery", zoom_start=16)
+def add_calendar_columns(df):
+    """
+    Adds the year, month, day and season columns derived from the date column and
+    stores the text code columns as categoricals.
     
-    folium.Marker(
-        [location_df["latitude"], location_df["longitude"]], popup=f"Gage {site_id} location", tooltip=f"Gage {site_id} location"
-    ).add_to(m)
+    Args:
+        df (pd.DataFrame): The DataFrame containing a datetime 'date' column.
+        
+    Returns:
+        pd.DataFrame: The DataFrame with the calendar columns added.
+    """
+    #add column contining just the year, using the narrowest integer types that fit
+    df['year'] = df['date'].dt.year.astype('int16')
+    df['month'] = df['date'].dt.month.astype('int8')
+    df['day'] = df['date'].dt.day.astype('int8')
+    #add seasons to the dataframe as a categorical looked up from the month
+    df['season'] = season_categorical(df['month'])
+    #repeated text codes are stored once per value
+    for col in ['agency_cd', 'site_no', 'qc']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
     
-    #folium.LayerControl().add_to(m)
-    st.header(f"Gage {site_id} Location")
-    folium_static(m, width=3000, height=500)
-            
 
-def subset_by_season(df):
-    spring_dict = {}
-    summer_dict = {}
-    fall_dict = {}
-    winter_dict = {}
-    for year in df['year'].unique():
-        spring_dict[str(year)] = {}
-        summer_dict[str(year)] = {}
-        fall_dict[str(year)] = {}
-        winter_dict[str(year)] = {}
-        #subset the data for the current year
-        yearly_data = df[df['year'] == year]
-        #subset unique seasons in the yearly_data df
-        seasons_year = yearly_data['season'].unique()
-        for season in seasons_year:
-            if season == 'Spring':
-                spring_dict[str(year)] = yearly_data[yearly_data['season'] == season]['avg_flow'].values
-            elif season == 'Summer':
-                summer_dict[str(year)]= yearly_data[yearly_data['season'] == season]['avg_flow'].values
-            elif season == 'Fall':
-                fall_dict[str(year)] = yearly_data[yearly_data['season'] == season]['avg_flow'].values
-            elif season == 'Winter':
-                winter_dict[str(year)] = yearly_data[yearly_data['season'] == season]['avg_flow'].values
-            
-    #create a dataframe of the seasonal data.
-    spring_df = pd.DataFrame.from_dict(spring_dict, orient='index').reset_index()
-    spring_df.columns = ['year'] + [f'{i+1}' for i in range(spring_df.shape[1]-1)]
-    
-    summer_df = pd.DataFrame.from_dict(summer_dict, orient='index').reset_index()
-    summer_df.columns = ['year'] + [f'{i+1}' for i in range(summer_df.shape[1]-1)]
 
-    fall_df = pd.DataFrame.from_dict(fall_dict, orient='index').reset_index()
-    fall_df.columns = ['year'] + [f'{i+1}' for i in range(fall_df.shape[1]-1)]
 
-    winter_df = pd.DataFrame.from_dict(winter_dict, orient='index').reset_index()
-    winter_df.columns = ['year'] + [f'{i+1}' for i in range(winter_df.shape[1]-1)]
-    return [spring_df, summer_df, fall_df, winter_df]
+
+
+def subset_by_season(df):
+    """
+    Splits the daily flows of every calendar year by season. The days of a season are
+    numbered in the order they occur, so the Winter row of a year holds its
+    January-March flows followed by its December flows.
+    
+    Args:
+        df (pd.DataFrame): The daily flow data with 'date' and 'avg_flow' columns.
+        
+    Returns:
+        list: The Spring, Summer, Fall and Winter DataFrames, each with a 'year' column
+        and one column per day of the season ('1', '2', ...), NaN padded where a year
+        has fewer days in the season.
+    """
+    matrices = season_matrices(df['date'], df['avg_flow'])
+    season_dfs = []
+    for season in ['Spring', 'Summer', 'Fall', 'Winter']:
+        years, matrix = matrices[season]
+        season_df = pd.DataFrame(matrix, columns=[f'{i+1}' for i in range(matrix.shape[1])])
+        season_df.insert(0, 'year', years.astype(str))
+        season_dfs.append(season_df)
+    return season_dfs
 
 def plot_seasonal_data(season_df, usgs_station_id, season):
     plt.style.use(['ggplot'])
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+
+# day of the water year (October 1 = day 1) that February 29 falls on
+LEAP_DAY_OF_WATER_YEAR = 152
+
+
+def water_year_calendar(dates):
+    """
+    Derives the water year calendar of a date series with datetime64 arithmetic. The
+    water year starts on October 1 and is named after the calendar year it ends in.
+
+    Args:
+        dates (pd.Series): The datetime dates.
+
+    Returns:
+        pd.DataFrame: The 'water_year', the 'day_of_waterYear' (1 on October 1, up to 366
+        in leap water years) and the leap-aligned 'water_year_day' (1-366 where February
+        29 is always day 152, so a day index means the same calendar day in every year).
+    """
+    dates = pd.Series(dates)
+    days = dates.to_numpy().astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    calendar_year = months.astype('datetime64[Y]').astype('int64') + 1970
+    month = (months.astype('int64') % 12) + 1
+
+    water_year = calendar_year + (month >= 10)
+    # October 1 of the previous calendar year, as a month offset from the epoch
+    october_first = ((water_year - 1 - 1970) * 12 + 9).astype('datetime64[M]').astype('datetime64[D]')
+    day_of_water_year = (days - october_first).astype('int64') + 1
+
+    is_leap = (water_year % 4 == 0) & ((water_year % 100 != 0) | (water_year % 400 == 0))
+    water_year_day = day_of_water_year + ((day_of_water_year >= LEAP_DAY_OF_WATER_YEAR) & ~is_leap)
+
+    calendar = pd.DataFrame({
+        'water_year': water_year,
+        'day_of_waterYear': day_of_water_year,
+        'water_year_day': water_year_day,
+    }, index=dates.index)
+    # keep missing dates missing instead of turning NaT into nonsense day numbers
+    missing = dates.isna().to_numpy()
+    if missing.any():
+        calendar = calendar.astype('float64')
+        calendar.loc[missing, :] = np.nan
+    return calendar
@@ -0,0 +1,164 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+RETURN_PERIODS = (2, 5, 10, 25, 50, 100)
+
+FREQUENCY_DISTRIBUTIONS = ('lp3', 'gev')
+
+DISTRIBUTION_NAMES = {'lp3': 'Log-Pearson Type III', 'gev': 'Generalized Extreme Value'}
+
+BOOTSTRAP_SAMPLES = 1000
+
+# fewer annual peaks than this give return period flows too uncertain to report without a warning
+MIN_RECOMMENDED_PEAKS = 10
+
+EULER_GAMMA = 0.5772156649015329
+
+_gamma = np.vectorize(math.gamma, otypes=[float])
+
+
+def _non_exceedance(return_periods):
+    return 1 - 1 / np.asarray(return_periods, dtype=float)
+
+
+def lp3_quantiles(peaks, return_periods=RETURN_PERIODS):
+    """
+    Fits a Log-Pearson Type III distribution to the log10 of the annual peaks by the
+    method of moments, with the station skew, and returns the flows of the return
+    periods. The frequency factors come from the Wilson-Hilferty approximation.
+
+    Args:
+        peaks (np.ndarray): The annual peaks, or one sample of peaks per row.
+        return_periods (tuple, optional): The return periods in years.
+
+    Returns:
+        np.ndarray: The return period flows, one row per sample when peaks is 2-D.
+    """
+    logs = np.log10(np.asarray(peaks, dtype=float))
+    n = logs.shape[-1]
+    mean = logs.mean(axis=-1, keepdims=True)
+    std = logs.std(axis=-1, ddof=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        skew = n * ((logs - mean) ** 3).sum(axis=-1, keepdims=True) / ((n - 1) * (n - 2) * std ** 3)
+    skew = np.nan_to_num(skew)
+
+    z = np.array([NormalDist().inv_cdf(p) for p in _non_exceedance(return_periods)])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        factor = 2 / skew * ((1 + skew * z / 6 - skew ** 2 / 36) ** 3 - 1)
+    factor = np.where(np.abs(skew) < 1e-6, z, factor)
+    return 10 ** (mean + factor * std)
+
+
+def gev_quantiles(peaks, return_periods=RETURN_PERIODS):
+    """
+    Fits a Generalized Extreme Value distribution to the annual peaks by L-moments
+    (Hosking's approximation of the shape from the L-skewness) and returns the flows
+    of the return periods. A shape near zero falls back to the Gumbel distribution.
+
+    Args:
+        peaks (np.ndarray): The annual peaks, or one sample of peaks per row.
+        return_periods (tuple, optional): The return periods in years.
+
+    Returns:
+        np.ndarray: The return period flows, one row per sample when peaks is 2-D.
+    """
+    x = np.sort(np.asarray(peaks, dtype=float), axis=-1)
+    n = x.shape[-1]
+    i = np.arange(n)
+    # probability weighted moments of the ordered sample
+    b0 = x.mean(axis=-1, keepdims=True)
+    b1 = (x * i / (n - 1)).sum(axis=-1, keepdims=True) / n
+    b2 = (x * i * (i - 1) / ((n - 1) * (n - 2))).sum(axis=-1, keepdims=True) / n
+    l1, l2, l3 = b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t3 = l3 / l2
+        c = 2 / (3 + t3) - math.log(2) / math.log(3)
+        k = 7.8590 * c + 2.9554 * c ** 2
+        gumbel = np.abs(k) < 1e-6
+        k_safe = np.where(gumbel, 1.0, k)
+        alpha = np.where(gumbel, l2 / math.log(2), l2 * k_safe / ((1 - 2 ** -k_safe) * _gamma(1 + k_safe)))
+        xi = np.where(gumbel, l1 - EULER_GAMMA * alpha, l1 - alpha * (1 - _gamma(1 + k_safe)) / k_safe)
+
+        reduced = -np.log(_non_exceedance(return_periods))
+        quantiles = np.where(gumbel, xi - alpha * np.log(reduced), xi + alpha / k_safe * (1 - reduced ** k_safe))
+    return quantiles
+
+
+QUANTILE_FUNCTIONS = {'lp3': lp3_quantiles, 'gev': gev_quantiles}
+
+
+def flood_frequency(peaks, distribution='lp3', return_periods=RETURN_PERIODS, n_bootstrap=BOOTSTRAP_SAMPLES, confidence=0.9, seed=0):
+    """
+    Estimates the flows of the return periods from a series of annual peaks, with
+    bootstrap confidence limits. All bootstrap samples are drawn as one (samples x
+    years) array and fitted at once. Peaks that are zero or missing are left out,
+    since a log-based fit cannot use them.
+
+    Args:
+        peaks (array-like): The annual peak flows.
+        distribution (str, optional): One of FREQUENCY_DISTRIBUTIONS.
+        return_periods (tuple, optional): The return periods in years.
+        n_bootstrap (int, optional): The number of bootstrap samples, 0 for no confidence limits.
+        confidence (float, optional): The coverage of the confidence limits.
+        seed (int, optional): The seed of the bootstrap samples.
+
+    Returns:
+        pd.DataFrame: One row per return period with 'return_period',
+        'exceedance_probability', 'flow', 'lower' and 'upper' columns.
+    """
+    if distribution not in FREQUENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{distribution}', expected one of {FREQUENCY_DISTRIBUTIONS}")
+    peaks = np.asarray(peaks, dtype=float)
+    peaks = peaks[np.isfinite(peaks) & (peaks > 0)]
+    if len(peaks) < 3:
+        raise ValueError(f"At least 3 annual peaks are needed for a frequency analysis, got {len(peaks)}")
+    quantiles = QUANTILE_FUNCTIONS[distribution]
+
+    result = pd.DataFrame({
+        'return_period': np.asarray(return_periods),
+        'exceedance_probability': 1 / np.asarray(return_periods, dtype=float),
+        'flow': quantiles(peaks, return_periods),
+        'lower': np.nan,
+        'upper': np.nan,
+    })
+    if n_bootstrap:
+        samples = peaks[np.random.default_rng(seed).integers(0, len(peaks), size=(n_bootstrap, len(peaks)))]
+        estimates = quantiles(samples, return_periods)
+        tail = (1 - confidence) / 2 * 100
+        result['lower'], result['upper'] = np.nanpercentile(estimates, [tail, 100 - tail], axis=0)
+    return result
+
+
+def peak_plotting_positions(peaks):
+    """
+    Returns the observed annual peaks with their Weibull return periods, for plotting
+    against the fitted curves.
+
+    Returns:
+        pd.DataFrame: 'avg_flow', 'exceedance_probability' and 'return_period' columns from the largest peak down.
+    """
+    peaks = np.sort(np.asarray(peaks, dtype=float)[np.isfinite(peaks)])[::-1]
+    probability = np.arange(1, len(peaks) + 1) / (len(peaks) + 1)
+    return pd.DataFrame({'avg_flow': peaks, 'exceedance_probability': probability, 'return_period': 1 / probability})
+
+
+def complete_year_peaks(df, annual_peaks, min_days=330):
+    """
+    Keeps the annual peaks of the years with enough days of record, so partial first
+    and last years do not add artificially low peaks to the frequency analysis.
+
+    Args:
+        df (pd.DataFrame): The daily flow data with 'year' and 'avg_flow' columns.
+        annual_peaks (pd.DataFrame): The annual peaks from annual_peak_summary.
+        min_days (int, optional): The fewest days with flow a year needs.
+
+    Returns:
+        pd.DataFrame: The annual peaks of the complete years.
+    """
+    days = df.groupby('year')['avg_flow'].count()
+    complete = days.index[days >= min_days]
+    return annual_peaks[annual_peaks['date'].dt.year.isin(complete)]
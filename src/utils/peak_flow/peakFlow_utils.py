@@ -1,10 +1,21 @@
 
+import warnings
+
+import numpy as np
 import pandas as pd
-import streamlit as st
 
-from utils.common_utils.utils import load_flow_data, clean_temp_files,create_location_plot,manual_upload_daily_flow_data, water_year_flows, return_waterYr_dict, clean_manual_date_column
-from utils.common_utils.data_processing import download_usgs_data
+from utils.common_utils.utils import load_site_flow_data, manual_upload_daily_flow_data, water_year_flows, return_waterYr_dict, clean_manual_date_column
+from utils.common_utils.messages import report_status
+from utils.common_utils.threshold_stats import yearly_threshold_stats
+from utils.common_utils.memo import memoize
+from utils.common_utils.instrumentation import stage
+from utils.common_utils.flow_matrix import water_year_matrix
+
+
+ENVELOPE_PERCENTILES = (10, 25, 50, 75, 90)
 
+# October 1 of a leap water year, so every leap-aligned day of the water year has a date to plot on
+ENVELOPE_WATER_YEAR_START = np.datetime64('1999-10-01')
 
 
 def subset_flow_above_threshold(df, pf_threshold=200):
@@ -19,36 +30,36 @@ def subset_flow_above_threshold(df, pf_threshold=200):
         pd.DataFrame: A DataFrame with dates when flow is above the threshold.
     """
     if df is not None:
-        above_threshold = df[df['avg_flow'] > pf_threshold]
+        above = df['avg_flow'] > pf_threshold
+        if 'valid' in df.columns:
+            above &= df['valid']
+        above_threshold = df[above]
         return above_threshold[['date','year','month','day', 'avg_flow']]
     else:
         return pd.DataFrame(columns=['date', 'avg_flow'])
     
 
 def yearly_flow_analysis(above_thresh_df):
-
-    years  = above_thresh_df['year'].unique()
-    yearly_analysis = {}
-    i = 0
-    for year in years:
-        yearly_data = above_thresh_df[above_thresh_df['year'] == year]
-        if not yearly_data.empty:
-            yearly_analysis[str(year)] = {
-                'total_days_above_threshold': len(yearly_data),
-                'years_after_previous': year - years[i-1] if i > 0 else 0,
-                'average_flow': yearly_data['avg_flow'].mean(),
-                'max_flow': yearly_data['avg_flow'].max(),
-                'min_flow': yearly_data['avg_flow'].min()
-            }
-            i += 1
-    return yearly_analysis
+    """
+    Summarizes the days above the threshold by year.
+    
+    Args:
+        above_thresh_df (pd.DataFrame): The days with flow above the threshold.
+        
+    Returns:
+        pd.DataFrame: One row per year with the total days above the threshold, the years
+        after the previous year above the threshold and the average, max and min flow.
+    """
+    return yearly_threshold_stats(above_thresh_df, 'total_days_above_threshold')
 
 def annual_peak_summary(df):
     #generate a dictionary with the number of the month as the key and the month name as the value
     months_dict =return_waterYr_dict()
 
     if df is not None:
-        annual_peaks = df.loc[df.groupby('year')['avg_flow'].idxmax()]
+        #years without any usable flow (inside a long gap) have no peak
+        flows = df['avg_flow'][df['valid']] if 'valid' in df.columns else df['avg_flow'].dropna()
+        annual_peaks = df.loc[flows.groupby(df['year']).idxmax()]
         annual_peaks['month_label'] = annual_peaks['month'].map(months_dict)
         annual_peaks['day'] = annual_peaks['date'].dt.strftime('%d')
         annual_peaks = annual_peaks.sort_values(by='date')
@@ -59,20 +70,86 @@ def annual_peak_summary(df):
     
 
 
-def generate_summary_df(yearly_analysis, pf_threshold):
+def water_year_envelope(water_year_df, first_water_year=None, highlight_years=(), percentiles=ENVELOPE_PERCENTILES):
+    """
+    Summarizes the flows of every day of the water year across all water years: the
+    min, the percentiles and the max, computed at once over the water year x day matrix.
+    
+    Args:
+        water_year_df (pd.DataFrame): The daily flow data with 'date' and 'avg_flow' columns.
+        first_water_year (int, optional): Water years before this one are left out.
+        highlight_years (iterable, optional): Water years whose daily flows are returned for plotting over the envelope.
+        percentiles (tuple, optional): The percentiles of the envelope.
+        
+    Returns:
+        tuple: The envelope, one row per day of the water year with 'water_year_day',
+        'plot_date' (the day in a leap water year), 'years', 'min', 'p<percentile>' and
+        'max' columns, and the highlighted years with 'water_year', 'plot_date' and 'avg_flow' columns.
+    """
+    years, matrix = water_year_matrix(water_year_df['date'], water_year_df['avg_flow'])
+    if first_water_year is not None:
+        matrix = matrix[years >= int(first_water_year)]
+        years = years[years >= int(first_water_year)]
+    plot_dates = ENVELOPE_WATER_YEAR_START + np.arange(matrix.shape[1]).astype('timedelta64[D]')
+    
+    envelope = pd.DataFrame({
+        'water_year_day': np.arange(1, matrix.shape[1] + 1),
+        'plot_date': plot_dates.astype('datetime64[ns]'),
+        'years': (~np.isnan(matrix)).sum(axis=0),
+    })
+    with warnings.catch_warnings():
+        #days without any flow (Feb 29 in short records) are dropped below
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        envelope['min'] = np.nanmin(matrix, axis=0, initial=np.inf, where=~np.isnan(matrix))
+        stats = np.nanpercentile(matrix, percentiles, axis=0)
+        envelope['max'] = np.nanmax(matrix, axis=0, initial=-np.inf, where=~np.isnan(matrix))
+    for percentile, values in zip(percentiles, stats):
+        envelope[f'p{percentile}'] = values
+    envelope = envelope[envelope['years'] > 0].reset_index(drop=True)
+    envelope = envelope[['water_year_day', 'plot_date', 'years', 'min'] + [f'p{p}' for p in percentiles] + ['max']]
+    
+    rows = np.flatnonzero(np.isin(years, list(highlight_years)))
+    highlighted = pd.DataFrame({
+        'water_year': np.repeat(years[rows], matrix.shape[1]),
+        'plot_date': np.tile(plot_dates.astype('datetime64[ns]'), len(rows)),
+        'avg_flow': matrix[rows].ravel(),
+    }).dropna(subset=['avg_flow'])
+    return envelope, highlighted
+
 
-    summary_dict = {}
-    for year, analysis in yearly_analysis.items():
-        summary_dict[year] = {}
-        summary_dict[year][f"Total Days Above {pf_threshold} cfs"] = analysis['total_days_above_threshold']
-        summary_dict[year]["Years After Previous"] = analysis['years_after_previous']
-        summary_dict[year][f"Average Flow Above {pf_threshold} cfs"] = analysis['average_flow']
-        summary_dict[year]["Max Flow"] = analysis['max_flow']
-        summary_dict[year][f"Min Flow Above {pf_threshold} cfs"] = analysis['min_flow']
+def generate_summary_df(yearly_analysis, pf_threshold):
 
-    summary_df = pd.DataFrame.from_dict(summary_dict, orient='index')
+    summary_df = yearly_analysis.rename(columns={
+        'total_days_above_threshold': f"Total Days Above {pf_threshold} cfs",
+        'years_after_previous': "Years After Previous",
+        'average_flow': f"Average Flow Above {pf_threshold} cfs",
+        'max_flow': "Max Flow",
+        'min_flow': f"Min Flow Above {pf_threshold} cfs",
+    })
     return summary_df
     
+def peak_flow_analysis(df, pf_threshold=200):
+    """
+    Runs the peak flow analysis on loaded daily flow data.
+    
+    Args:
+        df (pd.DataFrame): The daily flow data.
+        pf_threshold (float): The flow threshold to check against.
+        
+    Returns:
+        tuple: above_thresh_df, yearly_analysis, annual_peaks, months_dict and water_year_df.
+    """
+    with stage("subset_flow_above_threshold", rows=len(df)):
+        above_thresh_df = subset_flow_above_threshold(df, pf_threshold)
+    with stage("yearly_flow_analysis", rows=len(above_thresh_df)):
+        yearly_analysis = yearly_flow_analysis(above_thresh_df)
+    with stage("annual_peak_summary", rows=len(df)):
+        annual_peaks,months_dict = annual_peak_summary(df)
+    with stage("water_year_flows", rows=len(df)):
+        water_year_df = water_year_flows(df)
+    return above_thresh_df, yearly_analysis, annual_peaks, months_dict, water_year_df
+
+@memoize(ignore=('uploaded_file',))
 def peakFlow_main(date_col, flow_col,usgs_station_id = None, begin_year="2015",end_year = "2025", pf_threshold = 200,upload_type= "downloaded",uploaded_file=None, data = None):
     """
     Main function to download and load peak flow data.
@@ -80,38 +157,17 @@ def peakFlow_main(date_col, flow_col,usgs_station_id = None, begin_year="2015",e
     Args:
         url (str): The URL to download the peak flow data from.
     """
-    info_path = None
     if upload_type == "downloaded":
-        st.write("Downloading data from USGS...")
-        file_path, info_path = download_usgs_data(usgs_station_id, begin_year)
-        df = load_flow_data(file_path)
-        create_location_plot(info_path, usgs_station_id)
-        if df is not None:
-            above_thresh_df = subset_flow_above_threshold(df, pf_threshold)
-            yearly_analysis = yearly_flow_analysis(above_thresh_df)
-            annual_peaks,months_dict = annual_peak_summary(df)
-            water_year_df = water_year_flows(df)
-            
-            clean_temp_files(file_path, info_path)
-            return df, above_thresh_df, yearly_analysis,usgs_station_id,annual_peaks,months_dict,water_year_df
+        report_status("Loading data from USGS...")
+        df = load_site_flow_data(usgs_station_id, begin_year)
     elif upload_type == "uploaded":
-       
         df= manual_upload_daily_flow_data(data, date_col, flow_col)
+    else:
+        df = None
         
-        
-        if df is not None:
-            
-            above_thresh_df = subset_flow_above_threshold(df, pf_threshold)
-            yearly_analysis = yearly_flow_analysis(above_thresh_df)
-            annual_peaks,months_dict = annual_peak_summary(df)
-            water_year_df = water_year_flows(df)
-            
-            #clean_temp_files(file_path)
-            return df, above_thresh_df, yearly_analysis,usgs_station_id,annual_peaks,months_dict,water_year_df
-            
-        else:
-            st.write("No data available for the specified parameters. Please check the USGS Station ID including any leading zero's.")
-            
-   
-        
-
+    if df is not None:
+        with stage("peak_flow_analysis", rows=len(df)):
+            above_thresh_df, yearly_analysis, annual_peaks, months_dict, water_year_df = peak_flow_analysis(df, pf_threshold)
+        return df, above_thresh_df, yearly_analysis,usgs_station_id,annual_peaks,months_dict,water_year_df
+    elif upload_type == "uploaded":
+        report_status("No data available for the specified parameters. Please check the USGS Station ID including any leading zero's.")
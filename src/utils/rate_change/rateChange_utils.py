@@ -1,17 +1,42 @@
 
+import numpy as np
 import pandas as pd
-import streamlit as st
 
-from utils.common_utils.utils import download_usgs_data, load_flow_data, clean_temp_files, create_location_plot, manual_upload_daily_flow_data
+from utils.common_utils.utils import load_site_flow_data, manual_upload_daily_flow_data
+from utils.common_utils.messages import report_error
+from utils.common_utils.memo import memoize
+from utils.common_utils.instrumentation import stage
+from utils.common_utils.water_year import water_year_calendar
+from utils.common_utils.flow_matrix import flow_matrix, DAYS_IN_YEAR
 
 
+# rate of change outliers are assessed between August 1 and October 31
+OUTLIER_MONTHS = (8, 9, 10)
 
+# days before and after an outlier that make up its context window
+EVENT_WINDOW_DAYS = 15
+
+# 'global' compares every day with the median and standard deviation of the whole
+# record, 'rolling' with the median and MAD of the surrounding days and 'seasonal'
+# with the median and MAD of the same days of the year across all years
+OUTLIER_METHODS = ('global', 'rolling', 'seasonal')
+
+# days in the window of the rolling and seasonal statistics
+OUTLIER_WINDOW_DAYS = 31
+
+# scale the median and the mean absolute deviation to a standard deviation for normal data
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
 
 
 def calculate_flow_dirivatives(df):
     """
     Calculates the daily flow derivatives (change in flow) for the given DataFrame.
     
+    A derivative is only calculated between two consecutive days that both have a
+    usable flow (the 'valid' column, when present). Across a gap in the record, an
+    ice-affected day or the first day it is NaN instead of a multi-day change.
+    
     Args:
         df (pd.DataFrame): The DataFrame containing peak flow data with 'date' and 'avg_flow' columns.
         
@@ -19,62 +44,248 @@ def calculate_flow_dirivatives(df):
         pd.DataFrame: A DataFrame with the original data and an additional column for flow derivatives.
     """
     if df is not None and 'avg_flow' in df.columns:
-        df['flow_derivative'] = df['avg_flow'].diff().fillna(0)
+        flow = df['avg_flow'].to_numpy(dtype=float)
+        if 'valid' in df.columns:
+            flow = np.where(df['valid'].to_numpy(dtype=bool), flow, np.nan)
+        derivative = np.diff(flow, prepend=np.nan)
+        if 'date' in df.columns and len(df) > 1:
+            days = df['date'].to_numpy(dtype='datetime64[D]')
+            derivative[1:][np.diff(days) != np.timedelta64(1, 'D')] = np.nan
+        df['flow_derivative'] = derivative
         return df
     else:
-        st.error("DataFrame is empty or does not contain 'avg_flow' column.")
+        report_error("DataFrame is empty or does not contain 'avg_flow' column.")
         return pd.DataFrame(columns=['date', 'avg_flow', 'flow_derivative'])
 
-def identify_derivative_outliers(df):
+def _robust_scale(mad, mean_ad):
+    # the MAD is zero when most days have the same derivative (such as long runs of
+    # unchanged low flow), so the mean absolute deviation is used there instead
+    return np.where(mad > 0, MAD_SCALE * mad, MEAN_AD_SCALE * mean_ad)
+
+
+def _rolling_robust_stats(dates, values, window_days):
+    """
+    Centered rolling median and robust scale over a window of window_days calendar
+    days. The MAD is the rolling median of the absolute deviations from each day's
+    rolling median, which keeps both passes at O(n log w).
+    """
+    series = pd.Series(values, index=pd.DatetimeIndex(dates))
+    window = f"{window_days}D"
+    center = series.rolling(window, center=True, min_periods=1).median()
+    deviation = (series - center).abs().rolling(window, center=True, min_periods=1)
+    return center.to_numpy(), _robust_scale(deviation.median().to_numpy(), deviation.mean().to_numpy())
+
+
+def _seasonal_robust_stats(dates, values, window_days):
+    """
+    Median and MAD of every day of the year, pooled over all years and the days
+    within window_days around it. Days of the year are leap aligned, so a day index
+    is the same calendar day in every year.
+    """
+    calendar = water_year_calendar(pd.Series(dates))
+    day = calendar['water_year_day'].to_numpy(dtype='int64') - 1
+    _, matrix = flow_matrix(calendar['water_year'].to_numpy(dtype='int64'), day, values, DAYS_IN_YEAR)
+
+    half = window_days // 2
+    padded = np.concatenate((matrix[:, DAYS_IN_YEAR - half:], matrix, matrix[:, :half]), axis=1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1, axis=1)
+    # only the days of the year that occur in the data are evaluated
+    needed, inverse = np.unique(day, return_inverse=True)
+    pooled = windows[:, needed, :].transpose(1, 0, 2).reshape(len(needed), -1)
+    center = np.nanmedian(pooled, axis=1)
+    deviation = np.abs(pooled - center[:, None])
+    scale = _robust_scale(np.nanmedian(deviation, axis=1), np.nanmean(deviation, axis=1))
+    return center[inverse], scale[inverse]
+
+
+def identify_derivative_outliers(df, method='global', window_days=OUTLIER_WINDOW_DAYS, months=None, n_sigma=3):
     """
     Identifies outliers in the flow derivatives based on statistical desiciptors of flow data.
     
+    With the 'global' method a derivative is an outlier when it is more than n_sigma
+    standard deviations from the median of the whole record. The 'rolling' and
+    'seasonal' methods use robust local statistics instead, the median and the scaled
+    median absolute deviation (MAD) of the surrounding days or of the same days of the
+    year across all years. Where the MAD is zero the scaled mean absolute deviation
+    is used instead.
+    
     Args:
         df (pd.DataFrame): The DataFrame containing flow derivatives.
+        method (str, optional): One of OUTLIER_METHODS.
+        window_days (int, optional): Days in the rolling or seasonal window.
+        months (tuple, optional): Only days in these months are assessed, and the
+            statistics are computed from them alone. All days when None.
+        n_sigma (float, optional): The number of standard deviations that makes an outlier.
         
     Returns:
         pd.DataFrame: A DataFrame with an additional column indicating outliers.
     """
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"method must be one of {OUTLIER_METHODS}")
     if 'flow_derivative' in df.columns:
-        #calculate median and standard deviation of flow derivatives
-        median = df['flow_derivative'].median()
-        std_dev = df['flow_derivative'].std()
-        # Identify outliers as those that are more than 3 standard deviations from the median
-        df['is_outlier'] = (df['flow_derivative'] > median + 3 * std_dev) | (df['flow_derivative'] < median - 3 * std_dev)
-        # Fill NaN values in 'is_outlier' with False
-        df['is_outlier'].fillna(False, inplace=True)
+        assessed = df['date'].dt.month.isin(months).to_numpy() if months is not None else np.ones(len(df), dtype=bool)
+        derivative = df['flow_derivative'].to_numpy(dtype=float)[assessed]
+        if method == 'global':
+            #calculate median and standard deviation of flow derivatives
+            #days across gaps have no derivative
+            known = derivative[~np.isnan(derivative)]
+            center = np.median(known) if len(known) else np.nan
+            scale = np.std(known, ddof=1) if len(known) > 1 else np.nan
+        elif not assessed.any():
+            center = scale = np.empty(0)
+        else:
+            dates = df['date'].to_numpy()[assessed]
+            order = np.argsort(dates, kind='stable')
+            stats = _rolling_robust_stats if method == 'rolling' else _seasonal_robust_stats
+            sorted_center, sorted_scale = stats(dates[order], derivative[order], window_days)
+            center, scale = np.empty(len(order)), np.empty(len(order))
+            center[order], scale[order] = sorted_center, sorted_scale
+        # Identify outliers as those that are more than n_sigma deviations from the median
+        is_outlier = np.zeros(len(df), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            is_outlier[assessed] = (derivative > center + n_sigma * scale) | (derivative < center - n_sigma * scale)
+        df['is_outlier'] = is_outlier
        
         # Return the DataFrame with the outlier information
         return df
     else:
-        st.error("DataFrame does not contain 'flow_derivative' column.")
+        report_error("DataFrame does not contain 'flow_derivative' column.")
         return pd.DataFrame(columns=['date', 'avg_flow', 'flow_derivative', 'is_outlier'])
 
-def rate_change_main(usgs_station_id, begin_year,data,date_col, flow_col, upload_type):
+def rate_change_analysis(df, outlier_method='global', window_days=OUTLIER_WINDOW_DAYS):
+    """
+    Calculates the flow derivatives and flags their outliers on loaded daily flow data.
+    The global method uses the statistics of the whole record, the rolling and
+    seasonal methods only score the assessment season (OUTLIER_MONTHS).
+    
+    Args:
+        df (pd.DataFrame): The daily flow data.
+        outlier_method (str, optional): One of OUTLIER_METHODS.
+        window_days (int, optional): Days in the rolling or seasonal window.
+        
+    Returns:
+        pd.DataFrame: A DataFrame containing the rate change data with derivatives calculated.
+    """
+    with stage("calculate_flow_dirivatives", rows=None if df is None else len(df)):
+        df = calculate_flow_dirivatives(df)
+    months = None if outlier_method == 'global' else OUTLIER_MONTHS
+    with stage(f"identify_derivative_outliers ({outlier_method})", rows=len(df)):
+        df = identify_derivative_outliers(df, outlier_method, window_days, months)
+    return df
+
+class RateChangeEvents:
+    """
+    The outlier events of a rate of change analysis. The events table has one row per
+    event with its date, flow, derivative and the mean rate of change in the days
+    before and after it. The daily data around each event is sliced from the
+    date-sorted assessment frame only when it is asked for.
+    """
+
+    def __init__(self, frame, events, bounds):
+        self.frame = frame
+        self.events = events
+        self._bounds = bounds
+
+    def __len__(self):
+        return len(self.events)
+
+    def window(self, i):
+        """
+        Returns the daily data within the window of the i-th event, the event included.
+        """
+        start, _, _, stop = self._bounds[i]
+        return self.frame.iloc[start:stop]
+
+    def before(self, i):
+        """
+        Returns the daily data within the window before the i-th event.
+        """
+        start, at, _, _ = self._bounds[i]
+        return self.frame.iloc[start:at]
+
+    def after(self, i):
+        """
+        Returns the daily data within the window after the i-th event.
+        """
+        _, _, after, stop = self._bounds[i]
+        return self.frame.iloc[after:stop]
+
+
+def rate_change_events(df, number_outliers=None, window_days=EVENT_WINDOW_DAYS, months=OUTLIER_MONTHS):
+    """
+    Finds the largest rate of change outliers and the statistics of the days around
+    them in one vectorized pass. The window bounds of all events are found with a
+    binary search on the sorted dates, and the mean rate of change before and after
+    each event is read off a cumulative sum, so the cost barely grows with the number
+    of events.
+
+    Args:
+        df (pd.DataFrame): The rate of change data with 'date', 'avg_flow', 'flow_derivative' and 'is_outlier' columns.
+        number_outliers (int, optional): The number of largest outliers to keep, all outliers when None.
+        window_days (int, optional): The days before and after an event that make up its window.
+        months (tuple, optional): The months in which outliers and their windows are assessed.
+
+    Returns:
+        RateChangeEvents: The events table, ordered from the largest derivative down,
+        and the window slices of every event.
+    """
+    frame = df[df['date'].dt.month.isin(months)].sort_values('date', kind='stable').reset_index(drop=True)
+    outliers = frame[frame['is_outlier']]
+    if number_outliers is not None:
+        outliers = outliers.nlargest(number_outliers, 'flow_derivative')
+    else:
+        outliers = outliers.sort_values('flow_derivative', ascending=False, kind='stable')
+    positions = outliers.index.to_numpy()
+
+    dates = frame['date'].to_numpy(dtype='datetime64[ns]')
+    event_dates = dates[positions]
+    window = np.timedelta64(window_days, 'D')
+    start = np.searchsorted(dates, event_dates - window, side='left')
+    at = np.searchsorted(dates, event_dates, side='left')
+    after = np.searchsorted(dates, event_dates, side='right')
+    stop = np.searchsorted(dates, event_dates + window, side='right')
+
+    derivative = frame['flow_derivative'].to_numpy(dtype=float)
+    valid = ~np.isnan(derivative)
+    totals = np.concatenate(([0.0], np.cumsum(np.where(valid, derivative, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    days_before = counts[at] - counts[start]
+    days_after = counts[stop] - counts[after]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_before = np.where(days_before > 0, (totals[at] - totals[start]) / days_before, np.nan)
+        avg_after = np.where(days_after > 0, (totals[stop] - totals[after]) / days_after, np.nan)
+
+    events = pd.DataFrame({
+        'date': event_dates,
+        'avg_flow': frame['avg_flow'].to_numpy()[positions],
+        'flow_derivative': derivative[positions],
+        'avg_rate_before': avg_before,
+        'avg_rate_after': avg_after,
+        'days_before': days_before,
+        'days_after': days_after,
+    })
+    return RateChangeEvents(frame, events, np.column_stack((start, at, after, stop)))
+
+
+@memoize()
+def rate_change_main(usgs_station_id, begin_year,data,date_col, flow_col, upload_type, outlier_method='global', window_days=OUTLIER_WINDOW_DAYS):
     """
     Main function to download and load rate change data.
     
     Args:
         usgs_station_id (str): The USGS station ID.
         begin_year (str): The year to start downloading data from.
+        outlier_method (str, optional): One of OUTLIER_METHODS.
+        window_days (int, optional): Days in the rolling or seasonal window.
         
     Returns:
         pd.DataFrame: A DataFrame containing the rate change data with derivatives calculated.
     """
-    file_path, info_path = download_usgs_data(usgs_station_id, begin_year)
-
-    if file_path and upload_type == "downloaded":
-        create_location_plot(info_path, usgs_station_id)
-        
-        df = load_flow_data(file_path)
-        df = calculate_flow_dirivatives(df)
-        df = identify_derivative_outliers(df)
-        clean_temp_files(file_path, info_path)
-        return df
+    if upload_type == "downloaded":
+        df = load_site_flow_data(usgs_station_id, begin_year)
+        return rate_change_analysis(df, outlier_method, window_days)
     elif upload_type == "uploaded":
         df = manual_upload_daily_flow_data(data, date_col, flow_col)
-        df = calculate_flow_dirivatives(df)
-        df = identify_derivative_outliers(df)
-        return df
+        return rate_change_analysis(df, outlier_method, window_days)
     else:
-        return pd.DataFrame(columns=['date', 'avg_flow', 'flow_derivative'])  # Return empty DataFrame if download fails
\ No newline at end of file
+        return pd.DataFrame(columns=['date', 'avg_flow', 'flow_derivative'])  # Return empty DataFrame if download fails